@@ -1,5 +1,8 @@
+-- Lets the app load hot indexes into shared buffers when it starts.
+CREATE EXTENSION IF NOT EXISTS pg_prewarm;
+
 CREATE TABLE service_requests (
-    unique_key BIGINT PRIMARY KEY,
+    unique_key BIGINT NOT NULL,
     created_date TIMESTAMP NOT NULL,
     closed_date TIMESTAMP,
     agency VARCHAR(10) NOT NULL,
@@ -52,23 +55,48 @@ CREATE TABLE service_requests (
     latitude NUMERIC(18, 15),
     longitude NUMERIC(18, 15),
     location VARCHAR(50)
-);
-
-CREATE INDEX idx_service_requests_created_date ON service_requests(created_date);
+) PARTITION BY RANGE (created_date);
 
-CREATE INDEX idx_service_requests_closed_date ON service_requests(closed_date);
+-- One partition per year keeps date-range scans to the years they touch.
+-- Rows outside the covered years land in the default partition.
+DO $$
+BEGIN
+    FOR year IN 2010..2030 LOOP
+        EXECUTE format(
+            'CREATE TABLE service_requests_%s PARTITION OF service_requests FOR VALUES FROM (%L) TO (%L)',
+            year,
+            make_date(year, 1, 1),
+            make_date(year + 1, 1, 1)
+        );
+    END LOOP;
+END $$;
 
-CREATE INDEX idx_service_requests_agency ON service_requests(agency);
+CREATE TABLE service_requests_default PARTITION OF service_requests DEFAULT;
 
-CREATE INDEX idx_service_requests_complaint_type ON service_requests(complaint_type);
+-- The primary key and indexes are built by 02-import-data.sh after the
+-- initial load, which is much faster than maintaining them row by row.
 
-CREATE INDEX idx_service_requests_agency_complaint ON service_requests(agency, complaint_type);
-
-CREATE INDEX idx_service_requests_borough ON service_requests(borough);
+-- One row per import. version is the data version caches compare against,
+-- and max_created_date is the newest request seen so far.
+CREATE TABLE IF NOT EXISTS data_imports (
+    version BIGSERIAL PRIMARY KEY,
+    source TEXT NOT NULL,
+    started_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    finished_at TIMESTAMPTZ,
+    rows_read BIGINT NOT NULL DEFAULT 0,
+    rows_inserted BIGINT NOT NULL DEFAULT 0,
+    rows_updated BIGINT NOT NULL DEFAULT 0,
+    max_created_date TIMESTAMP
+);
 
-CREATE INDEX idx_service_requests_coordinates ON service_requests(latitude, longitude)
-WHERE
-    latitude IS NOT NULL
-    AND longitude IS NOT NULL;
+-- First questions of conversations that got an answer. The precomputed
+-- answer cache reads the most frequent recent ones; normalized is the
+-- question cache's normalized text, so rewordings count together.
+CREATE TABLE IF NOT EXISTS question_log (
+    id BIGSERIAL PRIMARY KEY,
+    asked_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    question TEXT NOT NULL,
+    normalized TEXT NOT NULL
+);
 
-CREATE INDEX idx_service_requests_status ON service_requests(STATUS);
+CREATE INDEX IF NOT EXISTS idx_question_log_asked_at ON question_log (asked_at);
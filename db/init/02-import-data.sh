@@ -2,6 +2,162 @@
 
 set -e
 
+CSV_PATH="${CSV_PATH:-/data/311_Service_Requests_from_2010_to_Present.csv}"
+IMPORT_WORKERS="${IMPORT_WORKERS:-$(nproc)}"
+IMPORT_CHUNK_ROWS="${IMPORT_CHUNK_ROWS:-250000}"
+
+COLUMNS="unique_key, created_date, closed_date, agency, agency_name, complaint_type,
+    descriptor, location_type, incident_zip, incident_address, street_name,
+    cross_street_1, cross_street_2, intersection_street_1, intersection_street_2,
+    address_type, city, landmark, facility_type, status, due_date,
+    resolution_description, resolution_action_updated_date, community_board,
+    borough, x_coordinate, y_coordinate, park_facility_name, park_borough,
+    school_name, school_number, school_region, school_code, school_phone_number,
+    school_address, school_city, school_state, school_zip, school_not_found,
+    school_or_citywide_complaint, vehicle_type, taxi_company_borough,
+    taxi_pick_up_location, bridge_highway_name, bridge_highway_direction,
+    road_ramp, bridge_highway_segment, garage_lot_name, ferry_direction,
+    ferry_terminal_name, latitude, longitude, location"
+
+STAGES=()
+TIMINGS=()
+
+# Runs a stage and records its wall-clock duration for the final report.
+run_stage() {
+    local name="$1"
+    shift
+
+    echo "=== $name ==="
+
+    local start="$EPOCHREALTIME"
+    "$@"
+    local end="$EPOCHREALTIME"
+
+    STAGES+=("$name")
+    TIMINGS+=("$(awk -v s="$start" -v e="$end" 'BEGIN { printf "%.2f", e - s }')")
+}
+
+split_csv() {
+    # A record ends at a newline only once its double quotes are balanced, so
+    # quoted fields containing newlines stay in one chunk. Records are grouped
+    # by created_date year, then cut into chunks of IMPORT_CHUNK_ROWS, so each
+    # COPY mostly feeds a single partition.
+    tail -n +2 "$CSV_PATH" | awk -v dir="$CHUNK_DIR" -v chunk_rows="$IMPORT_CHUNK_ROWS" '
+        {
+            record = (pending == "") ? $0 : pending "\n" $0
+            quotes += gsub(/"/, "\"")
+
+            if (quotes % 2 == 1) {
+                pending = record
+                next
+            }
+
+            split(record, fields, ",")
+            gsub(/"/, "", fields[2])
+            n = split(fields[2], parts, /[^0-9]/)
+            year = "unknown"
+
+            for (i = 1; i <= n; i++) {
+                if (length(parts[i]) == 4) {
+                    year = parts[i]
+                    break
+                }
+            }
+
+            chunk = dir "/" year "_" int(rows[year] / chunk_rows) ".csv"
+            rows[year]++
+            print record > chunk
+
+            if (!(chunk in open_chunks)) {
+                open_chunks[chunk] = 1
+                chunk_count++
+            }
+
+            pending = ""
+            quotes = 0
+        }
+        END {
+            if (pending != "") {
+                print "Unterminated quoted field at end of file" > "/dev/stderr"
+                exit 1
+            }
+
+            print "Split into " chunk_count " chunks"
+        }
+    '
+}
+
+copy_chunk() {
+    psql -v ON_ERROR_STOP=1 -q -U "$POSTGRES_USER" -d "$POSTGRES_DB" \
+        -c "\copy service_requests ($(echo $COLUMNS)) FROM '$1' WITH (FORMAT CSV, NULL '', ENCODING 'UTF8')"
+}
+
+copy_chunks() {
+    local pids=()
+    local failed=0
+
+    echo "Loading with $IMPORT_WORKERS parallel COPY sessions"
+
+    for chunk in "$CHUNK_DIR"/*.csv; do
+        while [ "$(jobs -rp | wc -l)" -ge "$IMPORT_WORKERS" ]; do
+            wait -n || failed=1
+        done
+
+        copy_chunk "$chunk" &
+        pids+=("$!")
+    done
+
+    for pid in "${pids[@]}"; do
+        wait "$pid" || failed=1
+    done
+
+    if [ "$failed" -ne 0 ]; then
+        echo "At least one COPY session failed"
+        return 1
+    fi
+}
+
+build_indexes() {
+    psql -v ON_ERROR_STOP=1 -U "$POSTGRES_USER" -d "$POSTGRES_DB" << 'EOF'
+SET maintenance_work_mem = '512MB';
+SET max_parallel_maintenance_workers = 4;
+
+-- Partitioned tables need the partition key in every unique constraint.
+ALTER TABLE service_requests ADD PRIMARY KEY (unique_key, created_date);
+
+-- BRIN indexes stay tiny; extracts are exported in created_date order and each
+-- chunk is copied sequentially, so block ranges correlate with time.
+CREATE INDEX idx_service_requests_created_date ON service_requests USING BRIN (created_date) WITH (pages_per_range = 32);
+
+CREATE INDEX idx_service_requests_closed_date ON service_requests USING BRIN (closed_date) WITH (pages_per_range = 32);
+
+CREATE INDEX idx_service_requests_agency ON service_requests(agency);
+
+CREATE INDEX idx_service_requests_complaint_type ON service_requests(complaint_type);
+
+CREATE INDEX idx_service_requests_agency_complaint ON service_requests(agency, complaint_type);
+
+CREATE INDEX idx_service_requests_borough ON service_requests(borough);
+
+CREATE INDEX idx_service_requests_coordinates ON service_requests(latitude, longitude)
+WHERE
+    latitude IS NOT NULL
+    AND longitude IS NOT NULL;
+
+CREATE INDEX idx_service_requests_status ON service_requests(STATUS);
+EOF
+}
+
+analyze_table() {
+    psql -v ON_ERROR_STOP=1 -q -U "$POSTGRES_USER" -d "$POSTGRES_DB" -c "ANALYZE service_requests;"
+}
+
+record_import() {
+    psql -v ON_ERROR_STOP=1 -q -U "$POSTGRES_USER" -d "$POSTGRES_DB" -c "
+        INSERT INTO data_imports (source, finished_at, rows_read, rows_inserted, max_created_date)
+        SELECT '$CSV_PATH', now(), COUNT(*), COUNT(*), MAX(created_date) FROM service_requests;"
+}
+
 echo "=== Checking if CSV data needs to be imported ==="
 
 until pg_isready -U "$POSTGRES_USER" -d "$POSTGRES_DB"; do
@@ -16,40 +172,26 @@ echo "Current row count in service_requests table: $ROW_COUNT"
 
 if [ "$ROW_COUNT" -gt "0" ]; then
     echo "Data already exists in the database. Skipping CSV import."
-    echo "To re-import data, delete the postgres_data volume and restart:"
-    echo "  docker-compose down -v"
-    echo "  docker-compose up -d"
+    echo "To load new or changed rows, run the incremental ingestion:"
+    echo "  docker-compose exec api uv run python src/ingest.py $CSV_PATH"
     exit 0
 fi
 
 echo "=== Importing CSV data into PostgreSQL ==="
-echo "This may take a few minutes for 364,559 rows..."
-
-psql -U "$POSTGRES_USER" -d "$POSTGRES_DB" << 'EOF'
--- Import CSV data using COPY
--- The CSV has headers, so we skip the first line
-COPY service_requests (
-    unique_key, created_date, closed_date, agency, agency_name, complaint_type, 
-    descriptor, location_type, incident_zip, incident_address, street_name, 
-    cross_street_1, cross_street_2, intersection_street_1, intersection_street_2, 
-    address_type, city, landmark, facility_type, status, due_date, 
-    resolution_description, resolution_action_updated_date, community_board, 
-    borough, x_coordinate, y_coordinate, park_facility_name, park_borough, 
-    school_name, school_number, school_region, school_code, school_phone_number, 
-    school_address, school_city, school_state, school_zip, school_not_found, 
-    school_or_citywide_complaint, vehicle_type, taxi_company_borough, 
-    taxi_pick_up_location, bridge_highway_name, bridge_highway_direction, 
-    road_ramp, bridge_highway_segment, garage_lot_name, ferry_direction, 
-    ferry_terminal_name, latitude, longitude, location
-)
-FROM '/data/311_Service_Requests_from_2010_to_Present.csv'
-WITH (
-    FORMAT CSV,
-    HEADER true,
-    NULL '',
-    ENCODING 'UTF8'
-);
-EOF
+
+CHUNK_DIR=$(mktemp -d)
+trap 'rm -rf "$CHUNK_DIR"' EXIT
+
+run_stage "Splitting CSV by year" split_csv
+run_stage "Loading chunks" copy_chunks
+run_stage "Building indexes" build_indexes
+run_stage "Analyzing" analyze_table
+run_stage "Recording import" record_import
 
 FINAL_COUNT=$(psql -U "$POSTGRES_USER" -d "$POSTGRES_DB" -t -c "SELECT COUNT(*) FROM service_requests;" | xargs)
 echo "=== Import complete! Total rows: $FINAL_COUNT ==="
+
+echo "=== Stage timings ==="
+for i in "${!STAGES[@]}"; do
+    printf "%-24s %10ss\n" "${STAGES[$i]}" "${TIMINGS[$i]}"
+done
@@ -0,0 +1,29 @@
+-- Daily rollup of service_requests for the aggregate questions the bot gets
+-- most. Every column is additive, so any coarser grouping over these
+-- dimensions can be answered by summing rows. Refresh after each import:
+--   python src/rollups.py
+CREATE MATERIALIZED VIEW service_requests_daily AS
+SELECT
+    created_date::date AS day,
+    agency,
+    complaint_type,
+    borough,
+    incident_zip,
+    COUNT(*) AS request_count,
+    COUNT(closed_date) AS closed_count,
+    SUM(EXTRACT(EPOCH FROM closed_date - created_date)) AS resolution_seconds,
+    COUNT(*) FILTER (WHERE closed_date - created_date <= INTERVAL '1 day') AS closed_within_1_days,
+    COUNT(*) FILTER (WHERE closed_date - created_date <= INTERVAL '3 days') AS closed_within_3_days,
+    COUNT(*) FILTER (WHERE closed_date - created_date <= INTERVAL '7 days') AS closed_within_7_days,
+    COUNT(*) FILTER (WHERE closed_date - created_date <= INTERVAL '30 days') AS closed_within_30_days
+FROM service_requests
+GROUP BY 1, 2, 3, 4, 5;
+
+-- REFRESH ... CONCURRENTLY needs a unique index covering every row.
+CREATE UNIQUE INDEX idx_service_requests_daily_key ON service_requests_daily(day, agency, complaint_type, borough, incident_zip) NULLS NOT DISTINCT;
+
+CREATE INDEX idx_service_requests_daily_complaint_type ON service_requests_daily(complaint_type);
+
+CREATE INDEX idx_service_requests_daily_agency ON service_requests_daily(agency);
+
+ANALYZE service_requests_daily;
@@ -0,0 +1,252 @@
+import asyncio
+import datetime
+import time
+
+import asyncpg
+from typing_extensions import Awaitable, Callable, Literal, Optional
+
+from database import DatabasePool
+from models import PrecomputedAnswerMetricsModel, PrecomputedAnswerModel
+from question_cache import QuestionCache
+from settings import Settings
+
+# The import watermark: the same version result_cache.py compares against,
+# with the newest created_date that import had seen.
+WATERMARK_QUERY = """
+SELECT version::text, max_created_date
+FROM data_imports
+WHERE rows_inserted + rows_updated > 0
+ORDER BY version DESC
+LIMIT 1
+"""
+
+LOG_QUESTION_QUERY = "INSERT INTO question_log (question, normalized) VALUES ($1, $2)"
+
+# The latest wording of each normalized question asked often enough recently.
+TRENDING_QUESTIONS_QUERY = """
+SELECT (array_agg(question ORDER BY asked_at DESC))[1] AS question
+FROM question_log
+WHERE asked_at > now() - make_interval(days => $1)
+GROUP BY normalized
+HAVING count(*) >= $2
+ORDER BY count(*) DESC, max(asked_at) DESC
+LIMIT $3
+"""
+
+# Queries, shaped results and the responder's answer, or None when the run
+# ended without one: blocked, busy, degraded or without rows.
+Precompute = Callable[[str], Awaitable[Optional[tuple[list[str], list[dict], str]]]]
+
+Source = Literal["example", "trending"]
+
+
+class PrecomputedAnswerCache:
+    """Answers to the example and trending questions, rebuilt after each import.
+
+    Lookups are exact matches on the question cache's normalized text. Until a
+    rebuild finishes, the previous answers are served with their own stamp.
+    """
+
+    def __init__(self, settings: Settings, database: DatabasePool) -> None:
+        self.settings = settings
+        self.database = database
+
+        self.entries: dict[str, PrecomputedAnswerModel] = {}
+        self.data_version: Optional[str] = None
+
+        self.log_enabled = True
+        self.log_tasks: set[asyncio.Task] = set()
+
+        self.hits = 0
+        self.misses = 0
+        self.builds = 0
+        self.failures = 0
+        self.build_seconds: Optional[float] = None
+
+    def get(self, question: str) -> Optional[PrecomputedAnswerModel]:
+        entry = self.entries.get(QuestionCache.normalize(question))
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+
+        return entry
+
+    @staticmethod
+    def stamp(entry: PrecomputedAnswerModel) -> str:
+        stamp = f"Precomputed answer as of {entry.cached_at:%Y-%m-%d %H:%M} UTC"
+
+        if entry.data_through is not None:
+            stamp += f", from data through {entry.data_through:%Y-%m-%d}"
+
+        return f"\n\n*{stamp}.*"
+
+    def log_question(self, question: str) -> None:
+        # Off the request path; a lost log row only makes a question trend later.
+        if not self.log_enabled or not QuestionCache.normalize(question):
+            return
+
+        task = asyncio.create_task(self.insert_question(question))
+        self.log_tasks.add(task)
+        task.add_done_callback(self.log_tasks.discard)
+
+    async def insert_question(self, question: str) -> None:
+        try:
+            async with self.database.acquire() as conn:
+                await conn.execute(
+                    LOG_QUESTION_QUERY, question, QuestionCache.normalize(question)
+                )
+        except asyncpg.UndefinedTableError:
+            # Databases created before question_log existed only get the
+            # example questions precomputed.
+            print("question_log does not exist, not logging questions")
+            self.log_enabled = False
+        except Exception as e:
+            print(f"question log failed: {type(e).__name__}: {e}")
+
+    async def watermark(self) -> tuple[str, Optional[datetime.datetime]]:
+        async with self.database.acquire() as conn:
+            try:
+                row = await conn.fetchrow(WATERMARK_QUERY)
+            except asyncpg.UndefinedTableError:
+                row = None
+
+        return (row["version"], row["max_created_date"]) if row else ("0", None)
+
+    async def trending_questions(self) -> list[str]:
+        limit = self.settings.answer_cache_trending_questions
+
+        if limit <= 0:
+            return []
+
+        async with self.database.acquire() as conn:
+            try:
+                rows = await conn.fetch(
+                    TRENDING_QUESTIONS_QUERY,
+                    self.settings.answer_cache_trending_days,
+                    self.settings.answer_cache_trending_min_asks,
+                    # Examples are often the most asked; they are skipped below.
+                    limit + len(self.settings.example_questions),
+                )
+            except asyncpg.UndefinedTableError:
+                return []
+
+        return [row["question"] for row in rows]
+
+    async def questions(self) -> dict[str, tuple[str, Source]]:
+        questions: dict[str, tuple[str, Source]] = {}
+
+        for question in self.settings.example_questions:
+            key = QuestionCache.normalize(question)
+            questions.setdefault(key, (question, "example"))
+
+        trending = 0
+
+        for question in await self.trending_questions():
+            key = QuestionCache.normalize(question)
+
+            if key in questions:
+                continue
+
+            if trending == self.settings.answer_cache_trending_questions:
+                break
+
+            questions[key] = (question, "trending")
+            trending += 1
+
+        return questions
+
+    async def refresh(self, precompute: Precompute) -> None:
+        """Rebuild every answer if the import watermark moved since the last build.
+
+        Questions the last build found no answer for are retried until the
+        next import.
+
+        Args:
+            precompute (Precompute): Runs one question through the workflow
+        """
+        data_version, data_through = await self.watermark()
+
+        if data_version == self.data_version and not self.failures:
+            return
+
+        start = time.perf_counter()
+        questions = await self.questions()
+        pending = {
+            key: question
+            for key, question in questions.items()
+            if data_version != self.data_version or key not in self.entries
+        }
+        semaphore = asyncio.Semaphore(self.settings.answer_cache_build_concurrency)
+        failures = 0
+
+        async def build(key: str, question: str, source: Source) -> None:
+            nonlocal failures
+
+            async with semaphore:
+                try:
+                    answer = await precompute(question)
+                except Exception as e:
+                    print(f"precompute failed: {type(e).__name__}: {e}")
+                    answer = None
+
+            if answer is None:
+                failures += 1
+                return
+
+            queries, results, response = answer
+
+            # Replaced one by one, so fresh answers are served as they land.
+            self.entries[key] = PrecomputedAnswerModel(
+                question=question,
+                source=source,
+                queries=queries,
+                results=results,
+                response=response,
+                data_version=data_version,
+                data_through=data_through,
+                cached_at=datetime.datetime.now(datetime.timezone.utc),
+            )
+
+        await asyncio.gather(
+            *(build(key, *question) for key, question in pending.items())
+        )
+
+        # Questions that stopped trending, or failed this time, would keep
+        # answering from the previous import.
+        for key in list(self.entries):
+            if key not in questions or self.entries[key].data_version != data_version:
+                del self.entries[key]
+
+        self.data_version = data_version
+        self.builds += 1
+        self.failures = failures
+        self.build_seconds = time.perf_counter() - start
+
+        if self.settings.debug:
+            print(self.metrics())
+
+    async def run(self, precompute: Precompute) -> None:
+        while True:
+            try:
+                await self.refresh(precompute)
+            except Exception as e:
+                print(f"answer cache refresh failed: {type(e).__name__}: {e}")
+
+            await asyncio.sleep(self.settings.answer_cache_check_interval)
+
+    async def aclose(self) -> None:
+        await asyncio.gather(*self.log_tasks, return_exceptions=True)
+
+    def metrics(self) -> PrecomputedAnswerMetricsModel:
+        return PrecomputedAnswerMetricsModel(
+            entries=len(self.entries),
+            hits=self.hits,
+            misses=self.misses,
+            builds=self.builds,
+            failures=self.failures,
+            build_seconds=self.build_seconds,
+            data_version=self.data_version,
+        )
@@ -0,0 +1,360 @@
+import asyncio
+import json
+import time
+from uuid import uuid4
+
+from langchain_core.messages import AIMessage, AIMessageChunk, ToolMessage
+from pydantic import ValidationError
+from typing_extensions import TYPE_CHECKING, Any, AsyncIterator, Optional
+
+from models import ChatRequestModel
+from settings import Settings
+from startup import start_workflow
+
+if TYPE_CHECKING:
+    from workflow import Workflow
+
+
+class ConversationSession:
+    def __init__(self, session_id: str) -> None:
+        self.session_id = session_id
+
+        self.messages: list[dict] = []
+        self.conversation_summary: Optional[AIMessage] = None
+        self.summary_watermark = 0
+        self.summary_task: Optional[asyncio.Task] = None
+
+        self.lock = asyncio.Lock()
+        self.last_seen = time.monotonic()
+
+    def collect_conversation_summary(self) -> None:
+        if self.summary_task is None or not self.summary_task.done():
+            return
+
+        if not self.summary_task.cancelled():
+            update = self.summary_task.result()
+
+            if "conversation_summary" in update:
+                self.conversation_summary = update["conversation_summary"]
+                self.summary_watermark = update["summary_watermark"]
+
+        self.summary_task = None
+
+
+class ApiServer:
+    # settings and the workflow startup task are created by the ASGI lifespan
+    # startup event.
+    settings: Settings
+    startup: asyncio.Task["Workflow"]
+
+    def __init__(self) -> None:
+        self.sessions: dict[str, ConversationSession] = {}
+
+    async def __call__(self, scope: dict, receive: Any, send: Any) -> None:
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+
+        if scope["type"] != "http":
+            return
+
+        method, path = scope["method"], scope["path"]
+
+        if method == "GET" and path == "/health":
+            await self.send_json(send, *self.health())
+        elif method == "GET" and path == "/metrics":
+            if self.is_ready():
+                await self.send_text(
+                    send, 200, self.startup.result().tracer.metrics.render()
+                )
+            else:
+                await self.send_text(send, 503, "starting\n")
+        elif method == "POST" and path == "/chat":
+            await self.chat(receive, send)
+        elif method == "DELETE" and path.startswith("/sessions/"):
+            session = self.sessions.pop(path.removeprefix("/sessions/"), None)
+
+            if session and session.summary_task:
+                session.summary_task.cancel()
+
+            await self.send_json(send, 204 if session else 404, None)
+        else:
+            await self.send_json(send, 404, {"detail": "Not Found"})
+
+    async def lifespan(self, receive: Any, send: Any) -> None:
+        while True:
+            message = await receive()
+
+            if message["type"] == "lifespan.startup":
+                try:
+                    self.settings = Settings()
+
+                    # With lazy startup the server accepts requests while the
+                    # workflow is built; the first chat waits for it.
+                    self.startup = asyncio.create_task(start_workflow(self.settings))
+
+                    if not self.settings.lazy_startup_enabled:
+                        await self.startup
+                except Exception as e:
+                    await send({"type": "lifespan.startup.failed", "message": str(e)})
+                    return
+
+                await send({"type": "lifespan.startup.complete"})
+
+            elif message["type"] == "lifespan.shutdown":
+                if self.is_ready():
+                    await self.startup.result().aclose()
+                else:
+                    self.startup.cancel()
+
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def is_ready(self) -> bool:
+        return (
+            self.startup.done()
+            and not self.startup.cancelled()
+            and self.startup.exception() is None
+        )
+
+    def health(self) -> tuple[int, dict]:
+        if self.is_ready():
+            return 200, {"status": "ok"}
+
+        if not self.startup.done():
+            return 503, {"status": "starting"}
+
+        return 503, {"status": "failed", "detail": str(self.startup.exception())}
+
+    async def get_workflow(self) -> "Workflow":
+        # Shielded: a client disconnecting must not cancel the shared startup.
+        return await asyncio.shield(self.startup)
+
+    async def chat(self, receive: Any, send: Any) -> None:
+        body = b""
+        more_body = True
+
+        while more_body:
+            message = await receive()
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+        try:
+            request = ChatRequestModel.model_validate_json(body)
+        except ValidationError as e:
+            await self.send_json(send, 422, {"detail": json.loads(e.json())})
+            return
+
+        self.expire_sessions()
+
+        session_id = request.session_id or uuid4().hex
+        session = self.sessions.setdefault(
+            session_id, ConversationSession(session_id)
+        )
+
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/event-stream"),
+                    (b"cache-control", b"no-cache"),
+                    (b"x-accel-buffering", b"no"),
+                ],
+            }
+        )
+
+        async def wait_for_disconnect() -> None:
+            while (await receive())["type"] != "http.disconnect":
+                pass
+
+        disconnected = asyncio.create_task(wait_for_disconnect())
+
+        try:
+            await self.send_event(send, "session", {"session_id": session_id})
+
+            async for event, data in self.stream_events(session, request.prompt):
+                if disconnected.done():
+                    break
+
+                await self.send_event(send, event, data)
+
+        except Exception as e:
+            await self.send_event(send, "error", {"detail": str(e)})
+
+        finally:
+            disconnected.cancel()
+
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    async def stream_events(
+        self, session: ConversationSession, prompt: str
+    ) -> AsyncIterator[tuple[str, dict]]:
+        workflow = await self.get_workflow()
+
+        async with session.lock:
+            session.last_seen = time.monotonic()
+            session.collect_conversation_summary()
+            session.messages.append({"role": "user", "content": prompt})
+
+            full_response = ""
+
+            astream = workflow.astream(
+                prompt,
+                session.messages,
+                conversation_summary=session.conversation_summary,
+                summary_watermark=session.summary_watermark,
+            )
+
+            async for _, (msg, metadata) in astream:
+                if isinstance(msg, AIMessageChunk):
+                    if metadata.get("precomputed"):
+                        yield "cached", {
+                            "cached_at": metadata["cached_at"],
+                            "data_version": metadata["data_version"],
+                        }
+
+                    if msg.content and isinstance(msg.content, str):
+                        full_response += msg.content
+                        yield "token", {"content": msg.content}
+
+                elif isinstance(msg, AIMessage):
+                    verdict = self.parse_guardrail_verdict(msg)
+
+                    if verdict is not None:
+                        yield "guardrail", verdict
+
+                        if not verdict["allowed"]:
+                            full_response = verdict["reason"]
+                            break
+
+                    for tool_call in msg.tool_calls:
+                        if tool_call["name"] == "query_runner":
+                            yield "sql", {"query": tool_call["args"].get("query", "")}
+
+                    # Messages a node returns without streaming, such as the
+                    # busy notice or a degraded answer, arrive whole and are the
+                    # answer. A responder that timed out mid-stream has already
+                    # sent tokens, which this replaces.
+                    if (
+                        verdict is None
+                        and not msg.tool_calls
+                        and msg.content
+                        and isinstance(msg.content, str)
+                    ):
+                        full_response = msg.content
+                        yield "message", {"content": msg.content}
+
+                elif isinstance(msg, ToolMessage):
+                    yield "rows", self.compact_rows(msg)
+
+            session.messages.append({"role": "assistant", "content": full_response})
+
+            if session.summary_task is None:
+                session.summary_task = asyncio.create_task(
+                    workflow.asummarize(
+                        list(session.messages),
+                        session.conversation_summary,
+                        session.summary_watermark,
+                    )
+                )
+
+            yield "done", {"response": full_response}
+
+    @staticmethod
+    def parse_guardrail_verdict(msg: AIMessage) -> Optional[dict]:
+        if not msg.content or not isinstance(msg.content, str):
+            return None
+
+        try:
+            content = json.loads(msg.content)
+        except ValueError:
+            return None
+
+        if not isinstance(content, dict) or "is_irrelevant_prompt" not in content:
+            return None
+
+        blocked = bool(
+            (content["is_irrelevant_prompt"] or content["is_mallicious_prompt"])
+            and content.get("reason")
+        )
+
+        return {
+            "allowed": not blocked,
+            "is_irrelevant_prompt": content["is_irrelevant_prompt"],
+            "is_mallicious_prompt": content["is_mallicious_prompt"],
+            "reason": content.get("reason", ""),
+        }
+
+    def compact_rows(self, msg: ToolMessage) -> dict:
+        try:
+            result = json.loads(msg.content) if isinstance(msg.content, str) else {}
+        except ValueError:
+            result = {}
+
+        if not isinstance(result, dict):
+            result = {}
+
+        # Results are already column-major; only trim them to the API limit.
+        limit = self.settings.api_result_rows_limit
+        row_count = result.get("row_count", 0)
+
+        return {
+            **result,
+            "columns": {
+                column: values[:limit]
+                for column, values in result.get("columns", {}).items()
+            },
+            "row_count": min(row_count, limit),
+            "truncated": result.get("truncated", False) or row_count > limit,
+        }
+
+    def expire_sessions(self) -> None:
+        ttl = self.settings.api_session_ttl
+        now = time.monotonic()
+
+        for session_id, session in list(self.sessions.items()):
+            if now - session.last_seen > ttl and not session.lock.locked():
+                if session.summary_task:
+                    session.summary_task.cancel()
+
+                del self.sessions[session_id]
+
+    @staticmethod
+    async def send_event(send: Any, event: str, data: dict) -> None:
+        payload = f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+        await send(
+            {
+                "type": "http.response.body",
+                "body": payload.encode(),
+                "more_body": True,
+            }
+        )
+
+    @staticmethod
+    async def send_text(send: Any, status: int, text: str) -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [(b"content-type", b"text/plain; version=0.0.4")],
+            }
+        )
+        await send({"type": "http.response.body", "body": text.encode()})
+
+    @staticmethod
+    async def send_json(send: Any, status: int, data: Any) -> None:
+        body = json.dumps(data).encode() if data is not None else b""
+
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [(b"content-type", b"application/json")],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+
+app = ApiServer()
@@ -1,27 +1,58 @@
-import asyncio
+import atexit
 import json
 
 import streamlit as st
-from langchain_core.messages import AIMessage, AIMessageChunk
 
+from event_loop import BackgroundEventLoop
 from settings import Settings
-from workflow import Workflow
+from startup import start_workflow
 
-_loop = asyncio.new_event_loop()
-asyncio.set_event_loop(_loop)
 
-
-async def initialize_workflow():
+@st.cache_resource(show_spinner=False)
+def get_runtime():
+    # One workflow per process: its models, prompts, caches and connection
+    # pools are shared by every session and bound to one background loop.
+    # It is built there too, so the page renders while the imports run.
     settings = Settings()
+    runner = BackgroundEventLoop()
+    startup = runner.submit(start_workflow(settings))
+
+    def shutdown():
+        if startup.done() and startup.exception() is None:
+            runner.run(startup.result().aclose())
+
+        runner.stop()
+
+    atexit.register(shutdown)
+
+    return startup, settings, runner
+
+
+def reset_conversation_summary():
+    summary_task = st.session_state.get("summary_task")
 
-    workflow = Workflow(settings)
-    workflow.build_graph()
+    if summary_task is not None:
+        summary_task.cancel()
 
-    return workflow, settings
+    st.session_state.conversation_summary = None
+    st.session_state.summary_watermark = 0
+    st.session_state.summary_task = None
 
 
-def run_async(coro):
-    return _loop.run_until_complete(coro)
+def collect_conversation_summary():
+    summary_task = st.session_state.summary_task
+
+    if summary_task is None or not summary_task.done():
+        return
+
+    if not summary_task.cancelled():
+        update = summary_task.result()
+
+        if "conversation_summary" in update:
+            st.session_state.conversation_summary = update["conversation_summary"]
+            st.session_state.summary_watermark = update["summary_watermark"]
+
+    st.session_state.summary_task = None
 
 
 def main():
@@ -57,17 +88,27 @@ def main():
     if "messages" not in st.session_state:
         st.session_state.messages = []
 
-    if "workflow" not in st.session_state:
+    if "conversation_summary" not in st.session_state:
+        reset_conversation_summary()
+
+    try:
+        startup, settings, runner = get_runtime()
+    except Exception as e:
+        st.error(f"Failed to initialize: {e}")
+        st.stop()
+
+    def get_workflow():
+        # With lazy startup, only the first question waits for the workflow.
         with st.spinner("Initializing bot..."):
             try:
-                workflow, settings = run_async(initialize_workflow())
-
-                st.session_state.workflow = workflow
-                st.session_state.settings = settings
+                return startup.result()
             except Exception as e:
                 st.error(f"Failed to initialize: {e}")
                 st.stop()
 
+    if not settings.lazy_startup_enabled:
+        get_workflow()
+
     if not st.session_state.messages:
         st.title("🏙️ NYC 311 Analytics Bot")
 
@@ -89,16 +130,8 @@ def main():
 
         st.header("💡 Example Questions")
 
-        example_questions = [
-            "What are the top 10 complaint types by number of records?",
-            "For the top 5 complaint types, what percent were closed within 3 days?",
-            "Which ZIP code has the highest number of complaints?",
-            "What proportion of complaints include a valid latitude/longitude?",
-            "Which agency has the slowest average resolution time?",
-            "Compare noise complaints in 2020 versus 2023",
-        ]
-
-        for i, question in enumerate(example_questions):
+        # Precomputed after every import, so these answer instantly.
+        for i, question in enumerate(settings.example_questions):
             if st.button(f"{i + 1}. {question[:40]}...", key=f"example_{i}"):
                 st.session_state.current_input = question
                 st.rerun()
@@ -107,6 +140,7 @@ def main():
 
         if st.button("🗑️ Clear Chat History", use_container_width=True):
             st.session_state.messages = []
+            reset_conversation_summary()
             st.rerun()
 
     for message in st.session_state.messages:
@@ -130,6 +164,11 @@ def main():
                             st.code(metadata["sql_query"], language="sql")
 
     def process_prompt(prompt: str):
+        # Imported here with the rest of LangChain, after the page is up.
+        from langchain_core.messages import AIMessage, AIMessageChunk
+
+        workflow = get_workflow()
+
         st.session_state.messages.append({"role": "user", "content": prompt})
 
         with st.chat_message("user"):
@@ -139,19 +178,23 @@ def main():
             response_placeholder = st.empty()
 
             try:
-                workflow = st.session_state.workflow
-                settings = st.session_state.settings
-
                 full_response = ""
                 guardrail_data = None
                 sql_query = None
 
-                astream = workflow.astream(prompt, st.session_state.messages)
+                collect_conversation_summary()
 
-                async def process_stream():
+                astream = workflow.astream(
+                    prompt,
+                    st.session_state.messages,
+                    conversation_summary=st.session_state.conversation_summary,
+                    summary_watermark=st.session_state.summary_watermark,
+                )
+
+                def process_stream():
                     nonlocal full_response, guardrail_data, sql_query
 
-                    async for _, data in astream:
+                    for _, data in runner.iterate(astream):
                         if isinstance(data, tuple) and len(data) > 0:
                             msg = data[0]
 
@@ -168,10 +211,13 @@ def main():
                                     if msg.content:
                                         print(msg.content)
 
+                                is_verdict = False
+
                                 if msg.content and isinstance(msg.content, str):
                                     try:
                                         content_dict = json.loads(msg.content)
                                         if "is_irrelevant_prompt" in content_dict:
+                                            is_verdict = True
                                             guardrail_data = {
                                                 "is_irrelevant_prompt": content_dict[
                                                     "is_irrelevant_prompt"
@@ -194,6 +240,18 @@ def main():
                                     except Exception:
                                         pass
 
+                                # Messages a node returns without streaming, such
+                                # as the busy notice, arrive whole and are the
+                                # answer.
+                                if (
+                                    not is_verdict
+                                    and not msg.tool_calls
+                                    and msg.content
+                                    and isinstance(msg.content, str)
+                                ):
+                                    full_response = msg.content
+                                    response_placeholder.markdown(full_response + "▌")
+
                                 if hasattr(msg, "tool_calls") and msg.tool_calls:
                                     if settings.debug:
                                         print(msg.tool_calls)
@@ -218,7 +276,7 @@ def main():
 
                     return full_response + "\n"
 
-                final_response = run_async(process_stream())
+                final_response = process_stream()
 
                 if settings.debug:
                     print()
@@ -245,6 +303,18 @@ def main():
                         "metadata": metadata if metadata else None,
                     }
                 )
+
+                # Fold aged-out messages into the summary off the critical
+                # path; the next prompt picks the result up if it is ready.
+                if st.session_state.summary_task is None:
+                    st.session_state.summary_task = runner.submit(
+                        workflow.asummarize(
+                            list(st.session_state.messages),
+                            st.session_state.conversation_summary,
+                            st.session_state.summary_watermark,
+                        )
+                    )
+
                 st.rerun()
 
             except Exception as e:
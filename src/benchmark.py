@@ -0,0 +1,667 @@
+import argparse
+import asyncio
+import datetime
+import json
+import socket
+import statistics
+import subprocess
+import time
+from collections import defaultdict
+
+import sqlglot as sg
+import uvicorn
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage
+from langgraph.graph.state import CompiledStateGraph
+
+from prompt_context import PromptContextIndex
+from settings import Settings
+from states import WorkflowState
+from stub_llm import DEFAULT_QUERY, SCENARIO_QUERIES, SCENARIOS, StubLlmServer
+from workflow import Workflow
+
+# SQL the stub query writer answers the scenario questions with, by keyword.
+BACKEND_QUERIES = {
+    "top_complaint_types": DEFAULT_QUERY,
+    **{keywords[0]: query for keywords, query in SCENARIO_QUERIES},
+}
+
+
+def summarize(samples: list[float]) -> dict[str, float]:
+    samples_ms = sorted(sample * 1000 for sample in samples)
+
+    return {
+        "count": len(samples_ms),
+        "mean": statistics.fmean(samples_ms),
+        "p50": samples_ms[len(samples_ms) // 2],
+        "p99": samples_ms[int(len(samples_ms) * 0.99)],
+    }
+
+
+def report(name: str, samples: list[float]) -> None:
+    summary = summarize(samples)
+
+    print(
+        f"{name:<32}"
+        f" mean {summary['mean']:8.3f} ms"
+        f"  p50 {summary['p50']:8.3f} ms"
+        f"  p99 {summary['p99']:8.3f} ms"
+    )
+
+
+def report_llm_latency(workflow: Workflow) -> None:
+    # Seconds to the first token, or to the answer for non-streaming nodes.
+    for metrics in workflow.latency_metrics():
+        if metrics.calls:
+            print(
+                f"{'llm.' + metrics.node:<32}"
+                f" p50 {(metrics.p50 or 0) * 1000:8.3f} ms"
+                f"  p99 {(metrics.p99 or 0) * 1000:8.3f} ms"
+                f"  hedged {metrics.hedged} (won {metrics.hedge_wins})"
+                f"  timeouts {metrics.timeouts}"
+            )
+
+
+async def compile_overhead(iterations: int) -> None:
+    # A zero-latency stub guardrail blocks the prompt, so every run is one
+    # model round trip with no database, and the variants differ only in
+    # where the compiled graph comes from.
+    stub = await start_stub(
+        argparse.Namespace(
+            stub_latency=0.0,
+            stub_jitter=0.0,
+            stub_tokens_per_second=1000.0,
+            stub_response_tokens=1,
+            stub_tail_probability=0.0,
+            stub_tail_latency=0.0,
+        )
+    )
+    settings = Settings(
+        openrouter_base_url=stub[2],
+        openrouter_api_key="stub",
+        guardrail_prefilter_enabled=False,
+        answer_cache_enabled=False,
+    )
+
+    start = time.perf_counter()
+    workflow = Workflow(settings)
+    workflow.build_graph()
+    startup_ms = (time.perf_counter() - start) * 1000
+    print(f"{'startup (init + build_graph)':<32} {startup_ms:8.3f} ms")
+
+    async def run(graph: CompiledStateGraph) -> None:
+        prompt = HumanMessage(content=SCENARIOS["irrelevant"][1])
+        state = WorkflowState(messages=[prompt], ui_messages=[prompt])
+
+        async for _ in graph.astream(input=state, stream_mode=["messages"]):
+            pass
+
+    compile_only = []
+    per_request_compile = []
+    shared_graph = []
+
+    try:
+        # One untimed run each, so connection setup is not charged to either.
+        await run(workflow.graph_builder.compile())
+        await run(workflow.graph)
+
+        for _ in range(iterations):
+            start = time.perf_counter()
+            graph = workflow.graph_builder.compile()
+            compile_only.append(time.perf_counter() - start)
+            await run(graph)
+            per_request_compile.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            await run(workflow.graph)
+            shared_graph.append(time.perf_counter() - start)
+    finally:
+        await workflow.aclose()
+
+        stub[0].should_exit = True
+        await stub[1]
+
+    report("compile only", compile_only)
+    report("before (compile per request)", per_request_compile)
+    report("after (shared compiled graph)", shared_graph)
+
+
+def is_answer(message: BaseMessage) -> bool:
+    if not isinstance(message, AIMessage) or not isinstance(message.content, str):
+        return False
+
+    if not message.content or isinstance(message, AIMessageChunk):
+        return bool(message.content)
+
+    # The guardrail's structured verdict is streamed for the UI, not the user.
+    try:
+        verdict = json.loads(message.content)
+    except ValueError:
+        return True
+
+    return not (isinstance(verdict, dict) and "is_irrelevant_prompt" in verdict)
+
+
+def llm_tokens(workflow: Workflow) -> dict[str, float]:
+    counters = workflow.tracer.metrics.counters
+    tokens = {}
+
+    for labels, value in counters["workflow_llm_tokens_total"].items():
+        if dict(labels)["direction"] == "input":
+            tokens[f"input_tokens.{dict(labels)['node']}"] = value
+
+    for labels, value in counters["workflow_llm_cached_input_tokens_total"].items():
+        tokens[f"cached_tokens.{dict(labels)['node']}"] = value
+
+    return tokens
+
+
+async def run_conversation(workflow: Workflow, prompt: str) -> dict[str, float]:
+    """Stream one fresh conversation and time it from the client's side.
+
+    Args:
+        workflow (Workflow): Workflow with a compiled graph
+        prompt (str): The user question
+
+    Returns:
+        dict[str, float]: Seconds per metric; token throughput in tokens per second
+            and prompt tokens per LLM node
+    """
+    database_before = workflow.database.hold_time_total
+    tokens_before = llm_tokens(workflow)
+    task_started: dict[str, float] = {}
+    sample: dict[str, float] = defaultdict(float)
+
+    first_token = last_token = None
+    tokens = 0
+
+    start = time.perf_counter()
+
+    async for mode, chunk in workflow.astream(
+        prompt=prompt,
+        ui_messages=[HumanMessage(content=prompt)],
+        stream_mode=["messages", "debug"],
+    ):
+        now = time.perf_counter()
+
+        if mode == "messages":
+            message = chunk[0]
+
+            # Blocked prompts answer with a whole message instead of chunks.
+            if is_answer(message):
+                first_token = first_token or now
+                last_token = now
+                tokens += 1
+
+        elif chunk["type"] == "task":
+            task_started[chunk["payload"]["id"]] = now
+
+        elif chunk["type"] == "task_result":
+            started = task_started.pop(chunk["payload"]["id"], now)
+            sample[f"node.{chunk['payload']['name']}"] += now - started
+
+    sample["total"] = time.perf_counter() - start
+    sample["db"] = workflow.database.hold_time_total - database_before
+
+    if first_token is not None:
+        sample["ttft"] = first_token - start
+
+    if tokens > 1 and last_token > first_token:
+        sample["tokens_per_second"] = (tokens - 1) / (last_token - first_token)
+
+    # Only nodes that called their LLM in this conversation.
+    for metric, value in llm_tokens(workflow).items():
+        if value > tokens_before.get(metric, 0) or metric.startswith("cached_tokens."):
+            sample[metric] = value - tokens_before.get(metric, 0)
+
+    for metric in [metric for metric in sample if metric.startswith("cached_tokens.")]:
+        if "input_tokens." + metric.removeprefix("cached_tokens.") not in sample:
+            del sample[metric]
+
+    return sample
+
+
+async def start_stub(
+    args: argparse.Namespace,
+) -> tuple[uvicorn.Server, asyncio.Task, str]:
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+
+    server = uvicorn.Server(
+        uvicorn.Config(
+            StubLlmServer(
+                latency=args.stub_latency,
+                jitter=args.stub_jitter,
+                tokens_per_second=args.stub_tokens_per_second,
+                response_tokens=args.stub_response_tokens,
+                tail_probability=args.stub_tail_probability,
+                tail_latency=args.stub_tail_latency,
+            ),
+            log_level="warning",
+        )
+    )
+    task = asyncio.create_task(server.serve(sockets=[sock]))
+
+    while not server.started:
+        await asyncio.sleep(0.01)
+
+    return server, task, f"http://127.0.0.1:{sock.getsockname()[1]}/v1"
+
+
+def git_revision() -> dict[str, str | bool]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = bool(
+            subprocess.run(
+                ["git", "status", "--porcelain", "--untracked-files=no"],
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": "", "dirty": False}
+
+    return {"commit": commit, "dirty": dirty}
+
+
+async def scenarios(args: argparse.Namespace) -> None:
+    stub = None
+
+    # The answer cache is off unless asked for, so benchmark questions are
+    # not logged as trending.
+    if args.stub:
+        stub = await start_stub(args)
+        settings = Settings(
+            openrouter_base_url=stub[2],
+            openrouter_api_key="stub",
+            answer_cache_enabled=args.precompute,
+        )
+    else:
+        settings = Settings(answer_cache_enabled=args.precompute)
+
+    workflow = Workflow(settings)
+    workflow.build_graph()
+
+    categories = args.category or list(SCENARIOS)
+    samples: dict[str, dict[str, list[float]]] = defaultdict(lambda: defaultdict(list))
+
+    try:
+        if args.precompute:
+            start = time.perf_counter()
+            await workflow.answer_cache.refresh(workflow.precompute_answer)
+
+            print(f"{'precompute':<32} {(time.perf_counter() - start) * 1000:8.3f} ms")
+            print(workflow.answer_cache.metrics())
+
+        for category in categories:
+            for _ in range(args.repeat):
+                for prompt in SCENARIOS[category]:
+                    sample = await run_conversation(workflow, prompt)
+
+                    for metric, value in sample.items():
+                        samples[category][metric].append(value)
+                        samples["all"][metric].append(value)
+    finally:
+        await workflow.aclose()
+
+        if stub is not None:
+            stub[0].should_exit = True
+            await stub[1]
+
+    results = {
+        **git_revision(),
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "config": {
+            "repeat": args.repeat,
+            "stub": args.stub,
+            "stub_latency": args.stub_latency,
+            "stub_tokens_per_second": args.stub_tokens_per_second,
+            "speculative_execution": settings.speculative_execution,
+            "stub_tail_probability": args.stub_tail_probability,
+            "stub_tail_latency": args.stub_tail_latency,
+            "llm_hedging_enabled": settings.llm_hedging_enabled,
+            "answer_cache_enabled": settings.answer_cache_enabled,
+        },
+        "metrics": {
+            category: {
+                metric: summarize(values) for metric, values in sorted(metrics.items())
+            }
+            for category, metrics in samples.items()
+        },
+    }
+
+    for category in [*categories, "all"]:
+        print(f"=== {category} ===")
+
+        for metric, values in sorted(samples[category].items()):
+            if metric == "tokens_per_second":
+                print(f"{metric:<32} mean {statistics.fmean(values):8.1f} tok/s")
+            elif metric.startswith(("input_tokens.", "cached_tokens.")):
+                print(f"{metric:<32} mean {statistics.fmean(values):8.1f} tokens")
+            else:
+                report(metric, values)
+
+    print("=== models ===")
+    report_llm_latency(workflow)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+        print(f"Results written to {args.output}")
+
+
+async def load(args: argparse.Namespace) -> None:
+    stub = None
+
+    if args.stub:
+        stub = await start_stub(args)
+
+    prompts = [
+        prompt for category in args.category or ["valid"] for prompt in SCENARIOS[category]
+    ]
+
+    try:
+        # Each level gets a fresh workflow, so queue metrics are per level.
+        for sessions in args.sessions:
+            settings = (
+                Settings(
+                    openrouter_base_url=stub[2],
+                    openrouter_api_key="stub",
+                    answer_cache_enabled=False,
+                )
+                if stub
+                else Settings(answer_cache_enabled=False)
+            )
+            workflow = Workflow(settings)
+            workflow.build_graph()
+
+            samples: dict[str, list[float]] = defaultdict(list)
+            failures = 0
+
+            async def session(index: int) -> None:
+                nonlocal failures
+
+                # Closed loop: each simulated analyst waits for an answer
+                # before asking the next question.
+                for turn in range(args.turns):
+                    prompt = prompts[(index + turn) % len(prompts)]
+
+                    try:
+                        sample = await run_conversation(workflow, prompt)
+                    except Exception as e:
+                        print(e)
+                        failures += 1
+                        continue
+
+                    for metric in ("total", "ttft"):
+                        if metric in sample:
+                            samples[metric].append(sample[metric])
+
+            start = time.perf_counter()
+
+            try:
+                await asyncio.gather(*(session(i) for i in range(sessions)))
+            finally:
+                elapsed = time.perf_counter() - start
+                await workflow.aclose()
+
+            completed = len(samples["total"])
+
+            print(
+                f"=== {sessions} sessions: {completed} conversations in {elapsed:.2f} s,"
+                f" {completed / elapsed:.2f} conversations/s, {failures} failed ==="
+            )
+
+            for metric, values in samples.items():
+                report(metric, values)
+
+            for metrics in workflow.concurrency_metrics():
+                print(
+                    f"{'queue.' + metrics.stage:<32}"
+                    f" mean {metrics.queue_wait_avg * 1000:8.3f} ms"
+                    f"  max {metrics.queue_wait_max * 1000:8.3f} ms"
+                    f"  timeouts {metrics.timeouts}"
+                )
+
+            report_llm_latency(workflow)
+    finally:
+        if stub is not None:
+            stub[0].should_exit = True
+            await stub[1]
+
+
+async def backends(args: argparse.Namespace) -> None:
+    # Every run has to reach the backend, so the result cache is off.
+    settings = Settings(result_cache_enabled=False)
+    workflow = Workflow(settings)
+
+    names = args.backend or list(workflow.backends)
+    samples: dict[str, dict[str, list[float]]] = defaultdict(lambda: defaultdict(list))
+    row_counts: dict[str, dict[str, int]] = defaultdict(dict)
+
+    try:
+        for name in names:
+            backend = workflow.backends[name]
+
+            for query_name, query in BACKEND_QUERIES.items():
+                expression = sg.parse_one(query, read="postgres")
+
+                try:
+                    for run in range(args.warmup + args.repeat):
+                        start = time.perf_counter()
+                        result, _ = await backend.execute(expression.copy())
+                        elapsed = time.perf_counter() - start
+
+                        if run >= args.warmup:
+                            samples[name][query_name].append(elapsed)
+                except Exception as e:
+                    print(f"{name}/{query_name} failed: {type(e).__name__}: {e}")
+                    continue
+
+                row_counts[name][query_name] = result.get("summary", {}).get(
+                    "total_rows", result["row_count"]
+                )
+    finally:
+        await workflow.aclose()
+
+    print(
+        f"{'query':<24}"
+        + "".join(f" {name + ' p50':>14} {name + ' p99':>14}" for name in names)
+        + "  rows"
+    )
+
+    for query_name in BACKEND_QUERIES:
+        line = f"{query_name:<24}"
+
+        for name in names:
+            values = samples[name].get(query_name)
+
+            if values:
+                summary = summarize(values)
+                line += f" {summary['p50']:11.3f} ms {summary['p99']:11.3f} ms"
+            else:
+                line += f" {'failed':>14} {'':>14}"
+
+        # Backends reading the same data must agree on the result size.
+        counts = {row_counts[name].get(query_name) for name in names} - {None}
+        line += f"  {counts.pop()}" if len(counts) == 1 else f"  MISMATCH {sorted(counts)}"
+
+        print(line)
+
+    if args.output:
+        results = {
+            **git_revision(),
+            "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "config": {"repeat": args.repeat, "warmup": args.warmup},
+            # Same layout as scenarios results, so compare works on both.
+            "metrics": {
+                name: {
+                    query_name: summarize(values)
+                    for query_name, values in queries.items()
+                }
+                for name, queries in samples.items()
+            },
+        }
+
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+        print(f"Results written to {args.output}")
+
+
+def prompt_sizes() -> None:
+    settings = Settings()
+
+    with open(settings.model_3_system_prompt_path) as f:
+        full = f.read()
+
+    index = PromptContextIndex(settings, full)
+
+    # About four characters per token, as in the stub server.
+    print(f"{'full prompt':<32} {len(full):8d} bytes {len(full) // 4:8d} tokens")
+    print(
+        f"{'stable prefix':<32} {len(index.prefix):8d} bytes"
+        f" {len(index.prefix) // 4:8d} tokens"
+    )
+
+    for category in ("valid", "mixed_irrelevant"):
+        for prompt in SCENARIOS[category]:
+            context = index.context(prompt) or ""
+            print(
+                f"{prompt[:32]:<32} {len(context):8d} bytes {len(context) // 4:8d} tokens"
+                f"  {', '.join(index.select_columns(prompt)) or '-'}"
+            )
+
+
+def compare(base_path: str, head_path: str) -> None:
+    with open(base_path) as f:
+        base = json.load(f)
+
+    with open(head_path) as f:
+        head = json.load(f)
+
+    print(f"base {base['commit'][:12] or '?'}  head {head['commit'][:12] or '?'}")
+    print(
+        f"{'metric':<40} {'base p50':>10} {'head p50':>10}"
+        f" {'change':>8} {'p99 change':>11}"
+    )
+
+    def change(before: float, after: float) -> str:
+        return f"{(after - before) / before * 100:+7.1f}%" if before else "    n/a"
+
+    for category, metrics in head["metrics"].items():
+        for metric, summary in metrics.items():
+            before = base["metrics"].get(category, {}).get(metric)
+
+            if before is None:
+                continue
+
+            print(
+                f"{category + '/' + metric:<40}"
+                f" {before['p50']:10.2f} {summary['p50']:10.2f}"
+                f" {change(before['p50'], summary['p50'])}"
+                f"    {change(before['p99'], summary['p99'])}"
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="NYC 311 Analytics Bot benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    compile_parser = subparsers.add_parser(
+        "compile", help="Per-request graph compile overhead"
+    )
+    compile_parser.add_argument("--iterations", type=int, default=200)
+
+    scenarios_parser = subparsers.add_parser(
+        "scenarios", help="End-to-end latency for the main.py prompt categories"
+    )
+    scenarios_parser.add_argument(
+        "--category", action="append", choices=list(SCENARIOS), help="Repeatable"
+    )
+    scenarios_parser.add_argument("--repeat", type=int, default=3)
+    scenarios_parser.add_argument("--output", help="Write results JSON for compare")
+    scenarios_parser.add_argument(
+        "--stub", action="store_true", help="Serve the LLMs from an in-process stub"
+    )
+    scenarios_parser.add_argument(
+        "--precompute",
+        action="store_true",
+        help="Precompute the example question answers first, as after an import",
+    )
+
+    load_parser = subparsers.add_parser(
+        "load", help="Concurrent conversations to find the saturation point"
+    )
+    load_parser.add_argument(
+        "--sessions",
+        type=int,
+        nargs="+",
+        default=[1, 4, 16, 64],
+        help="Concurrent sessions per level",
+    )
+    load_parser.add_argument("--turns", type=int, default=5, help="Questions per session")
+    load_parser.add_argument(
+        "--category",
+        action="append",
+        choices=list(SCENARIOS),
+        help="Prompt categories to cycle through, repeatable (default: valid)",
+    )
+    load_parser.add_argument(
+        "--stub", action="store_true", help="Serve the LLMs from an in-process stub"
+    )
+
+    for stub_parser in (scenarios_parser, load_parser):
+        stub_parser.add_argument("--stub-latency", type=float, default=0.3)
+        stub_parser.add_argument("--stub-jitter", type=float, default=0.05)
+        stub_parser.add_argument("--stub-tokens-per-second", type=float, default=50.0)
+        stub_parser.add_argument("--stub-response-tokens", type=int, default=120)
+        stub_parser.add_argument("--stub-tail-probability", type=float, default=0.0)
+        stub_parser.add_argument("--stub-tail-latency", type=float, default=0.0)
+
+    backends_parser = subparsers.add_parser(
+        "backends", help="Scenario queries on each query backend"
+    )
+    backends_parser.add_argument(
+        "--backend",
+        action="append",
+        choices=["postgres", "duckdb"],
+        help="Repeatable (default: all)",
+    )
+    backends_parser.add_argument("--repeat", type=int, default=5)
+    backends_parser.add_argument(
+        "--warmup", type=int, default=1, help="Untimed runs per query first"
+    )
+    backends_parser.add_argument("--output", help="Write results JSON for compare")
+
+    subparsers.add_parser(
+        "prompts", help="Query writer prompt size, full and assembled per question"
+    )
+
+    compare_parser = subparsers.add_parser(
+        "compare", help="Compare two scenarios result files"
+    )
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("head")
+
+    args = parser.parse_args()
+
+    if args.benchmark == "compile":
+        asyncio.run(compile_overhead(args.iterations))
+    elif args.benchmark == "scenarios":
+        asyncio.run(scenarios(args))
+    elif args.benchmark == "load":
+        asyncio.run(load(args))
+    elif args.benchmark == "backends":
+        asyncio.run(backends(args))
+    elif args.benchmark == "prompts":
+        prompt_sizes()
+    elif args.benchmark == "compare":
+        compare(args.base, args.head)
+
+
+if __name__ == "__main__":
+    main()
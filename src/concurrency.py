@@ -0,0 +1,84 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+from typing_extensions import AsyncIterator
+
+from models import StageConcurrencyMetricsModel
+
+BUSY_MESSAGE = (
+    "The service is handling too many requests right now. Please try again in a moment."
+)
+
+
+class StageOverloadedError(Exception):
+    pass
+
+
+class StageLimiter:
+    def __init__(self, name: str, limit: int, queue_timeout: float) -> None:
+        self.name = name
+        self.limit = limit
+        self.queue_timeout = queue_timeout
+
+        # asyncio.Semaphore hands released slots to waiters in arrival order,
+        # so a burst from one session cannot starve the others.
+        self.semaphore = asyncio.Semaphore(limit)
+
+        self.in_flight = 0
+        self.queued = 0
+        self.acquire_count = 0
+        self.timeouts = 0
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Wait in line for one of the stage's slots.
+
+        Raises:
+            StageOverloadedError: No slot freed up within the queue timeout
+        """
+        start = time.perf_counter()
+        self.queued += 1
+
+        try:
+            async with asyncio.timeout(self.queue_timeout):
+                await self.semaphore.acquire()
+        except TimeoutError:
+            self.timeouts += 1
+            raise StageOverloadedError(
+                f"{self.name} stage is saturated: no slot freed up within "
+                f"{self.queue_timeout:g} seconds ({self.limit} in flight)"
+            )
+        finally:
+            self.queued -= 1
+
+        wait = time.perf_counter() - start
+
+        self.acquire_count += 1
+        self.queue_wait_total += wait
+        self.queue_wait_max = max(self.queue_wait_max, wait)
+        self.in_flight += 1
+
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self.semaphore.release()
+
+    def metrics(self) -> StageConcurrencyMetricsModel:
+        return StageConcurrencyMetricsModel(
+            stage=self.name,
+            limit=self.limit,
+            in_flight=self.in_flight,
+            queued=self.queued,
+            acquire_count=self.acquire_count,
+            timeouts=self.timeouts,
+            queue_wait_avg=(
+                self.queue_wait_total / self.acquire_count
+                if self.acquire_count
+                else 0.0
+            ),
+            queue_wait_max=self.queue_wait_max,
+        )
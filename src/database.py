@@ -0,0 +1,102 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+import asyncpg
+from typing_extensions import AsyncIterator, Optional
+
+from models import DatabasePoolMetricsModel
+from settings import Settings
+
+
+class DatabasePool:
+    def __init__(self, settings: Settings) -> None:
+        self.settings = settings
+
+        self.pool: Optional[asyncpg.Pool] = None
+        self.pool_lock = asyncio.Lock()
+
+        self.acquire_count = 0
+        self.acquire_timeouts = 0
+        self.acquire_wait_total = 0.0
+        self.acquire_wait_max = 0.0
+        self.hold_time_total = 0.0
+
+    async def open(self) -> asyncpg.Pool:
+        if self.pool is not None:
+            return self.pool
+
+        async with self.pool_lock:
+            if self.pool is None:
+                statement_timeout_ms = int(self.settings.database_statement_timeout * 1000)
+
+                self.pool = await asyncpg.create_pool(
+                    host=self.settings.database_host,
+                    port=self.settings.database_port,
+                    database=self.settings.database_name,
+                    user=self.settings.database_user,
+                    password=self.settings.database_password.get_secret_value(),
+                    min_size=self.settings.database_pool_min_size,
+                    max_size=self.settings.database_pool_max_size,
+                    max_queries=self.settings.database_pool_max_queries,
+                    max_inactive_connection_lifetime=self.settings.database_pool_max_inactive_connection_lifetime,
+                    command_timeout=self.settings.database_statement_timeout,
+                    server_settings={"statement_timeout": str(statement_timeout_ms)},
+                )
+
+        return self.pool
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[asyncpg.Connection]:
+        pool = await self.open()
+
+        start = time.perf_counter()
+
+        try:
+            conn = await pool.acquire(
+                timeout=self.settings.database_pool_acquire_timeout
+            )
+        except asyncio.TimeoutError:
+            self.acquire_timeouts += 1
+            raise
+
+        wait = time.perf_counter() - start
+
+        self.acquire_count += 1
+        self.acquire_wait_total += wait
+        self.acquire_wait_max = max(self.acquire_wait_max, wait)
+
+        acquired = time.perf_counter()
+
+        try:
+            yield conn
+        finally:
+            self.hold_time_total += time.perf_counter() - acquired
+            await pool.release(conn)
+
+    async def close(self) -> None:
+        async with self.pool_lock:
+            if self.pool is not None:
+                await self.pool.close()
+                self.pool = None
+
+    def metrics(self) -> DatabasePoolMetricsModel:
+        size = self.pool.get_size() if self.pool else 0
+        idle = self.pool.get_idle_size() if self.pool else 0
+
+        return DatabasePoolMetricsModel(
+            size=size,
+            in_use=size - idle,
+            idle=idle,
+            min_size=self.settings.database_pool_min_size,
+            max_size=self.settings.database_pool_max_size,
+            acquire_count=self.acquire_count,
+            acquire_timeouts=self.acquire_timeouts,
+            acquire_wait_avg=(
+                self.acquire_wait_total / self.acquire_count
+                if self.acquire_count
+                else 0.0
+            ),
+            acquire_wait_max=self.acquire_wait_max,
+            hold_time_total=self.hold_time_total,
+        )
@@ -0,0 +1,69 @@
+import asyncio
+import queue
+import threading
+from concurrent.futures import Future
+
+from typing_extensions import Any, AsyncIterator, Coroutine, Iterator, TypeVar
+
+T = TypeVar("T")
+
+_END_OF_STREAM = object()
+
+
+class BackgroundEventLoop:
+    def __init__(self) -> None:
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(
+            target=self.run_forever,
+            name="workflow-event-loop",
+            daemon=True,
+        )
+        self.thread.start()
+
+    def run_forever(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro: Coroutine[Any, Any, T]) -> Future[T]:
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Coroutine[Any, Any, T]) -> T:
+        return self.submit(coro).result()
+
+    def iterate(self, aiterator: AsyncIterator[T]) -> Iterator[T]:
+        """Drive an async iterator on the loop and yield its items here.
+
+        Args:
+            aiterator (AsyncIterator[T]): The async iterator to consume
+
+        Returns:
+            Iterator[T]: Items in order, as soon as the loop produces them
+        """
+        items: queue.Queue = queue.Queue()
+
+        async def pump() -> None:
+            try:
+                async for item in aiterator:
+                    items.put(item)
+            except BaseException as e:
+                items.put(e)
+                raise
+            finally:
+                items.put(_END_OF_STREAM)
+
+        future = self.submit(pump())
+
+        try:
+            while (item := items.get()) is not _END_OF_STREAM:
+                if isinstance(item, BaseException):
+                    raise item
+
+                yield item
+        finally:
+            # The caller stopped early (e.g. a blocked prompt), so stop
+            # producing instead of running the rest of the graph.
+            future.cancel()
+
+    def stop(self) -> None:
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
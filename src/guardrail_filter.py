@@ -0,0 +1,369 @@
+import asyncio
+import random
+import re
+from collections import Counter
+
+import sqlglot as sg
+import sqlglot.expressions as exp
+from typing_extensions import Awaitable, Callable
+
+from models import (
+    GuardrailPrefilterMetricsModel,
+    GuardrailPrefilterVerdictModel,
+    GuardrailStructuredOutputModel,
+)
+from settings import Settings
+
+MALICIOUS_REASON = (
+    "I'm unable to process this request as it appears to contain instructions "
+    "that violate usage policies."
+)
+IRRELEVANT_REASON = (
+    "I'm designed to answer questions about NYC 311 service request data. "
+    "Please ask about complaint types, resolution times, or geographic patterns "
+    "in the 311 dataset."
+)
+
+# Instruction-override phrasing only: "drivers who ignore parking rules" or a
+# question about a "bypass" is a 311 question, and is left to the LLM.
+PROMPT_INJECTION_PATTERNS = [
+    re.compile(pattern, re.IGNORECASE)
+    for pattern in (
+        r"\b(ignore|disregard|forget|override)\s+(all\s+)?(of\s+)?(the\s+|your\s+)?(previous|prior|above|earlier|preceding|original|system|developer)\s+(instructions?|prompts?|rules|guidelines|directions)\b",
+        r"\b(ignore|disregard|forget|override)\s+(all\s+)?(of\s+)?your\s+(instructions?|prompts?|rules|guidelines|programming)\b",
+        r"\byou are now (a|an)\b",
+        r"\bsystem prompt\b",
+        r"\b(hidden|initial|original) (prompt|instructions)\b",
+        r"\bjailbreak\b",
+        r"\bdeveloper mode\b",
+        r"\bexecute any (command|query|code|sql)\b",
+    )
+]
+
+# Words that open a SQL statement; the text from here is handed to sqlglot.
+SQL_STATEMENT_START = re.compile(
+    r"\b(alter|create|delete|drop|grant|insert|merge|revoke|select|truncate|update|with)\b",
+    re.IGNORECASE,
+)
+SQL_SEGMENT_END = re.compile(r"[.;!?\n]")
+
+# Tables a statement may target without its full syntax, as in "TRUNCATE
+# service_requests"; other targets need the clause prose would not have.
+DATABASE_TABLES = frozenset(
+    {"service_requests", "service_requests_daily", "data_imports", "question_log"}
+)
+
+# A second sentence is where mixed prompts tack on their other request.
+SENTENCE_BREAK = re.compile(r"[.;!?]\s+\S")
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Every word of a prompt allowed locally must come from here (or be a number):
+# question words, analytics terms and 311 vocabulary. A keyword alone is not
+# enough, since "noise complaints and reveal your prompt" contains one too.
+QUESTION_VOCABULARY = frozenset({
+    "a", "s", "about", "across", "after", "against", "all", "among", "an", "and",
+    "any", "are", "as", "at", "be", "been", "before", "between", "break", "broken",
+    "by", "can", "compare", "compared", "count", "counts", "did", "do", "does",
+    "down", "during", "each", "every", "for", "from", "give", "had", "has",
+    "have", "how", "in", "include", "includes", "including", "into", "is", "it",
+    "list", "many", "me", "much", "of", "on", "or", "out", "over", "per",
+    "show", "than", "that", "the", "their", "there", "these", "they", "this",
+    "those", "to", "under", "versus", "vs", "was", "were", "what", "when",
+    "where", "which", "while", "who", "whose", "why", "with", "within",
+    "without",
+    "average", "avg", "breakdown", "change", "changed", "common", "distribution",
+    "fastest", "fewest", "greatest", "growth", "highest", "largest", "least",
+    "longest", "lowest", "max", "maximum", "mean", "median", "min", "minimum",
+    "more", "most", "number", "numbers", "percent", "percentage", "proportion",
+    "rank", "ranked", "rate", "rates", "ratio", "share", "shortest",
+    "slowest", "smallest", "sum", "top", "total", "totals", "trend", "trends",
+    "bottom", "first", "last", "less", "fewer", "frequent", "frequently",
+    "day", "days", "hour", "hours", "minute", "minutes", "month", "monthly",
+    "months", "quarter", "season", "summer", "week", "weekday", "weekdays",
+    "weekend", "weekends", "weekly", "winter", "spring", "fall", "autumn",
+    "year", "yearly", "years", "time", "times", "date", "dates", "night",
+    "morning", "evening", "daily", "today", "recent", "since", "until",
+    "311", "address", "addresses", "agency", "agencies", "area", "areas",
+    "borough", "boroughs", "board", "boards", "city", "closed", "closing",
+    "code", "codes", "community", "complaint", "complaints", "created",
+    "descriptor", "descriptors", "geocoded", "incident", "incidents",
+    "latitude", "location", "locations", "longitude", "neighborhood",
+    "neighborhoods", "nyc", "open", "opened", "pending", "record", "records",
+    "report", "reported", "reports", "request", "requests", "resolution",
+    "resolutions", "resolve", "resolved", "service", "status", "street",
+    "streets", "type", "types", "valid", "invalid", "missing", "unspecified",
+    "zip", "zipcode", "zipcodes",
+    "manhattan", "brooklyn", "queens", "bronx", "staten", "island", "new",
+    "york",
+    "nypd", "hpd", "dot", "dsny", "dep", "dohmh", "dpr", "dob",
+    "noise", "loud", "music", "party", "heat", "heating", "hot", "water",
+    "illegal", "parking", "blocked", "driveway", "rodent", "rodents", "rats",
+    "graffiti", "condition", "conditions", "residential", "commercial",
+    "vehicle", "vehicles", "sanitation", "sewer", "plumbing", "paint",
+    "plaster", "sidewalk", "tree", "trees", "pothole", "potholes", "light",
+    "lights", "derelict", "homeless", "dirty", "trash", "garbage", "unsanitary",
+})  # fmt: skip
+
+OFF_TOPIC_PATTERNS = [
+    re.compile(pattern, re.IGNORECASE)
+    for pattern in (
+        r"\bweather\b",
+        r"\bforecast\b",
+        r"\bsports?\b",
+        r"\bscores?\b",
+        r"\bjokes?\b",
+        r"\bpoem\b",
+        r"\bstory\b",
+        r"\brecipe\b",
+        r"\bstock(s| market)?\b",
+        r"\bfavou?rite colou?r\b",
+        r"\bhistory of\b",
+        r"\bnews\b",
+    )
+]
+
+# 311 vocabulary: dataset terms, column concepts, boroughs, agencies and
+# complaint subjects.
+DOMAIN_PATTERNS = [
+    re.compile(pattern, re.IGNORECASE)
+    for pattern in (
+        r"\b311\b",
+        r"\bnyc\b",
+        r"\bnew york\b",
+        r"\bcomplaints?\b",
+        r"\bservice requests?\b",
+        r"\breport(s|ed)?\b",
+        r"\bagency\b",
+        r"\bagencies\b",
+        r"\bboroughs?\b",
+        r"\b(manhattan|brooklyn|queens|bronx|staten island)\b",
+        r"\bzip( ?codes?)?\b",
+        r"\bincidents?\b",
+        r"\bresolution\b",
+        r"\bresolved\b",
+        r"\bclosed\b",
+        r"\bdescriptors?\b",
+        r"\bcommunity boards?\b",
+        r"\bgeocod(ed|ing)\b",
+        r"\blatitude\b",
+        r"\blongitude\b",
+        r"\bstreets?\b",
+        r"\bsidewalks?\b",
+        r"\b(noise|heat|heating|hot water|illegal parking|blocked driveway|parking)\b",
+        r"\b(rodents?|rats|graffiti|potholes?|flooding|sewer|trees?|sanitation)\b",
+        r"\b(trash|garbage|homeless|derelict|plumbing|elevator)\b",
+        r"\b(nypd|hpd|dot|dsny|dep|dohmh|dpr|dob)\b",
+    )
+]
+
+
+class GuardrailPrefilter:
+    def __init__(self, settings: Settings) -> None:
+        self.settings = settings
+
+        self.decisions: Counter[str] = Counter()
+        self.audited: Counter[str] = Counter()
+        self.agreed: Counter[str] = Counter()
+        self.unsure_outcomes: Counter[str] = Counter()
+
+        self.audit_tasks: set[asyncio.Task] = set()
+
+    def classify(self, prompt: str) -> GuardrailPrefilterVerdictModel:
+        """Decide clear-cut prompts locally, leaving the rest to the LLM.
+
+        Args:
+            prompt (str): The latest user message
+
+        Returns:
+            GuardrailPrefilterVerdictModel: The decision and the rule behind it
+        """
+        verdict = self.evaluate(prompt)
+        self.decisions[verdict.decision] += 1
+
+        return verdict
+
+    def evaluate(self, prompt: str) -> GuardrailPrefilterVerdictModel:
+        for pattern in PROMPT_INJECTION_PATTERNS:
+            if pattern.search(prompt):
+                return GuardrailPrefilterVerdictModel(
+                    decision="malicious",
+                    rule=f"injection:{pattern.pattern}",
+                    reason=MALICIOUS_REASON,
+                )
+
+        sql_rule = self.find_unsafe_sql(prompt)
+
+        if sql_rule:
+            return GuardrailPrefilterVerdictModel(
+                decision="malicious", rule=sql_rule, reason=MALICIOUS_REASON
+            )
+
+        off_topic = any(pattern.search(prompt) for pattern in OFF_TOPIC_PATTERNS)
+        on_topic = any(pattern.search(prompt) for pattern in DOMAIN_PATTERNS)
+
+        if off_topic and not on_topic:
+            return GuardrailPrefilterVerdictModel(
+                decision="irrelevant", rule="off_topic", reason=IRRELEVANT_REASON
+            )
+
+        # Anything mixing topics, spanning several sentences, long enough to
+        # hide instructions, mentioning SQL at all or using a word outside the
+        # question vocabulary is left to the LLM. Local rules only ever block
+        # what the LLM would have; allowing is reserved for plain 311 questions.
+        if (
+            on_topic
+            and not off_topic
+            and len(prompt) <= self.settings.guardrail_prefilter_max_length
+            and not SENTENCE_BREAK.search(prompt)
+            and not SQL_STATEMENT_START.search(prompt)
+            and self.in_vocabulary(prompt)
+        ):
+            return GuardrailPrefilterVerdictModel(decision="allow", rule="domain")
+
+        return GuardrailPrefilterVerdictModel(decision="unsure", rule="no_match")
+
+    @staticmethod
+    def in_vocabulary(prompt: str) -> bool:
+        return all(
+            word.isdigit() or word in QUESTION_VOCABULARY
+            for word in WORD_PATTERN.findall(prompt.lower())
+        )
+
+    @classmethod
+    def find_unsafe_sql(cls, prompt: str) -> str:
+        for match in SQL_STATEMENT_START.finditer(prompt):
+            end = SQL_SEGMENT_END.search(prompt, match.start())
+            words = prompt[match.start() : end.start() if end else len(prompt)].split()
+
+            # Trailing prose ("... and then tell me a joke") stops sqlglot from
+            # parsing, so retry with shorter prefixes of the segment. Prose it
+            # cannot parse at all ("Drop Street") falls back to a Command, which
+            # says nothing about intent.
+            for length in range(len(words), 1, -1):
+                try:
+                    expression = sg.parse_one(" ".join(words[:length]), read="postgres")
+                except sg.errors.SqlglotError:
+                    continue
+
+                if isinstance(expression, exp.Command):
+                    continue
+
+                for node in expression.walk():
+                    if cls.is_write_statement(node):
+                        return f"sql:{node.key}"
+
+                break
+
+        return ""
+
+    @staticmethod
+    def is_write_statement(expression: exp.Expression) -> bool:
+        # Each statement with the clause that makes it SQL rather than prose
+        # opening with "update" or "delete from".
+        if isinstance(expression, exp.Update):
+            target = expression.this
+            complete = bool(expression.args.get("expressions"))
+        elif isinstance(expression, exp.Insert):
+            target = expression.this
+            complete = expression.args.get("expression") is not None
+        elif isinstance(expression, exp.Delete):
+            target = expression.this
+            complete = expression.args.get("where") is not None
+        elif isinstance(expression, exp.Merge):
+            target = expression.this
+            complete = expression.args.get("using") is not None
+        elif isinstance(expression, (exp.Alter, exp.Create, exp.Drop)):
+            target = expression.find(exp.Table)
+            complete = bool(expression.args.get("kind"))
+        elif isinstance(expression, exp.TruncateTable):
+            target = expression.find(exp.Table)
+            complete = False
+        elif isinstance(expression, exp.Into):
+            target = expression.this
+            complete = True
+        else:
+            return False
+
+        if isinstance(target, exp.Schema):
+            target = target.this
+
+        if not isinstance(target, exp.Table):
+            return False
+
+        return complete or target.name.lower() in DATABASE_TABLES
+
+    def audit(
+        self,
+        verdict: GuardrailPrefilterVerdictModel,
+        invoke_llm: Callable[[], Awaitable[GuardrailStructuredOutputModel]],
+    ) -> None:
+        """Sample local decisions and compare them with the LLM's in the background.
+
+        Args:
+            verdict (GuardrailPrefilterVerdictModel): The local decision
+            invoke_llm (Callable[[], Awaitable[GuardrailStructuredOutputModel]]):
+                Starts the guardrail LLM call for the same input
+        """
+        if random.random() >= self.settings.guardrail_prefilter_audit_rate:
+            return
+
+        async def compare() -> None:
+            try:
+                response = await invoke_llm()
+            except Exception as e:
+                print(e)
+                return
+
+            self.record_llm_verdict(verdict, response)
+
+        task = asyncio.create_task(compare())
+        self.audit_tasks.add(task)
+        task.add_done_callback(self.audit_tasks.discard)
+
+    def record_llm_verdict(
+        self,
+        verdict: GuardrailPrefilterVerdictModel,
+        response: GuardrailStructuredOutputModel,
+    ) -> None:
+        blocked = (
+            response.is_irrelevant_prompt or response.is_mallicious_prompt
+        ) and response.reason
+
+        if not blocked:
+            llm_decision = "allow"
+        elif response.is_mallicious_prompt:
+            llm_decision = "malicious"
+        else:
+            llm_decision = "irrelevant"
+
+        # Deferred prompts show which rules would be worth adding.
+        if verdict.decision == "unsure":
+            self.unsure_outcomes[llm_decision] += 1
+        else:
+            self.audited[verdict.decision] += 1
+
+            if llm_decision == verdict.decision:
+                self.agreed[verdict.decision] += 1
+            else:
+                print(
+                    f"Guardrail prefilter disagreement: local={verdict.decision} "
+                    f"({verdict.rule}) llm={llm_decision}"
+                )
+
+        if self.settings.debug:
+            print(self.metrics())
+
+    def metrics(self) -> GuardrailPrefilterMetricsModel:
+        return GuardrailPrefilterMetricsModel(
+            allowed=self.decisions["allow"],
+            malicious=self.decisions["malicious"],
+            irrelevant=self.decisions["irrelevant"],
+            unsure=self.decisions["unsure"],
+            audited=sum(self.audited.values()),
+            agreement_rate={
+                decision: self.agreed[decision] / count
+                for decision, count in self.audited.items()
+            },
+            unsure_outcomes=dict(self.unsure_outcomes),
+        )
@@ -0,0 +1,237 @@
+import asyncio
+import time
+from collections import deque
+
+from langchain_core.callbacks import AsyncCallbackHandler
+from typing_extensions import Any, Awaitable, Callable, Optional, cast
+
+from models import LlmLatencyMetricsModel
+
+UNAVAILABLE_MESSAGE = (
+    "The language model is not responding right now. Please try again in a moment."
+)
+
+DEGRADED_ANSWER_ROWS = 20
+
+# An attempt calls its `started` callback once its answer is decided: at the
+# first streamed token, or on return for models that do not stream.
+Attempt = Callable[[Callable[[], None]], Awaitable[Any]]
+
+
+class LlmTimeoutError(Exception):
+    """Raised when a node's model call runs past its latency budget"""
+
+
+class FirstTokenCallback(AsyncCallbackHandler):
+    """Reports the first streamed token of a model call"""
+
+    # Inline handlers run before the others, so the call that wins the race
+    # is decided before its first token reaches the stream.
+    run_inline = True
+
+    def __init__(self, started: Callable[[], None]) -> None:
+        self.started = started
+
+    async def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        self.started()
+
+
+class LatencyTracker:
+    """Recent model latencies of one node and the hedge delay they imply"""
+
+    def __init__(
+        self,
+        node: str,
+        window: int,
+        percentile: float,
+        min_samples: int,
+        min_delay: float,
+    ) -> None:
+        self.node = node
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+
+        # Seconds to the first token, or to the answer for non-streaming calls.
+        self.samples: deque[float] = deque(maxlen=window)
+
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.timeouts = 0
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.samples:
+            return None
+
+        samples = sorted(self.samples)
+
+        return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+    def hedge_delay(self) -> Optional[float]:
+        quantile = self.quantile(self.percentile)
+
+        # Too few samples for a percentile means no timed hedge yet.
+        if quantile is None or len(self.samples) < self.min_samples:
+            return None
+
+        return max(self.min_delay, quantile)
+
+    def record(self, seconds: float, hedged: bool, hedge_won: bool) -> None:
+        self.calls += 1
+        self.samples.append(seconds)
+        self.hedged += hedged
+        self.hedge_wins += hedge_won
+
+    def record_timeout(self) -> None:
+        self.calls += 1
+        self.timeouts += 1
+
+    def metrics(self) -> LlmLatencyMetricsModel:
+        return LlmLatencyMetricsModel(
+            node=self.node,
+            calls=self.calls,
+            samples=len(self.samples),
+            p50=self.quantile(0.5),
+            p99=self.quantile(0.99),
+            hedge_delay=self.hedge_delay(),
+            hedged=self.hedged,
+            hedge_wins=self.hedge_wins,
+            timeouts=self.timeouts,
+        )
+
+
+async def first_to_answer(
+    primary: Attempt, hedge: Optional[Attempt], delay: Optional[float]
+) -> tuple[Any, bool, bool, float]:
+    """Run the primary attempt, and the hedge too if the primary is slow or fails.
+
+    The hedge starts once the primary has not started answering after `delay`
+    seconds, or right away when the primary fails. Whichever attempt starts
+    answering first is kept and the other one is cancelled.
+
+    Args:
+        primary (Attempt): The node's own model call
+        hedge (Optional[Attempt]): Call to the alternate model, None to disable
+        delay (Optional[float]): Seconds before hedging, None to only fail over
+
+    Returns:
+        tuple[Any, bool, bool, float]: The answer, whether the hedge was sent,
+            whether it won, and seconds until the winner started answering
+    """
+    start = time.perf_counter()
+    attempts: list[asyncio.Task] = []
+    winner: Optional[asyncio.Task] = None
+    started_after = 0.0
+    decided = asyncio.Event()
+
+    def launch(attempt: Attempt) -> asyncio.Task:
+        task: Optional[asyncio.Task] = None
+
+        def started() -> None:
+            nonlocal winner, started_after
+
+            if winner is not None:
+                return
+
+            winner = task
+            started_after = time.perf_counter() - start
+
+            for other in attempts:
+                if other is not task:
+                    other.cancel()
+
+            decided.set()
+
+        async def run() -> Any:
+            result = await attempt(started)
+            started()
+
+            return result
+
+        task = asyncio.create_task(run())
+        attempts.append(task)
+
+        return task
+
+    decided_wait = asyncio.create_task(decided.wait())
+
+    try:
+        primary_task = launch(primary)
+
+        if hedge is not None:
+            await asyncio.wait(
+                {primary_task, decided_wait},
+                timeout=delay,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+
+            if winner is None:
+                launch(hedge)
+
+        while winner is None and not all(task.done() for task in attempts):
+            await asyncio.wait(
+                {decided_wait, *attempts}, return_when=asyncio.FIRST_COMPLETED
+            )
+
+        if winner is None:
+            # Every attempt failed; the primary's error is the one to report.
+            raise cast(BaseException, primary_task.exception())
+
+        result = await winner
+
+        return result, len(attempts) > 1, winner is not primary_task, started_after
+
+    finally:
+        for task in (decided_wait, *attempts):
+            if not task.done():
+                task.cancel()
+
+        await asyncio.gather(*attempts, return_exceptions=True)
+
+
+def degraded_answer(results: list[dict]) -> str:
+    """Query results as Markdown tables, for when the responder model fails.
+
+    Args:
+        results (list[dict]): Column-major query_runner results
+
+    Returns:
+        str: The tables under a short notice, or the unavailable message
+    """
+    tables = []
+
+    for result in results:
+        columns = result.get("columns")
+
+        if not columns:
+            continue
+
+        rows = list(zip(*columns.values()))[:DEGRADED_ANSWER_ROWS]
+        lines = [
+            "| " + " | ".join(columns) + " |",
+            "|" + " --- |" * len(columns),
+        ]
+
+        for row in rows:
+            cells = ("" if value is None else str(value) for value in row)
+            lines.append(
+                "| " + " | ".join(cell.replace("|", "\\|") for cell in cells) + " |"
+            )
+
+        total_rows = result.get("summary", {}).get(
+            "total_rows", result.get("row_count", len(rows))
+        )
+
+        if total_rows > len(rows):
+            lines.append(f"\nFirst {len(rows)} of {total_rows:,} rows.")
+
+        tables.append("\n".join(lines))
+
+    if not tables:
+        return UNAVAILABLE_MESSAGE
+
+    return (
+        "The language model is not responding right now, so here are the query "
+        "results without a written answer.\n\n" + "\n\n".join(tables)
+    )
@@ -0,0 +1,277 @@
+import argparse
+import asyncio
+import datetime
+import io
+import time
+
+import asyncpg
+from typing_extensions import Iterator, Optional
+
+from models import IngestionReportModel
+from rollups import refresh_rollup
+from settings import Settings
+
+# Column order of the 311 CSV export, which matches service_requests.
+SERVICE_REQUEST_COLUMNS = [
+    "unique_key",
+    "created_date",
+    "closed_date",
+    "agency",
+    "agency_name",
+    "complaint_type",
+    "descriptor",
+    "location_type",
+    "incident_zip",
+    "incident_address",
+    "street_name",
+    "cross_street_1",
+    "cross_street_2",
+    "intersection_street_1",
+    "intersection_street_2",
+    "address_type",
+    "city",
+    "landmark",
+    "facility_type",
+    "status",
+    "due_date",
+    "resolution_description",
+    "resolution_action_updated_date",
+    "community_board",
+    "borough",
+    "x_coordinate",
+    "y_coordinate",
+    "park_facility_name",
+    "park_borough",
+    "school_name",
+    "school_number",
+    "school_region",
+    "school_code",
+    "school_phone_number",
+    "school_address",
+    "school_city",
+    "school_state",
+    "school_zip",
+    "school_not_found",
+    "school_or_citywide_complaint",
+    "vehicle_type",
+    "taxi_company_borough",
+    "taxi_pick_up_location",
+    "bridge_highway_name",
+    "bridge_highway_direction",
+    "road_ramp",
+    "bridge_highway_segment",
+    "garage_lot_name",
+    "ferry_direction",
+    "ferry_terminal_name",
+    "latitude",
+    "longitude",
+    "location",
+]
+
+STAGING_TABLE = "service_requests_staging"
+
+INGEST_LOCK_QUERY = "SELECT pg_advisory_lock(hashtext('service_requests_ingest'))"
+
+CREATE_STAGING_QUERY = f"""
+CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE}
+(LIKE service_requests INCLUDING DEFAULTS)
+"""
+
+# The export can repeat a request; the last copy in the batch wins.
+DEDUPLICATE_STAGING_QUERY = f"""
+DELETE FROM {STAGING_TABLE} AS older
+USING {STAGING_TABLE} AS newer
+WHERE older.unique_key = newer.unique_key AND older.ctid < newer.ctid
+"""
+
+# Changed rows are deleted and reinserted rather than updated in place, since
+# a new created_date can move a request to another partition.
+DELETE_CHANGED_QUERY = f"""
+DELETE FROM service_requests AS existing
+USING {STAGING_TABLE} AS staged
+WHERE existing.unique_key = staged.unique_key
+AND ROW(existing.*) IS DISTINCT FROM ROW(staged.*)
+"""
+
+INSERT_MISSING_QUERY = f"""
+INSERT INTO service_requests
+SELECT staged.* FROM {STAGING_TABLE} AS staged
+WHERE NOT EXISTS (
+    SELECT 1 FROM service_requests AS existing
+    WHERE existing.unique_key = staged.unique_key
+)
+"""
+
+# Same as db/init/01-schema.sql, for databases created before data_imports
+# existed; without it the batches would commit but the version never move.
+CREATE_IMPORTS_QUERY = """
+CREATE TABLE IF NOT EXISTS data_imports (
+    version BIGSERIAL PRIMARY KEY,
+    source TEXT NOT NULL,
+    started_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    finished_at TIMESTAMPTZ,
+    rows_read BIGINT NOT NULL DEFAULT 0,
+    rows_inserted BIGINT NOT NULL DEFAULT 0,
+    rows_updated BIGINT NOT NULL DEFAULT 0,
+    max_created_date TIMESTAMP
+)
+"""
+
+RECORD_IMPORT_QUERY = """
+INSERT INTO data_imports (
+    source, started_at, finished_at, rows_read, rows_inserted, rows_updated,
+    max_created_date
+)
+SELECT $1, $2, now(), $3, $4, $5, GREATEST(
+    (SELECT MAX(max_created_date) FROM data_imports), $6::timestamp
+)
+RETURNING version
+"""
+
+
+def read_batches(path: str, batch_rows: int) -> Iterator[tuple[bytes, int]]:
+    """Split the CSV into bounded batches of whole records.
+
+    Args:
+        path (str): CSV export with a header row
+        batch_rows (int): Records per batch
+
+    Returns:
+        Iterator[tuple[bytes, int]]: Raw CSV payload and record count per batch
+    """
+    with open(path, "rb") as f:
+        f.readline()
+
+        # Bytes pass through untouched so COPY keeps telling quoted empty
+        # strings from NULLs; a record only ends once its quotes balance.
+        lines: list[bytes] = []
+        quotes = 0
+        count = 0
+
+        for line in f:
+            lines.append(line)
+            quotes += line.count(b'"')
+
+            if quotes % 2:
+                continue
+
+            quotes = 0
+            count += 1
+
+            if count == batch_rows:
+                yield b"".join(lines), count
+
+                lines = []
+                count = 0
+
+        if lines:
+            yield b"".join(lines), count
+
+
+def affected_rows(status: str) -> int:
+    return int(status.split()[-1])
+
+
+async def ingest_batch(
+    conn: asyncpg.Connection, payload: bytes
+) -> tuple[int, int, Optional[datetime.datetime]]:
+    async with conn.transaction():
+        await conn.execute(f"TRUNCATE {STAGING_TABLE}")
+        await conn.copy_to_table(
+            STAGING_TABLE,
+            source=io.BytesIO(payload),
+            columns=SERVICE_REQUEST_COLUMNS,
+            format="csv",
+            null="",
+            encoding="utf-8",
+        )
+        await conn.execute(DEDUPLICATE_STAGING_QUERY)
+        await conn.execute(f"ANALYZE {STAGING_TABLE}")
+
+        updated = affected_rows(await conn.execute(DELETE_CHANGED_QUERY))
+        written = affected_rows(await conn.execute(INSERT_MISSING_QUERY))
+        max_created_date = await conn.fetchval(
+            f"SELECT MAX(created_date) FROM {STAGING_TABLE}"
+        )
+
+    return written - updated, updated, max_created_date
+
+
+async def ingest(settings: Settings, path: str) -> IngestionReportModel:
+    conn = await asyncpg.connect(
+        host=settings.database_host,
+        port=settings.database_port,
+        database=settings.database_name,
+        user=settings.database_user,
+        password=settings.database_password.get_secret_value(),
+    )
+
+    try:
+        # Concurrent runs would race on the same unique keys.
+        await conn.execute(INGEST_LOCK_QUERY)
+        await conn.execute(CREATE_IMPORTS_QUERY)
+        await conn.execute(CREATE_STAGING_QUERY)
+
+        started_at = await conn.fetchval("SELECT now()")
+        start = time.perf_counter()
+
+        rows_read = rows_inserted = rows_updated = 0
+        max_created_date = None
+
+        for payload, count in read_batches(path, settings.ingest_batch_rows):
+            inserted, updated, batch_max = await ingest_batch(conn, payload)
+
+            rows_read += count
+            rows_inserted += inserted
+            rows_updated += updated
+
+            if batch_max is not None and (
+                max_created_date is None or batch_max > max_created_date
+            ):
+                max_created_date = batch_max
+
+            print(
+                f"{rows_read} rows read, {rows_inserted} inserted, "
+                f"{rows_updated} updated"
+            )
+
+        ingest_seconds = time.perf_counter() - start
+
+        if rows_inserted or rows_updated:
+            await refresh_rollup(conn)
+
+        # Recorded last, so caches only move to the new version once the
+        # rollup is consistent with it.
+        version = await conn.fetchval(
+            RECORD_IMPORT_QUERY,
+            path,
+            started_at,
+            rows_read,
+            rows_inserted,
+            rows_updated,
+            max_created_date,
+        )
+
+        return IngestionReportModel(
+            version=version,
+            rows_read=rows_read,
+            rows_inserted=rows_inserted,
+            rows_updated=rows_updated,
+            max_created_date=max_created_date,
+            ingest_seconds=ingest_seconds,
+            total_seconds=time.perf_counter() - start,
+        )
+
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Upsert new and changed rows from a 311 CSV export"
+    )
+    parser.add_argument("path", help="CSV export with a header row")
+
+    args = parser.parse_args()
+
+    print(asyncio.run(ingest(Settings(), args.path)))
@@ -65,6 +65,8 @@ async def main():
             elif isinstance(m[0], ToolMessage):
                 print(m[0].content)
 
+    await workflow.aclose()
+
 
 if __name__ == "__main__":
     run(main())
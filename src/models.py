@@ -1,3 +1,6 @@
+import datetime
+from typing import Literal, Optional
+
 from pydantic import BaseModel, Field
 
 
@@ -30,3 +33,212 @@ class QueryRunnerInputModel(BaseModel):
     """Input schema for the query_runner tool"""
 
     query: str = Field(description="The PostgreSQL SELECT query to execute")
+
+
+class DatabasePoolMetricsModel(BaseModel):
+    """Snapshot of the shared database connection pool"""
+
+    size: int = Field(description="Connections currently open in the pool")
+    in_use: int = Field(description="Connections currently checked out")
+    idle: int = Field(description="Connections open and waiting in the pool")
+    min_size: int = Field(description="Configured minimum pool size")
+    max_size: int = Field(description="Configured maximum pool size")
+    acquire_count: int = Field(description="Successful acquires since startup")
+    acquire_timeouts: int = Field(description="Acquires that timed out")
+    acquire_wait_avg: float = Field(description="Mean acquire wait in seconds")
+    acquire_wait_max: float = Field(description="Longest acquire wait in seconds")
+    hold_time_total: float = Field(
+        description="Seconds connections were checked out since startup"
+    )
+
+
+class QueryResultCacheEntryModel(BaseModel):
+    """Cached result for one canonical query"""
+
+    result: dict = Field(description="Shaped result returned by the query")
+    size_bytes: int = Field(description="Approximate serialized size of the result")
+    created_at: float = Field(description="Monotonic time the result was cached")
+
+
+class QueryResultCacheMetricsModel(BaseModel):
+    """Snapshot of the query result cache"""
+
+    entries: int = Field(description="Cached queries")
+    size_bytes: int = Field(description="Approximate size of all cached results")
+    max_bytes: int = Field(description="Configured cache size limit")
+    hits: int = Field(description="Lookups answered from the cache")
+    misses: int = Field(description="Lookups that went to the database")
+    evictions: int = Field(description="Entries dropped to stay under max_bytes")
+    invalidations: int = Field(description="Full flushes after a data change")
+    data_version: Optional[str] = Field(
+        description="Last observed service_requests data version stamp"
+    )
+
+
+class QuestionCacheMatchModel(BaseModel):
+    """A cached question whose SQL can be reused"""
+
+    question: str = Field(description="Normalized text of the cached question")
+    query: str = Field(description="Validated SQL for the cached question")
+    confidence: float = Field(description="Cosine similarity to the new question")
+
+
+class QuestionCacheMetricsModel(BaseModel):
+    """Snapshot of the question to SQL cache"""
+
+    entries: int = Field(description="Cached questions")
+    hits: int = Field(description="Questions answered without the query writer")
+    misses: int = Field(description="Questions sent to the query writer")
+    threshold: float = Field(description="Minimum confidence for a hit")
+
+
+class PrecomputedAnswerModel(BaseModel):
+    """Answer to an example or trending question, computed after an import"""
+
+    question: str = Field(description="Question as it was run through the workflow")
+    source: Literal["example", "trending"] = Field(
+        description="Whether it is an example question or came from the question log"
+    )
+    queries: list[str] = Field(description="SQL written by the query writer")
+    results: list[dict] = Field(description="Shaped query results, in query order")
+    response: str = Field(description="The responder's answer")
+    data_version: str = Field(description="data_imports version it was computed on")
+    data_through: Optional[datetime.datetime] = Field(
+        description="Newest created_date of that version"
+    )
+    cached_at: datetime.datetime = Field(description="When the answer was computed")
+
+
+class PrecomputedAnswerMetricsModel(BaseModel):
+    """Snapshot of the precomputed answer cache"""
+
+    entries: int = Field(description="Questions with a precomputed answer")
+    hits: int = Field(description="Questions answered from the cache")
+    misses: int = Field(description="Questions that ran the workflow")
+    builds: int = Field(description="Rebuilds since startup")
+    failures: int = Field(description="Questions the last rebuild found no answer for")
+    build_seconds: Optional[float] = Field(
+        description="Duration of the last rebuild, None before the first one"
+    )
+    data_version: Optional[str] = Field(
+        description="data_imports version of the last rebuild"
+    )
+
+
+class SpeculationMetricsModel(BaseModel):
+    """Time-to-first-token saved by running guardrail and query writer together"""
+
+    runs: int = Field(description="Speculative guardrail runs")
+    committed: int = Field(description="Runs the guardrail allowed")
+    cancelled: int = Field(description="Runs the guardrail blocked")
+    speculative_queries: int = Field(
+        description="Read-only queries executed before the guardrail verdict"
+    )
+    saved_last: float = Field(description="Seconds saved by the most recent run")
+    saved_avg: float = Field(description="Mean seconds saved per committed run")
+
+
+class StageConcurrencyMetricsModel(BaseModel):
+    """Slots and queueing for one concurrency-limited workflow stage"""
+
+    stage: str = Field(description="Stage name")
+    limit: int = Field(description="Configured concurrent calls")
+    in_flight: int = Field(description="Calls currently holding a slot")
+    queued: int = Field(description="Calls currently waiting for a slot")
+    acquire_count: int = Field(description="Slots granted since startup")
+    timeouts: int = Field(description="Calls that gave up waiting for a slot")
+    queue_wait_avg: float = Field(description="Mean wait for a slot in seconds")
+    queue_wait_max: float = Field(description="Longest wait for a slot in seconds")
+
+
+class LlmLatencyMetricsModel(BaseModel):
+    """Model call latency, hedging and timeouts for one workflow node"""
+
+    node: str = Field(description="Workflow node")
+    calls: int = Field(description="Model calls since startup")
+    samples: int = Field(description="Latencies in the percentile window")
+    p50: Optional[float] = Field(
+        description="Median seconds to the first token or answer"
+    )
+    p99: Optional[float] = Field(
+        description="99th percentile seconds to the first token or answer"
+    )
+    hedge_delay: Optional[float] = Field(
+        description="Seconds before a hedged call is sent, None until enough samples"
+    )
+    hedged: int = Field(description="Calls that also went to the alternate model")
+    hedge_wins: int = Field(description="Hedged calls answered by the alternate model")
+    timeouts: int = Field(description="Calls that ran past the node's latency budget")
+
+
+class ChatRequestModel(BaseModel):
+    """Request body for the streaming chat API"""
+
+    prompt: str = Field(min_length=1, description="The user's question")
+    session_id: Optional[str] = Field(
+        default=None,
+        description="Conversation to continue, a new one is started if omitted",
+    )
+
+
+class QueryPlanEstimateModel(BaseModel):
+    """Planner estimate for a query, read from EXPLAIN before it runs"""
+
+    total_cost: float = Field(description="Estimated total cost of the plan")
+    max_rows: float = Field(description="Largest row estimate of any plan node")
+
+
+class IngestionReportModel(BaseModel):
+    """Outcome of one incremental CSV import"""
+
+    version: int = Field(description="Data version recorded for this import")
+    rows_read: int = Field(description="Records read from the CSV")
+    rows_inserted: int = Field(description="Requests that were not loaded before")
+    rows_updated: int = Field(description="Loaded requests whose fields changed")
+    max_created_date: Optional[datetime.datetime] = Field(
+        description="Newest created_date in the CSV"
+    )
+    ingest_seconds: float = Field(description="Time spent streaming and upserting")
+    total_seconds: float = Field(description="Time including the rollup refresh")
+
+
+class GuardrailPrefilterVerdictModel(BaseModel):
+    """Decision of the local guardrail pre-filter"""
+
+    decision: Literal["allow", "malicious", "irrelevant", "unsure"] = Field(
+        description="Local decision, unsure defers to the guardrail LLM"
+    )
+    rule: str = Field(description="Rule that produced the decision")
+    reason: str = Field(default="", description="Reason shown for a block")
+
+
+class GuardrailPrefilterMetricsModel(BaseModel):
+    """Local guardrail decisions and how often the LLM agreed with them"""
+
+    allowed: int = Field(description="Prompts allowed without the LLM")
+    malicious: int = Field(description="Prompts blocked locally as malicious")
+    irrelevant: int = Field(description="Prompts blocked locally as irrelevant")
+    unsure: int = Field(description="Prompts deferred to the LLM")
+    audited: int = Field(description="Local decisions also checked by the LLM")
+    agreement_rate: dict[str, float] = Field(
+        description="Share of audited decisions the LLM agreed with, per decision"
+    )
+    unsure_outcomes: dict[str, int] = Field(
+        description="LLM decisions for prompts deferred to it"
+    )
+
+
+class SnapshotManifestModel(BaseModel):
+    """Current Parquet snapshot of service_requests for the DuckDB backend"""
+
+    build_id: str = Field(description="Directory of this build under the snapshot path")
+    source: str = Field(description="CSV path or 'postgres' the snapshot was built from")
+    data_version: Optional[int] = Field(
+        default=None, description="data_imports version when built from Postgres"
+    )
+    rows: int = Field(description="Requests in the snapshot")
+    max_created_date: Optional[datetime.datetime] = Field(
+        description="Newest created_date in the snapshot"
+    )
+    built_at: datetime.datetime = Field(description="When the build finished")
+    build_seconds: float = Field(description="Time spent writing the snapshot")
@@ -0,0 +1,237 @@
+import re
+
+from typing_extensions import Optional
+
+from settings import Settings
+
+SCHEMA_TABLE = "service_requests"
+
+# Always part of the query writer prompt: the NOT NULL columns plus the ones
+# most questions filter or group on.
+CORE_COLUMNS = (
+    "unique_key",
+    "created_date",
+    "closed_date",
+    "agency",
+    "agency_name",
+    "complaint_type",
+    "descriptor",
+    "incident_zip",
+    "status",
+    "borough",
+)
+
+# Column name parts too generic to select a column on their own.
+GENERIC_TOKENS = frozenset(
+    {"code", "date", "name", "not", "number", "or", "type", "up"}
+)
+
+# Question words that point at columns without naming them.
+SYNONYMS = {
+    "geocoded": ("latitude", "longitude"),
+    "geocoding": ("latitude", "longitude"),
+    "lat": ("latitude",),
+    "map": ("latitude", "longitude"),
+    "resolved": ("resolution_description", "resolution_action_updated_date"),
+    "overdue": ("due_date",),
+    "late": ("due_date",),
+    "deadline": ("due_date",),
+    "car": ("vehicle_type",),
+    "cab": ("taxi_company_borough", "taxi_pick_up_location"),
+    "highway": (
+        "bridge_highway_name",
+        "bridge_highway_direction",
+        "bridge_highway_segment",
+    ),
+    "neighborhood": ("community_board",),
+    "district": ("community_board",),
+}
+
+COLUMN_PATTERN = re.compile(
+    r"^\s+(\w+)\s+([A-Z]+(?:\(\d+(?:,\s*\d+)?\))?)(\s+NOT NULL)?,?$"
+)
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+TABLE_ROW_PATTERN = re.compile(r"^\|\s*(\w+)\s*\|[^|]*\|\s*(.*?)\s*\|$")
+KEYWORDS_PATTERN = re.compile(r"^\*\*Keywords\*\*:\s*(.*)$", re.MULTILINE)
+
+SCHEMA_SECTION = "## DATABASE SCHEMA"
+PATTERNS_SECTION = "## QUERY PATTERNS"
+
+SCHEMA_NOTE = (
+    "The columns below are always available. Other columns relevant to the "
+    "question, and the query patterns that fit it, follow this prompt as "
+    "reference."
+)
+
+
+def stem(word: str) -> str:
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+
+    return word
+
+
+def words(text: str) -> set[str]:
+    return {stem(word) for word in WORD_PATTERN.findall(text.lower()) if len(word) > 1}
+
+
+def read_columns(schema_path: str) -> dict[str, str]:
+    """Column names and types of service_requests, in table order.
+
+    Args:
+        schema_path (str): db/init/01-schema.sql
+
+    Returns:
+        dict[str, str]: Column name to SQL type, with NOT NULL when declared
+    """
+    with open(schema_path) as f:
+        schema = f.read()
+
+    body = re.search(rf"CREATE TABLE {SCHEMA_TABLE} \((.*?)\n\)", schema, re.DOTALL)
+
+    if body is None:
+        raise ValueError(f"No CREATE TABLE {SCHEMA_TABLE} in {schema_path}")
+
+    columns = {}
+
+    for line in body.group(1).splitlines():
+        match = COLUMN_PATTERN.match(line)
+
+        if match:
+            name, type_, not_null = match.groups()
+            columns[name.lower()] = type_ + (" NOT NULL" if not_null else "")
+
+    return columns
+
+
+def split_sections(prompt: str, level: str) -> list[str]:
+    # Each section keeps its heading; text before the first one is its own.
+    return re.split(rf"(?m)^(?={re.escape(level)} )", prompt)
+
+
+class PromptContextIndex:
+    """Query writer prompt split into a fixed prefix and per-question context.
+
+    The prefix keeps every rule and example and only the core columns, so it
+    is byte-identical across requests and provider prompt caching can reuse
+    it. The remaining columns, indexed from 01-schema.sql, and the query
+    patterns are added after it when the question mentions them.
+    """
+
+    def __init__(self, settings: Settings, prompt: str) -> None:
+        self.settings = settings
+
+        types = read_columns(settings.schema_sql_path)
+        descriptions: dict[str, str] = {}
+        prefix_sections = []
+        self.patterns: list[tuple[set[str], set[str], str]] = []
+
+        for section in split_sections(prompt, "##"):
+            if section.startswith(SCHEMA_SECTION):
+                lines = []
+
+                for line in section.splitlines(keepends=True):
+                    match = TABLE_ROW_PATTERN.match(line.strip())
+
+                    if match and match.group(1) in types:
+                        descriptions[match.group(1)] = match.group(2)
+
+                        if match.group(1) not in CORE_COLUMNS:
+                            continue
+
+                    lines.append(line)
+
+                    if line.startswith(SCHEMA_SECTION):
+                        lines.append(f"\n{SCHEMA_NOTE}\n")
+
+                prefix_sections.append("".join(lines))
+
+            elif section.startswith(PATTERNS_SECTION):
+                for pattern in split_sections(section, "###")[1:]:
+                    keywords = KEYWORDS_PATTERN.search(pattern)
+                    phrases = (
+                        keywords.group(1) if keywords else pattern.splitlines()[0]
+                    )
+                    # A pattern also fits when a column it uses was selected.
+                    self.patterns.append(
+                        (
+                            words(phrases),
+                            {name for name in types if name in pattern},
+                            pattern.strip().removesuffix("---").strip(),
+                        )
+                    )
+
+            else:
+                prefix_sections.append(section)
+
+        self.prefix = "".join(prefix_sections)
+
+        # Inverted index from question word to the columns it selects.
+        self.index: dict[str, set[str]] = {}
+        self.columns = {
+            name: f"- {name} {type_}"
+            + (f": {descriptions[name]}" if name in descriptions else "")
+            for name, type_ in types.items()
+            if name not in CORE_COLUMNS
+        }
+
+        # Words naming a core column select nothing more: "zip" is
+        # incident_zip, not school_zip.
+        core_tokens = words(" ".join(CORE_COLUMNS).replace("_", " "))
+
+        for name in self.columns:
+            for token in words(name.replace("_", " ")) - GENERIC_TOKENS - core_tokens:
+                self.index.setdefault(token, set()).add(name)
+
+        for word, columns in SYNONYMS.items():
+            self.index.setdefault(stem(word), set()).update(
+                column for column in columns if column in self.columns
+            )
+
+    def select_columns(self, question: str) -> list[str]:
+        selected: set[str] = set()
+
+        for word in words(question):
+            selected |= self.index.get(word, set())
+
+        # Table order, so the same question always renders the same bytes.
+        return [name for name in self.columns if name in selected]
+
+    def select_patterns(self, question: str, columns: list[str]) -> list[str]:
+        question_words = words(question)
+
+        return [
+            pattern
+            for keywords, pattern_columns, pattern in self.patterns
+            if keywords & question_words or pattern_columns.intersection(columns)
+        ]
+
+    def context(self, question: str) -> Optional[str]:
+        """Schema and pattern sections relevant to one question.
+
+        Args:
+            question (str): The latest user question
+
+        Returns:
+            Optional[str]: Markdown sent after the prefix, None if nothing matched
+        """
+        sections = []
+        columns = self.select_columns(question)
+
+        if columns:
+            sections.append(
+                "## MORE COLUMNS\n\n"
+                f"Also in {SCHEMA_TABLE}:\n\n"
+                + "\n".join(self.columns[name] for name in columns)
+                + "\n"
+            )
+
+        patterns = self.select_patterns(question, columns)
+
+        if patterns:
+            sections.append(f"{PATTERNS_SECTION}\n\n" + "\n\n".join(patterns) + "\n")
+
+        return "\n".join(sections) if sections else None
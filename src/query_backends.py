@@ -0,0 +1,263 @@
+import asyncio
+import json
+import os
+from contextlib import AsyncExitStack
+
+import sqlglot.expressions as exp
+from typing_extensions import Any, Optional, Protocol
+
+from concurrency import StageLimiter
+from database import DatabasePool
+from models import SnapshotManifestModel
+from query_cost_gate import QueryCostGate
+from result_shaping import ResultAccumulator, ResultShaper
+from rollups import RollupRouter
+from settings import Settings
+from snapshot import (
+    MANIFEST_FILE,
+    connect_duckdb,
+    parquet_glob,
+    quote_literal,
+    read_manifest,
+)
+from tracing import Span, Tracer
+
+
+class SnapshotUnavailableError(Exception):
+    """Raised when the DuckDB backend has no Parquet snapshot to read"""
+
+
+class QueryBackend(Protocol):
+    name: str
+
+    def cache_namespace(self) -> str:
+        """Prefix for result cache keys, which changes when the data does."""
+        ...
+
+    async def execute(self, expression: exp.Expression) -> tuple[dict, Optional[str]]:
+        """Run a parsed read-only query.
+
+        Args:
+            expression (exp.Expression): The query, parsed as PostgreSQL
+
+        Returns:
+            tuple[dict, Optional[str]]: Shaped result and an optional rewrite note
+        """
+        ...
+
+    async def close(self) -> None: ...
+
+
+def record_fetch(span: Span, result: dict, streamed: bool) -> None:
+    span.set(
+        result_bytes=len(json.dumps(result)),
+        streamed=streamed,
+        rows_read=result.get("summary", {}).get("total_rows", result["row_count"]),
+        row_count=result["row_count"],
+        truncated=result.get("truncated", False),
+    )
+
+
+class PostgresBackend:
+    name = "postgres"
+
+    def __init__(
+        self,
+        settings: Settings,
+        tracer: Tracer,
+        limiter: StageLimiter,
+        database: DatabasePool,
+        result_shaper: ResultShaper,
+        cost_gate: QueryCostGate,
+        rollup_router: RollupRouter,
+    ) -> None:
+        self.settings = settings
+        self.tracer = tracer
+        self.limiter = limiter
+        self.database = database
+        self.result_shaper = result_shaper
+        self.cost_gate = cost_gate
+        self.rollup_router = rollup_router
+
+    def cache_namespace(self) -> str:
+        # The result cache is invalidated on import by data version instead.
+        return ""
+
+    async def execute(self, expression: exp.Expression) -> tuple[dict, Optional[str]]:
+        rewrite_note = None
+
+        async with AsyncExitStack() as stack:
+            with self.tracer.span("db.acquire"):
+                await stack.enter_async_context(self.limiter.slot())
+                conn = await stack.enter_async_context(self.database.acquire())
+
+            async with conn.transaction(readonly=True):
+                # Generated queries get a tighter timeout than the pool's
+                # default; SET LOCAL ends with the transaction.
+                await conn.execute(
+                    "SET LOCAL statement_timeout = "
+                    f"{int(self.settings.query_statement_timeout * 1000)}"
+                )
+
+                if (
+                    self.settings.rollup_routing_enabled
+                    and await self.rollup_router.is_available(conn)
+                ):
+                    with self.tracer.span("db.route") as span:
+                        routed = self.rollup_router.route(expression)
+                        span.set(routed=routed is not None)
+
+                    if routed is not None:
+                        expression = routed
+
+                        if self.settings.debug:
+                            print(expression.sql(dialect="postgres"))
+
+                if self.settings.query_cost_gate_enabled:
+                    with self.tracer.span("db.plan") as span:
+                        expression, rewrite_note = await self.cost_gate.check(
+                            conn, expression
+                        )
+                        span.set(rewritten=rewrite_note is not None)
+
+                with self.tracer.span("db.fetch", backend=self.name) as span:
+                    result = await self.result_shaper.execute(conn, expression)
+                    record_fetch(span, result, self.settings.result_streaming_enabled)
+
+        if self.settings.debug:
+            print(self.limiter.metrics())
+            print(self.database.metrics())
+
+        return result, rewrite_note
+
+    async def close(self) -> None:
+        await self.database.close()
+
+
+class DuckDbBackend:
+    """Runs queries in-process on the Parquet snapshot built by snapshot.py"""
+
+    name = "duckdb"
+
+    def __init__(
+        self,
+        settings: Settings,
+        tracer: Tracer,
+        limiter: StageLimiter,
+        result_shaper: ResultShaper,
+    ) -> None:
+        self.settings = settings
+        self.tracer = tracer
+        self.limiter = limiter
+        self.result_shaper = result_shaper
+
+        self.manifest: Optional[SnapshotManifestModel] = None
+        self.manifest_mtime = 0
+        self.connection: Any = None
+        self.connection_build_id = ""
+
+    def current_manifest(self) -> Optional[SnapshotManifestModel]:
+        # A stat per query is enough to notice a rebuilt snapshot.
+        try:
+            mtime = os.stat(
+                os.path.join(self.settings.duckdb_snapshot_path, MANIFEST_FILE)
+            ).st_mtime_ns
+        except FileNotFoundError:
+            self.manifest = None
+            return None
+
+        if mtime != self.manifest_mtime:
+            self.manifest = read_manifest(self.settings.duckdb_snapshot_path)
+            self.manifest_mtime = mtime
+
+        return self.manifest
+
+    def cache_namespace(self) -> str:
+        manifest = self.current_manifest()
+
+        return f"{self.name}:{manifest.build_id if manifest else ''}:"
+
+    def connect(self) -> Any:
+        manifest = self.current_manifest()
+
+        if manifest is None:
+            raise SnapshotUnavailableError(
+                f"No snapshot in {self.settings.duckdb_snapshot_path}, "
+                "build one with src/snapshot.py"
+            )
+
+        if self.connection is not None and self.connection_build_id == manifest.build_id:
+            return self.connection
+
+        directory = os.path.abspath(
+            os.path.join(self.settings.duckdb_snapshot_path, manifest.build_id)
+        )
+        connection = connect_duckdb(self.settings)
+
+        connection.execute(
+            "CREATE VIEW service_requests AS SELECT * FROM read_parquet("
+            f"{quote_literal(parquet_glob(directory))}, hive_partitioning = false)"
+        )
+
+        # Generated SQL may read the snapshot and nothing else on disk.
+        connection.execute(f"SET allowed_directories = [{quote_literal(directory)}]")
+        connection.execute("SET enable_external_access = false")
+        connection.execute("SET lock_configuration = true")
+
+        # Cursors still running on the previous build keep its connection
+        # alive until they finish.
+        self.connection = connection
+        self.connection_build_id = manifest.build_id
+
+        return connection
+
+    def fetch(self, cursor: Any, sql: str) -> dict:
+        cursor.execute(sql)
+
+        accumulator = ResultAccumulator(
+            self.settings, [column[0] for column in cursor.description]
+        )
+
+        while rows := cursor.fetchmany(self.settings.result_prefetch_rows):
+            if not all(accumulator.add(row) for row in rows):
+                break
+
+        return self.result_shaper.shape(accumulator)
+
+    async def execute(self, expression: exp.Expression) -> tuple[dict, Optional[str]]:
+        async with AsyncExitStack() as stack:
+            with self.tracer.span("db.acquire", backend=self.name):
+                await stack.enter_async_context(self.limiter.slot())
+                cursor = self.connect().cursor()
+                stack.callback(cursor.close)
+
+            with self.tracer.span("db.fetch", backend=self.name) as span:
+                sql = expression.sql(dialect="duckdb")
+                span.set(build_id=self.connection_build_id)
+
+                if self.settings.debug:
+                    print(sql)
+
+                fetch = asyncio.ensure_future(asyncio.to_thread(self.fetch, cursor, sql))
+
+                try:
+                    async with asyncio.timeout(self.settings.query_statement_timeout):
+                        result = await asyncio.shield(fetch)
+                except (TimeoutError, asyncio.CancelledError):
+                    # The query keeps running in its thread until interrupted.
+                    cursor.interrupt()
+                    await asyncio.gather(fetch, return_exceptions=True)
+                    raise
+
+                record_fetch(span, result, streamed=True)
+
+        if self.settings.debug:
+            print(self.limiter.metrics())
+
+        return result, None
+
+    async def close(self) -> None:
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+            self.connection_build_id = ""
@@ -0,0 +1,120 @@
+import json
+
+import asyncpg
+import sqlglot.expressions as exp
+from sqlglot.optimizer.scope import traverse_scope
+from typing_extensions import Optional
+
+from models import QueryPlanEstimateModel
+from result_shaping import ResultShaper
+from settings import Settings
+
+
+class QueryRejectedError(Exception):
+    """Raised when a query's estimated plan is over budget even after rewrites"""
+
+
+class QueryCostGate:
+    def __init__(self, settings: Settings, result_shaper: ResultShaper) -> None:
+        self.settings = settings
+        self.result_shaper = result_shaper
+
+    async def estimate(
+        self, conn: asyncpg.Connection, expression: exp.Expression
+    ) -> QueryPlanEstimateModel:
+        # Estimate what will actually run: the row-capped query gets LIMIT
+        # pushdown, while a streamed query is read to the end.
+        plan_json = await conn.fetchval(
+            f"EXPLAIN (FORMAT JSON) {self.result_shaper.executed_query(expression)}"
+        )
+        plan = json.loads(plan_json)[0]["Plan"]
+
+        max_rows = 0.0
+        nodes = [plan]
+
+        while nodes:
+            node = nodes.pop()
+            max_rows = max(max_rows, node.get("Plan Rows", 0))
+            nodes.extend(node.get("Plans", []))
+
+        return QueryPlanEstimateModel(total_cost=plan["Total Cost"], max_rows=max_rows)
+
+    def is_within_budget(self, estimate: QueryPlanEstimateModel) -> bool:
+        return (
+            estimate.total_cost <= self.settings.query_max_cost
+            and estimate.max_rows <= self.settings.query_max_plan_rows
+        )
+
+    def restrict_date_range(self, expression: exp.Expression) -> Optional[exp.Expression]:
+        expression = expression.copy()
+        rewritten = False
+
+        for scope in traverse_scope(expression):
+            if not isinstance(scope.expression, exp.Select):
+                continue
+
+            where = scope.expression.args.get("where")
+
+            for name, (_, source) in scope.selected_sources.items():
+                if not (
+                    isinstance(source, exp.Table) and source.name == "service_requests"
+                ):
+                    continue
+
+                if where and any(
+                    column.name == "created_date" and column.table in (name, "")
+                    for column in where.find_all(exp.Column)
+                ):
+                    continue
+
+                scope.expression.where(
+                    exp.condition(
+                        f"{name}.created_date >= NOW() - INTERVAL "
+                        f"'{self.settings.query_date_range_days} days'"
+                    ),
+                    copy=False,
+                )
+                rewritten = True
+
+        return expression if rewritten else None
+
+    async def check(
+        self, conn: asyncpg.Connection, expression: exp.Expression
+    ) -> tuple[exp.Expression, Optional[str]]:
+        """Gate a query on its EXPLAIN estimate, rewriting it if that helps.
+
+        Args:
+            conn (asyncpg.Connection): Connection the query will run on
+            expression (exp.Expression): The parsed user query
+
+        Returns:
+            tuple[exp.Expression, Optional[str]]: The query to run and a note
+                describing any rewrite applied to it
+
+        Raises:
+            QueryRejectedError: If no rewrite brings the plan within budget
+        """
+        estimate = await self.estimate(conn, expression)
+
+        if self.is_within_budget(estimate):
+            return expression, None
+
+        restricted = self.restrict_date_range(expression)
+
+        if restricted is not None:
+            restricted_estimate = await self.estimate(conn, restricted)
+
+            if self.is_within_budget(restricted_estimate):
+                return restricted, (
+                    f"Restricted to the last {self.settings.query_date_range_days} "
+                    "days of created_date to stay within the query cost budget."
+                )
+
+        raise QueryRejectedError(
+            f"Query rejected before execution: estimated cost "
+            f"{estimate.total_cost:,.0f} (limit {self.settings.query_max_cost:,.0f}) "
+            f"and up to {estimate.max_rows:,.0f} intermediate rows "
+            f"(limit {self.settings.query_max_plan_rows:,.0f}). Rewrite it to be "
+            "cheaper: filter on indexed columns such as created_date, avoid joins "
+            "without join conditions, and aggregate instead of listing rows."
+        )
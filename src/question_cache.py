@@ -0,0 +1,139 @@
+import math
+import re
+from collections import Counter, OrderedDict, defaultdict
+
+from typing_extensions import Optional
+
+from models import QuestionCacheMatchModel, QuestionCacheMetricsModel
+from settings import Settings
+
+STOPWORDS = frozenset(
+    {
+        "a", "an", "and", "are", "as", "at", "be", "by", "can", "could", "do",
+        "does", "for", "from", "give", "how", "i", "in", "is", "it", "list",
+        "me", "of", "on", "or", "please", "show", "tell", "that", "the",
+        "there", "this", "to", "was", "were", "what", "which", "who", "with",
+        "would", "you",
+    }
+)  # fmt: skip
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+class QuestionCache:
+    def __init__(self, settings: Settings) -> None:
+        self.settings = settings
+
+        self.entries: OrderedDict[str, str] = OrderedDict()
+        self.vectors: dict[str, Counter[str]] = {}
+        self.norms: dict[str, float] = {}
+        self.index: defaultdict[frozenset[str], set[str]] = defaultdict(set)
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(question: str) -> str:
+        tokens = TOKEN_PATTERN.findall(question.lower())
+
+        return " ".join(token for token in tokens if token not in STOPWORDS)
+
+    @staticmethod
+    def vectorize(normalized: str) -> Counter[str]:
+        words = normalized.split()
+
+        # Candidates share every word, so bigrams are what tell apart questions
+        # that pair them up differently ("noise in Queens, heat in Brooklyn").
+        return Counter(words + [f"{a} {b}" for a, b in zip(words, words[1:])])
+
+    @staticmethod
+    def content_words(normalized: str) -> frozenset[str]:
+        return frozenset(normalized.split())
+
+    def match(self, question: str) -> Optional[QuestionCacheMatchModel]:
+        normalized = self.normalize(question)
+
+        if normalized in self.entries:
+            self.entries.move_to_end(normalized)
+            self.hits += 1
+
+            return QuestionCacheMatchModel(
+                question=normalized,
+                query=self.entries[normalized],
+                confidence=1.0,
+            )
+
+        vector = self.vectorize(normalized)
+        norm = math.sqrt(sum(count * count for count in vector.values()))
+
+        # Any other word can flip the answer ("excluding Brooklyn", "not
+        # closed", elevator vs pothole), so candidates must use exactly the
+        # same words. The similarity only ranks them by word order.
+        candidates = self.index.get(self.content_words(normalized), ())
+
+        best: Optional[QuestionCacheMatchModel] = None
+
+        for candidate in candidates:
+            dot = sum(
+                count * self.vectors[candidate].get(token, 0)
+                for token, count in vector.items()
+            )
+            confidence = dot / (norm * self.norms[candidate]) if norm else 0.0
+
+            if best is None or confidence > best.confidence:
+                best = QuestionCacheMatchModel(
+                    question=candidate,
+                    query=self.entries[candidate],
+                    confidence=confidence,
+                )
+
+        if best is None or best.confidence < self.settings.question_cache_threshold:
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(best.question)
+        self.hits += 1
+
+        return best
+
+    def put(self, question: str, query: str) -> None:
+        normalized = self.normalize(question)
+
+        if not normalized:
+            return
+
+        self.remove(normalized)
+
+        vector = self.vectorize(normalized)
+
+        self.entries[normalized] = query
+        self.vectors[normalized] = vector
+        self.norms[normalized] = math.sqrt(
+            sum(count * count for count in vector.values())
+        )
+
+        self.index[self.content_words(normalized)].add(normalized)
+
+        while len(self.entries) > self.settings.question_cache_max_entries:
+            self.remove(next(iter(self.entries)))
+
+    def remove(self, normalized: str) -> None:
+        if self.entries.pop(normalized, None) is None:
+            return
+
+        words = self.content_words(normalized)
+        self.index[words].discard(normalized)
+
+        if not self.index[words]:
+            del self.index[words]
+
+        del self.vectors[normalized]
+        del self.norms[normalized]
+
+    def metrics(self) -> QuestionCacheMetricsModel:
+        return QuestionCacheMetricsModel(
+            entries=len(self.entries),
+            hits=self.hits,
+            misses=self.misses,
+            threshold=self.settings.question_cache_threshold,
+        )
@@ -0,0 +1,152 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+
+import asyncpg
+import sqlglot.expressions as exp
+from sqlglot.optimizer.normalize_identifiers import normalize_identifiers
+from typing_extensions import Optional
+
+from database import DatabasePool
+from models import QueryResultCacheEntryModel, QueryResultCacheMetricsModel
+from settings import Settings
+
+# Bumped by every import that changed service_requests, see ingest.py.
+DATA_VERSION_QUERY = """
+SELECT COALESCE(MAX(version), 0)::text
+FROM data_imports
+WHERE rows_inserted + rows_updated > 0
+"""
+
+
+class QueryResultCache:
+    def __init__(self, settings: Settings, database: DatabasePool) -> None:
+        self.settings = settings
+        self.database = database
+
+        self.entries: OrderedDict[str, QueryResultCacheEntryModel] = OrderedDict()
+        self.size_bytes = 0
+
+        self.data_version: Optional[str] = None
+        self.data_version_checked_at = 0.0
+        self.data_version_lock = asyncio.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def canonicalize(expression: exp.Expression) -> str:
+        expression = normalize_identifiers(expression.copy(), dialect="postgres")
+
+        # Table aliases are free to rename, so number them in order of first
+        # appearance and rewrite every column qualifier that points at them.
+        aliases: dict[str, str] = {}
+
+        for table in expression.find_all(exp.Table):
+            alias = table.alias
+
+            if alias:
+                aliases.setdefault(alias, f"_t{len(aliases)}")
+                table.set(
+                    "alias",
+                    exp.TableAlias(this=exp.to_identifier(aliases[alias])),
+                )
+
+        for column in expression.find_all(exp.Column):
+            if column.table in aliases:
+                column.set("table", exp.to_identifier(aliases[column.table]))
+
+        return expression.sql(dialect="postgres", normalize=True, comments=False)
+
+    async def validate(self, force: bool = False) -> None:
+        if (
+            not force
+            and time.monotonic() - self.data_version_checked_at
+            < self.settings.result_cache_version_check_interval
+        ):
+            return
+
+        async with self.data_version_lock:
+            if (
+                not force
+                and time.monotonic() - self.data_version_checked_at
+                < self.settings.result_cache_version_check_interval
+            ):
+                return
+
+            async with self.database.acquire() as conn:
+                try:
+                    data_version = await conn.fetchval(DATA_VERSION_QUERY)
+                except asyncpg.UndefinedTableError:
+                    # Databases created before data_imports existed have
+                    # never been imported into incrementally.
+                    data_version = "0"
+
+            if self.data_version is not None and data_version != self.data_version:
+                self.clear()
+                self.invalidations += 1
+
+            self.data_version = data_version
+            self.data_version_checked_at = time.monotonic()
+
+    def get(self, key: str) -> Optional[dict]:
+        entry = self.entries.get(key)
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        if time.monotonic() - entry.created_at > self.settings.result_cache_ttl:
+            self.remove(key)
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+
+        return entry.result
+
+    def put(self, key: str, result: dict) -> None:
+        size_bytes = len(json.dumps(result, default=str))
+
+        if size_bytes > self.settings.result_cache_max_bytes:
+            return
+
+        self.remove(key)
+
+        self.entries[key] = QueryResultCacheEntryModel(
+            result=result,
+            size_bytes=size_bytes,
+            created_at=time.monotonic(),
+        )
+        self.size_bytes += size_bytes
+
+        while self.size_bytes > self.settings.result_cache_max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size_bytes -= evicted.size_bytes
+            self.evictions += 1
+
+    def remove(self, key: str) -> None:
+        entry = self.entries.pop(key, None)
+
+        if entry is not None:
+            self.size_bytes -= entry.size_bytes
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.size_bytes = 0
+
+    def metrics(self) -> QueryResultCacheMetricsModel:
+        return QueryResultCacheMetricsModel(
+            entries=len(self.entries),
+            size_bytes=self.size_bytes,
+            max_bytes=self.settings.result_cache_max_bytes,
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+            invalidations=self.invalidations,
+            data_version=self.data_version,
+        )
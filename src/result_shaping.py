@@ -0,0 +1,429 @@
+import datetime
+import decimal
+import json
+import random
+from collections import Counter
+
+import asyncpg
+import sqlglot.expressions as exp
+from typing_extensions import Any, Optional, Sequence
+
+from settings import Settings
+
+ORDERABLE_TYPES = (
+    int,
+    float,
+    decimal.Decimal,
+    str,
+    datetime.date,
+    datetime.datetime,
+    datetime.time,
+    datetime.timedelta,
+)
+
+
+NUMERIC_TYPES = (int, float, decimal.Decimal)
+
+
+def quote_identifier(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def to_json_value(value: Any) -> Any:
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+
+    if isinstance(value, (datetime.timedelta, bytes)):
+        return str(value)
+
+    return value
+
+
+class ColumnSummary:
+    """Running statistics for one result column in bounded memory"""
+
+    def __init__(self, top_values: int, reservoir_size: int, seed: int) -> None:
+        self.top_values = top_values
+        self.reservoir_size = reservoir_size
+
+        self.kind: Optional[str] = None
+        self.count = 0
+        self.nulls = 0
+        self.minimum: Any = None
+        self.maximum: Any = None
+        self.total: Any = None
+
+        # Misra-Gries heavy hitters: at most `capacity` tracked values, with
+        # counts that are exact until the first decrement, lower bounds after.
+        self.capacity = max(top_values * 20, 100)
+        self.frequent: Counter = Counter()
+        self.decremented = False
+
+        # Reservoir sample of numeric values for the histogram.
+        self.reservoir: list[float] = []
+        self.numeric_seen = 0
+        self.random = random.Random(seed)
+
+    @staticmethod
+    def kind_of(value: Any) -> str:
+        if isinstance(value, bool):
+            return "boolean"
+
+        if isinstance(value, NUMERIC_TYPES):
+            return "numeric"
+
+        if isinstance(value, datetime.timedelta):
+            return "interval"
+
+        if isinstance(value, str):
+            return "text"
+
+        if isinstance(value, ORDERABLE_TYPES):
+            return "orderable"
+
+        return "other"
+
+    def add(self, value: Any) -> None:
+        if value is None:
+            self.nulls += 1
+            return
+
+        self.count += 1
+
+        # A result column has one type, so it is classified once.
+        if self.kind is None:
+            self.kind = self.kind_of(value)
+
+        kind = self.kind
+
+        if kind not in ("boolean", "other"):
+            if self.minimum is None or value < self.minimum:
+                self.minimum = value
+
+            if self.maximum is None or value > self.maximum:
+                self.maximum = value
+
+        if kind == "numeric":
+            self.total = value if self.total is None else self.total + value
+            self.numeric_seen += 1
+
+            if len(self.reservoir) < self.reservoir_size:
+                self.reservoir.append(float(value))
+            else:
+                slot = int(self.random.random() * self.numeric_seen)
+
+                if slot < self.reservoir_size:
+                    self.reservoir[slot] = float(value)
+
+        elif kind == "interval":
+            self.total = value if self.total is None else self.total + value
+
+        elif kind in ("text", "boolean"):
+            if value in self.frequent or len(self.frequent) < self.capacity:
+                self.frequent[value] += 1
+            else:
+                # Happens at most once per `capacity` rows, so O(1) amortized.
+                self.frequent.subtract(self.frequent.keys())
+                self.frequent = +self.frequent
+                self.decremented = True
+
+    def histogram(self, bins: int) -> list[dict]:
+        low, high = self.minimum, self.maximum
+
+        if not self.reservoir or low is None or high is None or low == high:
+            return []
+
+        low, high = float(low), float(high)
+        width = (high - low) / bins
+        counts = [0] * bins
+
+        for value in self.reservoir:
+            counts[min(int((value - low) / width), bins - 1)] += 1
+
+        # Scale reservoir counts back up to the number of values seen.
+        scale = self.numeric_seen / len(self.reservoir)
+
+        return [
+            {
+                "lower": low + i * width,
+                "upper": low + (i + 1) * width,
+                "count": round(count * scale),
+            }
+            for i, count in enumerate(counts)
+        ]
+
+    def to_dict(self, bins: int) -> dict:
+        summary: dict = {"count": self.count, "nulls": self.nulls}
+
+        if self.minimum is not None:
+            summary["range"] = {
+                "min": to_json_value(self.minimum),
+                "max": to_json_value(self.maximum),
+            }
+
+        if self.total is not None:
+            summary["sum"] = to_json_value(self.total)
+
+            if not isinstance(self.total, datetime.timedelta):
+                summary["mean"] = float(self.total) / self.count
+
+        histogram = self.histogram(bins)
+
+        if histogram:
+            summary["histogram"] = histogram
+
+        if self.frequent:
+            summary["top_values"] = [
+                {"value": value, "count": count}
+                for value, count in self.frequent.most_common(self.top_values)
+            ]
+
+            if self.decremented:
+                summary["top_values_approximate"] = True
+
+        return summary
+
+
+class ResultAccumulator:
+    """First rows of a result plus running summaries over all of its rows"""
+
+    def __init__(self, settings: Settings, columns: list[str]) -> None:
+        self.settings = settings
+        self.columns = columns
+
+        self.rows: list[Sequence[Any]] = []
+        self.summaries = [
+            ColumnSummary(
+                settings.result_top_values,
+                settings.result_histogram_sample_size,
+                seed=i,
+            )
+            for i in range(len(columns))
+        ]
+        self.total_rows = 0
+        self.partial = False
+
+    def add(self, row: Sequence[Any]) -> bool:
+        """Feed one row; returns False once result_stream_max_rows were read."""
+        if self.total_rows == self.settings.result_stream_max_rows:
+            self.partial = True
+            return False
+
+        self.total_rows += 1
+
+        if len(self.rows) < self.settings.result_max_rows:
+            self.rows.append(row)
+
+        for summary, value in zip(self.summaries, row):
+            summary.add(value)
+
+        return True
+
+
+class ResultShaper:
+    def __init__(self, settings: Settings) -> None:
+        self.settings = settings
+
+    def capped_query(self, expression: exp.Expression) -> str:
+        # One extra row tells a result that fits exactly from a truncated one.
+        return (
+            exp.select("*")
+            .from_(expression.subquery("_result"))
+            .limit(self.settings.result_max_rows + 1)
+            .sql(dialect="postgres")
+        )
+
+    def executed_query(self, expression: exp.Expression) -> str:
+        if self.settings.result_streaming_enabled:
+            return expression.sql(dialect="postgres")
+
+        return self.capped_query(expression)
+
+    async def execute(
+        self, conn: asyncpg.Connection, expression: exp.Expression
+    ) -> dict:
+        if self.settings.result_streaming_enabled:
+            return await self.stream(conn, expression)
+
+        return await self.fetch(conn, expression)
+
+    async def fetch(
+        self, conn: asyncpg.Connection, expression: exp.Expression
+    ) -> dict:
+        rows = await conn.fetch(self.capped_query(expression))
+
+        columns = list(rows[0].keys()) if rows else []
+        truncated = len(rows) > self.settings.result_max_rows
+        rows = rows[: self.settings.result_max_rows]
+
+        result = self.encode(columns, rows)
+
+        while (
+            result["row_count"]
+            and len(json.dumps(result)) > self.settings.result_max_bytes
+        ):
+            truncated = True
+            result = self.encode(columns, rows[: result["row_count"] // 2])
+
+        if truncated:
+            result["truncated"] = True
+            result["summary"] = await self.summarize(conn, expression, columns, rows)
+
+        return result
+
+    async def stream(
+        self, conn: asyncpg.Connection, expression: exp.Expression
+    ) -> dict:
+        """Stream the full result through a server-side cursor.
+
+        Only the first rows are kept; every row feeds running per-column
+        summaries, so memory stays flat however many rows the query returns.
+        Must run inside a transaction.
+
+        Args:
+            conn (asyncpg.Connection): Connection with an open transaction
+            expression (exp.Expression): The parsed user query
+
+        Returns:
+            dict: Column-major sample rows, with a summary if truncated
+        """
+        accumulator: Optional[ResultAccumulator] = None
+
+        async for row in conn.cursor(
+            self.executed_query(expression),
+            prefetch=self.settings.result_prefetch_rows,
+        ):
+            if accumulator is None:
+                accumulator = ResultAccumulator(self.settings, list(row.keys()))
+
+            if not accumulator.add(row):
+                break
+
+        return self.shape(accumulator or ResultAccumulator(self.settings, []))
+
+    def shape(self, accumulator: ResultAccumulator) -> dict:
+        """Encode accumulated rows within the byte cap, summarizing if truncated.
+
+        Args:
+            accumulator (ResultAccumulator): Rows read from any backend
+
+        Returns:
+            dict: Column-major sample rows, with a summary if truncated
+        """
+        columns = accumulator.columns
+        rows = accumulator.rows
+
+        result = self.encode(columns, rows)
+        truncated = accumulator.total_rows > len(rows)
+
+        while (
+            result["row_count"]
+            and len(json.dumps(result)) > self.settings.result_max_bytes
+        ):
+            truncated = True
+            result = self.encode(columns, rows[: result["row_count"] // 2])
+
+        if truncated:
+            result["truncated"] = True
+            result["summary"] = self.encode_summary(
+                accumulator.total_rows,
+                columns,
+                accumulator.summaries,
+                accumulator.partial,
+            )
+
+        return result
+
+    def encode_summary(
+        self,
+        total_rows: int,
+        columns: list[str],
+        summaries: list[ColumnSummary],
+        partial: bool,
+    ) -> dict:
+        summary: dict = {
+            "total_rows": total_rows,
+            "columns": {
+                column: column_summary.to_dict(self.settings.result_histogram_bins)
+                for column, column_summary in zip(columns, summaries)
+            },
+        }
+
+        if partial:
+            summary["partial"] = True
+
+        return summary
+
+    @staticmethod
+    def encode(columns: list[str], rows: Sequence[Sequence[Any]]) -> dict:
+        # Column-major: each column name appears once, followed by its values.
+        return {
+            "row_count": len(rows),
+            "columns": {
+                column: [to_json_value(row[i]) for row in rows]
+                for i, column in enumerate(columns)
+            },
+        }
+
+    async def summarize(
+        self,
+        conn: asyncpg.Connection,
+        expression: exp.Expression,
+        columns: list[str],
+        rows: list[asyncpg.Record],
+    ) -> dict:
+        """Aggregate the full result set in the database instead of shipping it.
+
+        Args:
+            conn (asyncpg.Connection): Connection the query ran on
+            expression (exp.Expression): The parsed user query
+            columns (list[str]): Result column names
+            rows (list[asyncpg.Record]): Rows already fetched, used to infer types
+
+        Returns:
+            dict: Total row count plus min/max and top values per column
+        """
+        selects = ["(SELECT COUNT(*) FROM _result) AS total_rows"]
+
+        for i, column in enumerate(columns):
+            quoted = quote_identifier(column)
+            sample = next((row[i] for row in rows if row[i] is not None), None)
+
+            if isinstance(sample, ORDERABLE_TYPES) and not isinstance(sample, bool):
+                selects.append(
+                    f"(SELECT json_build_object('min', MIN({quoted}),"
+                    f" 'max', MAX({quoted})) FROM _result)"
+                    f" AS range_{i}"
+                )
+
+            if isinstance(sample, (str, bool)):
+                selects.append(
+                    f"(SELECT json_agg(json_build_object('value', value, 'count', count))"
+                    f" FROM (SELECT {quoted} AS value, COUNT(*) AS count FROM _result"
+                    f" GROUP BY {quoted} ORDER BY count DESC"
+                    f" LIMIT {self.settings.result_top_values}) AS top_values)"
+                    f" AS top_values_{i}"
+                )
+
+        summary_row = await conn.fetchrow(
+            f"WITH _result AS MATERIALIZED ({expression.sql(dialect='postgres')})"
+            f" SELECT {', '.join(selects)}"
+        )
+
+        summary: dict = {"total_rows": summary_row["total_rows"], "columns": {}}
+
+        # Aggregates are aliased by column position, since result column names
+        # can be arbitrarily long or collide with the aliases.
+        for i, column in enumerate(columns):
+            for aggregate in ("range", "top_values"):
+                value = summary_row.get(f"{aggregate}_{i}")
+
+                if value is not None:
+                    summary["columns"].setdefault(column, {})[aggregate] = json.loads(
+                        value
+                    )
+
+        return summary
@@ -0,0 +1,368 @@
+import asyncio
+import time
+
+import asyncpg
+import sqlglot as sg
+import sqlglot.expressions as exp
+from sqlglot.optimizer.scope import traverse_scope
+from typing_extensions import Optional
+
+from settings import Settings
+
+ROLLUP_TABLE = "service_requests_daily"
+ROLLUP_DIMENSIONS = {"agency", "complaint_type", "borough", "incident_zip"}
+RESOLUTION_BUCKET_DAYS = (1, 3, 7, 30)
+
+# created_date may only be used at day granularity, which the rollup keeps.
+DAY_GRANULAR_UNITS = {
+    "DAY",
+    "DOW",
+    "DOY",
+    "ISODOW",
+    "ISOYEAR",
+    "MONTH",
+    "QUARTER",
+    "WEEK",
+    "YEAR",
+}
+
+REFRESH_QUERY = f"REFRESH MATERIALIZED VIEW CONCURRENTLY {ROLLUP_TABLE}"
+AVAILABLE_QUERY = f"SELECT to_regclass('{ROLLUP_TABLE}') IS NOT NULL"
+
+
+def strip_qualifiers(expression: exp.Expression) -> str:
+    expression = expression.copy()
+
+    while isinstance(expression, exp.Paren):
+        expression = expression.this
+
+    for column in expression.find_all(exp.Column):
+        column.set("table", None)
+
+    # Only used to compare against fixed patterns, so dropping grouping
+    # parentheses cannot make two different patterns collide.
+    for paren in list(expression.find_all(exp.Paren)):
+        paren.replace(paren.this)
+
+    return expression.sql(dialect="postgres")
+
+
+def canonical(sql: str) -> str:
+    return strip_qualifiers(sg.parse_one(sql, read="postgres"))
+
+
+CLOSED_CONDITION = canonical("closed_date IS NOT NULL")
+BUCKET_CONDITIONS = {
+    canonical(f"closed_date - created_date <= INTERVAL '{days} {unit}'"): (
+        f"closed_within_{days}_days"
+    )
+    for days in RESOLUTION_BUCKET_DAYS
+    for unit in ("day", "days")
+}
+RESOLUTION_SECONDS = canonical("EXTRACT(EPOCH FROM closed_date - created_date)")
+RESOLUTION_INTERVAL = canonical("closed_date - created_date")
+
+
+class RollupNotApplicableError(Exception):
+    """Raised while rewriting a SELECT the rollup cannot answer exactly"""
+
+
+class RollupRouter:
+    def __init__(self, settings: Settings) -> None:
+        self.settings = settings
+        self.available = False
+
+        self.routed = 0
+        self.skipped = 0
+
+    async def is_available(self, conn: asyncpg.Connection) -> bool:
+        # Deployments initialized before the rollup existed have no view, so
+        # keep checking until it shows up.
+        if not self.available:
+            self.available = bool(await conn.fetchval(AVAILABLE_QUERY))
+
+        return self.available
+
+    def route(self, expression: exp.Expression) -> Optional[exp.Expression]:
+        """Rewrite aggregate scopes over service_requests to read the rollup.
+
+        Args:
+            expression (exp.Expression): The parsed user query
+
+        Returns:
+            Optional[exp.Expression]: The rewritten query, or None if no scope
+                could be answered exactly from the rollup
+        """
+        expression = expression.copy()
+        routed = False
+
+        for scope in traverse_scope(expression):
+            select = scope.expression
+
+            if not isinstance(select, exp.Select):
+                continue
+
+            try:
+                candidate = self.rewrite_select(select)
+            except RollupNotApplicableError:
+                continue
+
+            if select is expression:
+                expression = candidate
+            else:
+                select.replace(candidate)
+
+            routed = True
+
+        if routed:
+            self.routed += 1
+        else:
+            self.skipped += 1
+
+        return expression if routed else None
+
+    def rewrite_select(self, select: exp.Select) -> exp.Select:
+        candidate = select.copy()
+
+        if (
+            candidate.args.get("joins")
+            or len(list(candidate.find_all(exp.Select))) > 1
+            or any(
+                isinstance(projection, exp.Star)
+                or (projection.find(exp.Star) and not projection.find(exp.Count))
+                for projection in candidate.expressions
+            )
+        ):
+            raise RollupNotApplicableError
+
+        table = candidate.find(exp.Table)
+
+        if table is None or table.name != "service_requests":
+            raise RollupNotApplicableError
+
+        if not candidate.args.get("group") and candidate.find(exp.Window):
+            raise RollupNotApplicableError
+
+        qualifier = table.alias_or_name
+        aliases = {
+            projection.alias for projection in candidate.expressions if projection.alias
+        }
+
+        aggregates = [
+            aggregate
+            for aggregate in candidate.find_all(exp.AggFunc)
+            if not isinstance(aggregate.parent, exp.Window)
+        ]
+
+        if not aggregates:
+            raise RollupNotApplicableError
+
+        for aggregate in aggregates:
+            self.rewrite_aggregate(aggregate, qualifier)
+
+        for column in list(candidate.find_all(exp.Column)):
+            if column.table not in (qualifier, ""):
+                raise RollupNotApplicableError
+
+            if column.name in ROLLUP_DIMENSIONS or column.meta.get("rollup"):
+                continue
+
+            if column.name in aliases and not column.table:
+                continue
+
+            if column.name == "created_date" and self.is_day_granular(column):
+                column.replace(
+                    exp.cast(self.rollup_column("day", qualifier), "TIMESTAMP")
+                )
+                continue
+
+            raise RollupNotApplicableError
+
+        table.set("this", exp.to_identifier(ROLLUP_TABLE))
+
+        if not table.alias:
+            # Keeps columns qualified with the base table name valid.
+            table.set("alias", exp.TableAlias(this=exp.to_identifier(qualifier)))
+
+        return candidate
+
+    def rewrite_aggregate(self, aggregate: exp.AggFunc, qualifier: str) -> None:
+        node: exp.Expression = aggregate
+        condition = None
+
+        if isinstance(aggregate.parent, exp.Filter):
+            node = aggregate.parent
+            condition = node.expression.this
+
+        if isinstance(aggregate, (exp.Min, exp.Max)) and condition is None:
+            return
+
+        if isinstance(aggregate, exp.Count) and isinstance(aggregate.this, exp.Distinct):
+            if condition is None and all(
+                isinstance(column, exp.Column) and column.name in ROLLUP_DIMENSIONS
+                for column in aggregate.this.expressions
+            ):
+                return
+
+            raise RollupNotApplicableError
+
+        if isinstance(aggregate, exp.Count):
+            if isinstance(aggregate.this, exp.Star):
+                column = "request_count"
+            elif (
+                isinstance(aggregate.this, exp.Column)
+                and aggregate.this.name == "closed_date"
+            ):
+                column = "closed_count"
+            else:
+                raise RollupNotApplicableError
+
+            if condition is not None:
+                condition_sql = strip_qualifiers(condition)
+
+                if condition_sql == CLOSED_CONDITION:
+                    column, condition = "closed_count", None
+                elif condition_sql in BUCKET_CONDITIONS:
+                    column, condition = BUCKET_CONDITIONS[condition_sql], None
+
+            total: exp.Expression = exp.Sum(this=self.rollup_column(column, qualifier))
+
+            if condition is not None:
+                # Whatever is left must be a predicate on dimensions, which the
+                # column check in rewrite_select enforces.
+                total = exp.Filter(this=total, expression=exp.Where(this=condition))
+
+            node.replace(exp.cast(total, "BIGINT"))
+            return
+
+        if isinstance(aggregate, exp.Avg) and condition is None:
+            argument = aggregate.this
+            divisor = None
+
+            if isinstance(argument, exp.Div) and isinstance(
+                argument.expression, exp.Literal
+            ):
+                argument, divisor = argument.this, argument.expression
+
+            argument_sql = strip_qualifiers(argument)
+
+            mean_seconds: exp.Expression = exp.Div(
+                this=exp.Sum(this=self.rollup_column("resolution_seconds", qualifier)),
+                expression=exp.Nullif(
+                    this=exp.Sum(this=self.rollup_column("closed_count", qualifier)),
+                    expression=exp.Literal.number(0),
+                ),
+                typed=True,
+            )
+
+            if argument_sql == RESOLUTION_SECONDS:
+                if divisor is not None:
+                    mean_seconds = exp.Div(
+                        this=exp.Paren(this=mean_seconds),
+                        expression=divisor,
+                        typed=True,
+                    )
+
+                node.replace(exp.Paren(this=mean_seconds))
+                return
+
+            if argument_sql == RESOLUTION_INTERVAL and divisor is None:
+                node.replace(
+                    exp.Paren(
+                        this=exp.Mul(
+                            this=exp.Paren(this=mean_seconds),
+                            expression=exp.Interval(
+                                this=exp.Literal.string("1"),
+                                unit=exp.Var(this="SECOND"),
+                            ),
+                        )
+                    )
+                )
+                return
+
+        raise RollupNotApplicableError
+
+    @staticmethod
+    def rollup_column(name: str, qualifier: str) -> exp.Column:
+        column = exp.column(name, table=qualifier)
+        column.meta["rollup"] = True
+
+        return column
+
+    @staticmethod
+    def is_day_granular(column: exp.Column) -> bool:
+        parent = column.parent
+
+        if isinstance(parent, exp.Date):
+            return True
+
+        if isinstance(parent, exp.Cast):
+            return parent.to.is_type("date")
+
+        if isinstance(parent, exp.TimestampTrunc):
+            return parent.unit.name.upper() in DAY_GRANULAR_UNITS
+
+        if isinstance(parent, exp.Extract):
+            return parent.this.name.upper() in DAY_GRANULAR_UNITS
+
+        # Only bounds at midnight keep whole days on both sides of the cut.
+        if isinstance(parent, (exp.GTE, exp.LT)) and column.arg_key == "this":
+            bound = parent.expression
+
+            if isinstance(bound, exp.Cast):
+                bound = bound.this
+
+            return (
+                isinstance(bound, exp.Literal)
+                and bound.is_string
+                and len(bound.name) == len("YYYY-MM-DD")
+            )
+
+        return False
+
+
+async def refresh_rollup(conn: asyncpg.Connection) -> bool:
+    """Refresh the daily rollup if this database has it.
+
+    Args:
+        conn (asyncpg.Connection): Connection to refresh on
+
+    Returns:
+        bool: Whether the rollup exists and was refreshed
+    """
+    if not await conn.fetchval(AVAILABLE_QUERY):
+        return False
+
+    start = time.perf_counter()
+
+    await conn.execute(REFRESH_QUERY)
+    await conn.execute(f"ANALYZE {ROLLUP_TABLE}")
+
+    row_count = await conn.fetchval(f"SELECT COUNT(*) FROM {ROLLUP_TABLE}")
+
+    print(
+        f"Refreshed {ROLLUP_TABLE}: {row_count} rows "
+        f"in {time.perf_counter() - start:.2f}s"
+    )
+
+    return True
+
+
+async def refresh(settings: Settings) -> None:
+    conn = await asyncpg.connect(
+        host=settings.database_host,
+        port=settings.database_port,
+        database=settings.database_name,
+        user=settings.database_user,
+        password=settings.database_password.get_secret_value(),
+    )
+
+    try:
+        if not await refresh_rollup(conn):
+            print(f"{ROLLUP_TABLE} does not exist, run db/init/03-rollups.sql first")
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(refresh(Settings()))
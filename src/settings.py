@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic import SecretStr
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -17,13 +19,126 @@ class Settings(BaseSettings):
     openrouter_model_3: str
     openrouter_model_4: str
 
+    llm_http2: bool = False
+    llm_http_timeout: float = 60.0
+    llm_http_max_connections: int = 100
+    llm_http_max_keepalive_connections: int = 20
+    llm_http_keepalive_expiry: float = 30.0
+
+    summarize_llm_timeout: float = 30.0
+    guardrail_llm_timeout: float = 10.0
+    query_writer_llm_timeout: float = 20.0
+    responder_llm_timeout: float = 60.0
+
+    llm_hedging_enabled: bool = False
+    llm_hedge_percentile: float = 0.95
+    llm_hedge_min_samples: int = 20
+    llm_hedge_min_delay: float = 0.5
+    llm_latency_window: int = 200
+    openrouter_hedge_model_1: str = ""
+    openrouter_hedge_model_2: str = ""
+    openrouter_hedge_model_3: str = ""
+    openrouter_hedge_model_4: str = ""
+
+    guardrail_max_concurrency: int = 32
+    query_writer_max_concurrency: int = 32
+    responder_max_concurrency: int = 32
+    database_max_concurrency: int = 10
+    stage_queue_timeout: float = 30.0
+
+    trace_export_path: str = ""
+
+    lazy_startup_enabled: bool = True
+    startup_warmup_enabled: bool = True
+    startup_prewarm_max_bytes: int = 268435456
+    llm_warmup_connections: int = 4
+    llm_keepalive_interval: float = 20.0
+
     model_1_system_prompt_path: str
     model_2_system_prompt_path: str
     model_3_system_prompt_path: str
     model_4_system_prompt_path: str
+    query_writer_parallel_prompt_path: str = (
+        "src/system-prompts/query_writer_parallel_prompt.md"
+    )
+
+    prompt_context_enabled: bool = True
+    schema_sql_path: str = "db/init/01-schema.sql"
 
     database_host: str
     database_port: int
     database_name: str
     database_user: str
     database_password: SecretStr
+
+    database_pool_min_size: int = 1
+    database_pool_max_size: int = 10
+    database_pool_max_queries: int = 50000
+    database_pool_max_inactive_connection_lifetime: float = 300.0
+    database_pool_acquire_timeout: float = 10.0
+    database_statement_timeout: float = 30.0
+
+    result_cache_enabled: bool = True
+    result_cache_ttl: float = 3600.0
+    result_cache_max_bytes: int = 64 * 1024 * 1024
+    result_cache_version_check_interval: float = 30.0
+
+    question_cache_enabled: bool = True
+    question_cache_threshold: float = 0.9
+    question_cache_max_entries: int = 1000
+
+    example_questions: list[str] = [
+        "What are the top 10 complaint types by number of records?",
+        "For the top 5 complaint types, what percent were closed within 3 days?",
+        "Which ZIP code has the highest number of complaints?",
+        "What proportion of complaints include a valid latitude/longitude?",
+        "Which agency has the slowest average resolution time?",
+        "Compare noise complaints in 2020 versus 2023",
+    ]
+
+    answer_cache_enabled: bool = True
+    answer_cache_trending_questions: int = 10
+    answer_cache_trending_days: int = 7
+    answer_cache_trending_min_asks: int = 3
+    answer_cache_check_interval: float = 60.0
+    answer_cache_build_concurrency: int = 2
+
+    speculative_execution: bool = False
+    speculative_query_execution: bool = False
+
+    api_session_ttl: float = 3600.0
+    api_result_rows_limit: int = 100
+
+    result_max_rows: int = 200
+    result_max_bytes: int = 32 * 1024
+    result_top_values: int = 5
+    result_streaming_enabled: bool = True
+    result_prefetch_rows: int = 2000
+    result_stream_max_rows: int = 10_000_000
+    result_histogram_bins: int = 10
+    result_histogram_sample_size: int = 1000
+
+    query_cost_gate_enabled: bool = True
+    query_max_cost: float = 1_000_000.0
+    query_max_plan_rows: float = 10_000_000.0
+    query_date_range_days: int = 365
+    query_statement_timeout: float = 15.0
+    query_max_retries: int = 2
+
+    parallel_queries_enabled: bool = False
+    query_max_fan_out: int = 4
+
+    rollup_routing_enabled: bool = True
+
+    query_backend: Literal["postgres", "duckdb"] = "postgres"
+    query_backend_fallback: bool = True
+    duckdb_snapshot_path: str = "data/snapshot"
+    duckdb_max_concurrency: int = 4
+    duckdb_threads: int = 0
+    duckdb_memory_limit: str = ""
+
+    ingest_batch_rows: int = 20_000
+
+    guardrail_prefilter_enabled: bool = True
+    guardrail_prefilter_max_length: int = 300
+    guardrail_prefilter_audit_rate: float = 0.05
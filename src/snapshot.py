@@ -0,0 +1,242 @@
+import argparse
+import asyncio
+import datetime
+import os
+import shutil
+import time
+from uuid import uuid4
+
+import asyncpg
+from typing_extensions import Any, Optional
+
+from ingest import SERVICE_REQUEST_COLUMNS
+from models import SnapshotManifestModel
+from result_cache import DATA_VERSION_QUERY
+from settings import Settings
+
+MANIFEST_FILE = "manifest.json"
+EXPORT_FILE = "export.csv"
+
+# Timestamp layout of the 311 CSV export; Postgres exports are ISO.
+EXPORT_TIMESTAMP_FORMAT = "%m/%d/%Y %I:%M:%S %p"
+
+# Non-VARCHAR columns of db/init/01-schema.sql, so the snapshot answers the
+# same SQL with the same result types as Postgres.
+COLUMN_TYPES = {
+    "unique_key": "BIGINT",
+    "created_date": "TIMESTAMP",
+    "closed_date": "TIMESTAMP",
+    "due_date": "TIMESTAMP",
+    "resolution_action_updated_date": "TIMESTAMP",
+    "x_coordinate": "INTEGER",
+    "y_coordinate": "INTEGER",
+    "latitude": "DECIMAL(18, 15)",
+    "longitude": "DECIMAL(18, 15)",
+}
+
+
+def quote_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def connect_duckdb(settings: Settings) -> Any:
+    # Imported here so the Postgres-only app never loads the engine.
+    import duckdb
+
+    config: dict[str, Any] = {}
+
+    if settings.duckdb_threads:
+        config["threads"] = settings.duckdb_threads
+
+    if settings.duckdb_memory_limit:
+        config["memory_limit"] = settings.duckdb_memory_limit
+
+    return duckdb.connect(config=config)
+
+
+def parquet_glob(directory: str) -> str:
+    return os.path.join(directory, "**", "*.parquet")
+
+
+def read_manifest(snapshot_path: str) -> Optional[SnapshotManifestModel]:
+    try:
+        with open(os.path.join(snapshot_path, MANIFEST_FILE)) as f:
+            return SnapshotManifestModel.model_validate_json(f.read())
+    except FileNotFoundError:
+        return None
+
+
+def write_parquet(
+    settings: Settings, csv_path: str, directory: str, timestamp_format: Optional[str]
+) -> tuple[int, Optional[datetime.datetime]]:
+    """Convert a CSV in the service_requests layout to Parquet partitioned by year.
+
+    Args:
+        settings (Settings): DuckDB thread and memory limits
+        csv_path (str): CSV with a header row
+        directory (str): Empty directory for the partitions
+        timestamp_format (Optional[str]): strptime layout, None to auto-detect
+
+    Returns:
+        tuple[int, Optional[datetime.datetime]]: Rows written and newest created_date
+    """
+    columns = ", ".join(
+        f"{quote_literal(column)}: {quote_literal(COLUMN_TYPES.get(column, 'VARCHAR'))}"
+        for column in SERVICE_REQUEST_COLUMNS
+    )
+    options = [
+        "header = true",
+        f"columns = {{{columns}}}",
+        "quote = '\"'",
+        "escape = '\"'",
+        "nullstr = ''",
+        # Like COPY ... NULL '': only unquoted empty fields are NULL.
+        "allow_quoted_nulls = false",
+    ]
+
+    if timestamp_format:
+        options.append(f"timestampformat = {quote_literal(timestamp_format)}")
+
+    connection = connect_duckdb(settings)
+
+    try:
+        # Sorting by created_date keeps each row group to a narrow date range,
+        # so Parquet min/max statistics skip most of a year for date filters.
+        connection.execute(
+            f"""
+            COPY (
+                SELECT *, year(created_date) AS created_year
+                FROM read_csv({quote_literal(csv_path)}, {", ".join(options)})
+                ORDER BY created_date
+            ) TO {quote_literal(directory)}
+            (FORMAT parquet, PARTITION_BY (created_year), COMPRESSION zstd)
+            """
+        )
+
+        rows, max_created_date = connection.execute(
+            "SELECT COUNT(*), MAX(created_date) FROM read_parquet("
+            f"{quote_literal(parquet_glob(directory))}, hive_partitioning = false)"
+        ).fetchone()
+    finally:
+        connection.close()
+
+    return rows, max_created_date
+
+
+def publish(snapshot_path: str, manifest: SnapshotManifestModel) -> None:
+    previous = read_manifest(snapshot_path)
+
+    # Readers stat the manifest before every query, so replacing it atomically
+    # switches them to the new build.
+    temporary = os.path.join(snapshot_path, f".{MANIFEST_FILE}.{uuid4().hex}")
+
+    with open(temporary, "w") as f:
+        f.write(manifest.model_dump_json(indent=2))
+
+    os.replace(temporary, os.path.join(snapshot_path, MANIFEST_FILE))
+
+    # The previous build stays for queries that started before the switch.
+    keep = {manifest.build_id, previous.build_id if previous else ""}
+
+    for entry in os.scandir(snapshot_path):
+        if entry.is_dir() and entry.name not in keep:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def build(
+    settings: Settings,
+    csv_path: str,
+    source: str,
+    timestamp_format: Optional[str],
+    data_version: Optional[int] = None,
+) -> SnapshotManifestModel:
+    start = time.perf_counter()
+    build_id = datetime.datetime.now().strftime("%Y%m%d%H%M%S-") + uuid4().hex[:8]
+    directory = os.path.join(settings.duckdb_snapshot_path, build_id)
+
+    try:
+        rows, max_created_date = write_parquet(
+            settings, csv_path, directory, timestamp_format
+        )
+    except BaseException:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+
+    manifest = SnapshotManifestModel(
+        build_id=build_id,
+        source=source,
+        data_version=data_version,
+        rows=rows,
+        max_created_date=max_created_date,
+        built_at=datetime.datetime.now(datetime.timezone.utc),
+        build_seconds=time.perf_counter() - start,
+    )
+    publish(settings.duckdb_snapshot_path, manifest)
+
+    return manifest
+
+
+def build_from_csv(settings: Settings, path: str) -> SnapshotManifestModel:
+    os.makedirs(settings.duckdb_snapshot_path, exist_ok=True)
+
+    return build(settings, path, path, EXPORT_TIMESTAMP_FORMAT)
+
+
+async def build_from_postgres(settings: Settings) -> SnapshotManifestModel:
+    os.makedirs(settings.duckdb_snapshot_path, exist_ok=True)
+    export_path = os.path.join(
+        settings.duckdb_snapshot_path, f".{uuid4().hex}-{EXPORT_FILE}"
+    )
+
+    conn = await asyncpg.connect(
+        host=settings.database_host,
+        port=settings.database_port,
+        database=settings.database_name,
+        user=settings.database_user,
+        password=settings.database_password.get_secret_value(),
+    )
+
+    try:
+        # One snapshot of the table, so the recorded version matches the rows.
+        async with conn.transaction(isolation="repeatable_read", readonly=True):
+            try:
+                data_version = int(await conn.fetchval(DATA_VERSION_QUERY))
+            except asyncpg.UndefinedTableError:
+                data_version = 0
+
+            await conn.copy_from_query(
+                f"SELECT {', '.join(SERVICE_REQUEST_COLUMNS)} FROM service_requests",
+                output=export_path,
+                format="csv",
+                header=True,
+                null="",
+                encoding="utf-8",
+            )
+    finally:
+        await conn.close()
+
+    try:
+        return await asyncio.to_thread(
+            build, settings, export_path, "postgres", None, data_version
+        )
+    finally:
+        os.remove(export_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Build the Parquet snapshot the DuckDB query backend reads"
+    )
+    parser.add_argument(
+        "path",
+        nargs="?",
+        help="CSV export with a header row; exports service_requests if omitted",
+    )
+
+    args = parser.parse_args()
+    settings = Settings()
+
+    if args.path:
+        print(build_from_csv(settings, args.path))
+    else:
+        print(asyncio.run(build_from_postgres(settings)))
@@ -0,0 +1,33 @@
+from models import SpeculationMetricsModel
+
+
+class SpeculationTracker:
+    def __init__(self) -> None:
+        self.runs = 0
+        self.committed = 0
+        self.cancelled = 0
+        self.speculative_queries = 0
+        self.saved_total = 0.0
+        self.saved_last = 0.0
+
+    def record_commit(self, saved: float, speculative_queries: int) -> None:
+        self.runs += 1
+        self.committed += 1
+        self.speculative_queries += speculative_queries
+        self.saved_total += saved
+        self.saved_last = saved
+
+    def record_cancel(self) -> None:
+        self.runs += 1
+        self.cancelled += 1
+        self.saved_last = 0.0
+
+    def metrics(self) -> SpeculationMetricsModel:
+        return SpeculationMetricsModel(
+            runs=self.runs,
+            committed=self.committed,
+            cancelled=self.cancelled,
+            speculative_queries=self.speculative_queries,
+            saved_last=self.saved_last,
+            saved_avg=self.saved_total / self.committed if self.committed else 0.0,
+        )
@@ -0,0 +1,64 @@
+import sqlglot as sg
+import sqlglot.expressions as exp
+
+WRITE_EXPRESSIONS = (
+    exp.Alter,
+    exp.Command,
+    exp.Create,
+    exp.Delete,
+    exp.Drop,
+    exp.Insert,
+    exp.Into,
+    exp.Lock,
+    exp.Merge,
+    exp.TruncateTable,
+    exp.Update,
+)
+
+SIDE_EFFECT_FUNCTIONS = frozenset(
+    {
+        "dblink",
+        "dblink_exec",
+        "lo_export",
+        "lo_import",
+        "nextval",
+        "pg_advisory_lock",
+        "pg_cancel_backend",
+        "pg_read_binary_file",
+        "pg_read_file",
+        "pg_reload_conf",
+        "pg_sleep",
+        "pg_terminate_backend",
+        "set_config",
+        "setval",
+    }
+)
+
+
+def is_read_only_query(query: str) -> bool:
+    """Check that a query is a single side-effect free SELECT statement.
+
+    Args:
+        query (str): The SQL query string
+
+    Returns:
+        bool: True if the query is safe to run without a guardrail verdict
+    """
+    try:
+        expressions = sg.parse(sql=query, read="postgres")
+    except sg.errors.ParseError:
+        return False
+
+    if len(expressions) != 1 or not isinstance(expressions[0], exp.Query):
+        return False
+
+    expression = expressions[0]
+
+    if expression.find(*WRITE_EXPRESSIONS):
+        return False
+
+    for function in expression.find_all(exp.Anonymous, exp.Func):
+        if function.name.lower() in SIDE_EFFECT_FUNCTIONS:
+            return False
+
+    return True
@@ -0,0 +1,238 @@
+import asyncio
+import importlib
+import time
+from contextlib import contextmanager
+
+from typing_extensions import TYPE_CHECKING, Any, Awaitable, Iterator
+
+from settings import Settings
+
+if TYPE_CHECKING:
+    from workflow import Workflow
+
+# Imported one by one before the workflow module, so each package's import
+# time is reported separately instead of as part of whoever imported it first.
+HEAVY_MODULES = (
+    "httpx",
+    "asyncpg",
+    "sqlglot",
+    "langchain_core.messages",
+    "langchain_openai",
+    "langgraph.graph",
+    "langgraph.prebuilt",
+)
+
+# The daily rollup and its indexes first, then the indexes of the newest
+# service_requests partitions.
+PREWARM_RELATIONS_QUERY = """
+SELECT c.oid::regclass::text AS relation, pg_relation_size(c.oid) AS size
+FROM pg_class c
+LEFT JOIN pg_index i ON i.indexrelid = c.oid
+LEFT JOIN pg_class t ON t.oid = i.indrelid
+WHERE c.oid = to_regclass('service_requests_daily')
+    OR t.oid = to_regclass('service_requests_daily')
+    OR t.oid IN (
+        SELECT inhrelid FROM pg_inherits
+        WHERE inhparent = to_regclass('service_requests')
+    )
+ORDER BY
+    coalesce(t.oid, c.oid) = to_regclass('service_requests_daily') DESC,
+    t.relname DESC,
+    c.relname
+"""
+
+WARMUP_QUERY = (
+    "SELECT complaint_type, COUNT(*) AS count FROM service_requests "
+    "GROUP BY complaint_type ORDER BY count DESC LIMIT 10"
+)
+
+
+class StartupProfile:
+    """Seconds spent on each import, init and warm-up step, in the order they ran"""
+
+    def __init__(self) -> None:
+        self.steps: dict[str, float] = {}
+
+    @contextmanager
+    def step(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.steps[name] = time.perf_counter() - start
+
+    async def background_step(self, name: str, awaitable: Awaitable[Any]) -> None:
+        # Warm-up is best effort: the first question does the work otherwise.
+        with self.step(name):
+            try:
+                await awaitable
+            except Exception as e:
+                print(f"{name} failed: {type(e).__name__}: {e}")
+
+    def import_modules(self) -> None:
+        for module in HEAVY_MODULES:
+            with self.step(f"import {module}"):
+                importlib.import_module(module)
+
+    def gauges(self) -> list[tuple[str, dict, float]]:
+        return [
+            ("workflow_startup_seconds", {"step": name}, seconds)
+            for name, seconds in self.steps.items()
+        ]
+
+    def report(self) -> str:
+        return "\n".join(
+            f"{name:<40} {seconds * 1000:10.1f} ms"
+            for name, seconds in self.steps.items()
+        )
+
+
+def build_workflow(settings: Settings, profile: StartupProfile) -> "Workflow":
+    profile.import_modules()
+
+    with profile.step("import workflow"):
+        from workflow import Workflow
+
+    workflow = Workflow(settings, profile)
+
+    with profile.step("build_graph"):
+        workflow.build_graph()
+
+    return workflow
+
+
+async def start_workflow(settings: Settings) -> "Workflow":
+    """Import and build the workflow, then warm it up in the background.
+
+    Args:
+        settings (Settings): Application settings
+
+    Returns:
+        Workflow: Workflow with a compiled graph, its warm-up still running
+    """
+    profile = StartupProfile()
+
+    # Deferred to here, and run in a thread, so the UI and API are up and
+    # the event loop keeps serving while the heavy imports run.
+    workflow = await asyncio.to_thread(build_workflow, settings, profile)
+
+    if settings.startup_warmup_enabled:
+        workflow.warmup_task = asyncio.create_task(warm_up(workflow))
+    else:
+        await workflow.database.open()
+
+    # Built now and again after every import, off the request path.
+    if settings.answer_cache_enabled:
+        workflow.answer_cache_task = asyncio.create_task(
+            workflow.answer_cache.run(workflow.precompute_answer)
+        )
+
+    if settings.debug:
+        print(profile.report())
+
+    return workflow
+
+
+async def warm_up(workflow: "Workflow") -> None:
+    """Open connections and load hot pages before the first question needs them.
+
+    Args:
+        workflow (Workflow): The workflow to warm up
+    """
+    profile = workflow.profile
+
+    steps = [
+        profile.background_step("warm database", warm_database(workflow)),
+        profile.background_step("warm llm connections", warm_llm_connections(workflow)),
+        profile.background_step("warm sqlglot", asyncio.to_thread(warm_sqlglot)),
+    ]
+
+    if workflow.settings.query_backend == "duckdb":
+        steps.append(
+            profile.background_step(
+                "warm duckdb", asyncio.to_thread(workflow.backends["duckdb"].connect)
+            )
+        )
+
+    await asyncio.gather(*steps)
+
+    if workflow.settings.debug:
+        print(profile.report())
+
+    # Re-used connections stay in the keep-alive pool past its expiry.
+    while workflow.settings.llm_keepalive_interval > 0:
+        await asyncio.sleep(workflow.settings.llm_keepalive_interval)
+
+        try:
+            await warm_llm_connections(workflow)
+        except Exception as e:
+            print(f"llm keep-alive failed: {type(e).__name__}: {e}")
+
+
+async def warm_database(workflow: "Workflow") -> None:
+    await workflow.database.open()
+
+    if workflow.settings.startup_prewarm_max_bytes <= 0:
+        return
+
+    async with workflow.database.acquire() as conn:
+        if not await conn.fetchval(
+            "SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_prewarm')"
+        ):
+            print("pg_prewarm is not installed, skipping the shared buffers warm-up")
+            return
+
+        budget = workflow.settings.startup_prewarm_max_bytes
+        blocks = 0
+
+        for relation, size in await conn.fetch(PREWARM_RELATIONS_QUERY):
+            if size > budget:
+                continue
+
+            blocks += await conn.fetchval("SELECT pg_prewarm($1::regclass)", relation)
+            budget -= size
+
+        if workflow.settings.debug:
+            print(f"Prewarmed {blocks} blocks")
+
+
+async def warm_llm_connections(workflow: "Workflow") -> None:
+    # Any response will do: what matters is the TCP and TLS handshakes, whose
+    # connections the first model calls then take from the keep-alive pool.
+    url = workflow.settings.openrouter_base_url.rstrip("/") + "/models"
+
+    await asyncio.gather(
+        *(
+            workflow.http_client.head(url)
+            for _ in range(workflow.settings.llm_warmup_connections)
+        )
+    )
+
+
+def warm_sqlglot() -> None:
+    # The first parse and transpile import sqlglot's dialect modules.
+    import sqlglot as sg
+
+    from sql_safety import is_read_only_query
+
+    is_read_only_query(WARMUP_QUERY)
+
+    for dialect in ("postgres", "duckdb"):
+        sg.parse_one(WARMUP_QUERY, read="postgres").sql(dialect=dialect)
+
+
+if __name__ == "__main__":
+    # Cold start profile of a fresh interpreter, warm-up included.
+    async def main() -> None:
+        settings = Settings(llm_keepalive_interval=0)
+        workflow = await start_workflow(settings)
+
+        if workflow.warmup_task is not None:
+            await workflow.warmup_task
+
+        print(workflow.profile.report())
+
+        await workflow.aclose()
+
+    asyncio.run(main())
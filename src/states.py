@@ -7,5 +7,7 @@ from typing_extensions import Annotated, List, TypedDict
 
 class WorkflowState(TypedDict):
     conversation_summary: Optional[AIMessage]
+    summary_watermark: int
+    query_attempts: int
     messages: Annotated[List[BaseMessage], add_messages]
     ui_messages: Annotated[List[BaseMessage], add_messages]
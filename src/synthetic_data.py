@@ -0,0 +1,169 @@
+import argparse
+import csv
+import datetime
+import random
+
+from typing_extensions import Optional
+
+from ingest import SERVICE_REQUEST_COLUMNS
+
+TIMESTAMP_FORMAT = "%m/%d/%Y %I:%M:%S %p"
+
+# (complaint type, agency, descriptors, weight, median hours to close)
+COMPLAINT_TYPES = [
+    ("Noise - Residential", "NYPD", ["Loud Music/Party", "Banging/Pounding"], 18, 3),
+    ("HEAT/HOT WATER", "HPD", ["ENTIRE BUILDING", "APARTMENT ONLY"], 15, 60),
+    ("Illegal Parking", "NYPD", ["Blocked Hydrant", "Double Parked Blocking Traffic"], 12, 3),
+    ("Blocked Driveway", "NYPD", ["No Access", "Partial Access"], 9, 3),
+    ("Street Condition", "DOT", ["Pothole", "Cave-in"], 7, 96),
+    ("UNSANITARY CONDITION", "HPD", ["PESTS", "MOLD"], 6, 240),
+    ("Noise - Street/Sidewalk", "NYPD", ["Loud Talking", "Loud Music/Party"], 6, 2),
+    ("Water System", "DEP", ["Hydrant Running", "No Water (WNW)"], 5, 36),
+    ("Rodent", "DOHMH", ["Rat Sighting", "Mouse Sighting"], 5, 400),
+    ("Dirty Condition", "DSNY", ["Trash", "Litter"], 4, 72),
+    ("Graffiti", "DSNY", ["Graffiti"], 3, 500),
+    ("Noise - Commercial", "NYPD", ["Loud Music/Party", "Loud Talking"], 3, 3),
+]
+
+AGENCY_NAMES = {
+    "NYPD": "New York City Police Department",
+    "HPD": "Department of Housing Preservation and Development",
+    "DOT": "Department of Transportation",
+    "DEP": "Department of Environmental Protection",
+    "DOHMH": "Department of Health and Mental Hygiene",
+    "DSNY": "Department of Sanitation",
+}
+
+# (borough, weight, ZIP codes, center latitude, center longitude)
+BOROUGHS = [
+    ("BROOKLYN", 31, ["11201", "11206", "11211", "11215", "11226", "11236"], 40.65, -73.95),
+    ("QUEENS", 24, ["11354", "11368", "11373", "11375", "11385", "11432"], 40.73, -73.82),
+    ("MANHATTAN", 21, ["10002", "10025", "10031", "10032", "10033", "10040"], 40.78, -73.97),
+    ("BRONX", 19, ["10453", "10456", "10457", "10458", "10467", "10468"], 40.84, -73.88),
+    ("STATEN ISLAND", 5, ["10301", "10304", "10306", "10312", "10314"], 40.58, -74.15),
+]
+
+STREETS = [
+    "BROADWAY",
+    "GRAND CONCOURSE",
+    "FLATBUSH AVENUE",
+    "QUEENS BOULEVARD",
+    "OCEAN AVENUE",
+    "AMSTERDAM AVENUE",
+    "VICTORY BOULEVARD",
+    "EASTERN PARKWAY",
+]
+
+GEOCODED_RATE = 0.82
+OPEN_RATE = 0.06
+
+
+def service_request(
+    rng: random.Random, unique_key: int, created_date: datetime.datetime
+) -> list[str]:
+    complaint_type, agency, descriptors, _, median_hours = rng.choices(
+        COMPLAINT_TYPES, weights=[complaint[3] for complaint in COMPLAINT_TYPES]
+    )[0]
+    borough, _, zip_codes, latitude, longitude = rng.choices(
+        BOROUGHS, weights=[borough[1] for borough in BOROUGHS]
+    )[0]
+
+    row = dict.fromkeys(SERVICE_REQUEST_COLUMNS, "")
+
+    street = rng.choice(STREETS)
+    created = created_date.strftime(TIMESTAMP_FORMAT)
+
+    row.update(
+        unique_key=str(unique_key),
+        created_date=created,
+        agency=agency,
+        agency_name=AGENCY_NAMES[agency],
+        complaint_type=complaint_type,
+        descriptor=rng.choice(descriptors),
+        location_type="Street/Sidewalk" if agency in ("NYPD", "DOT") else "RESIDENTIAL BUILDING",
+        incident_zip=rng.choice(zip_codes),
+        incident_address=f"{rng.randint(1, 2999)} {street}",
+        street_name=street,
+        address_type="ADDRESS",
+        city="NEW YORK" if borough == "MANHATTAN" else borough,
+        community_board=f"{rng.randint(1, 18):02d} {borough}",
+        borough=borough,
+        park_borough=borough,
+        park_facility_name="Unspecified",
+    )
+
+    if rng.random() < OPEN_RATE:
+        row["status"] = rng.choice(["Open", "In Progress", "Assigned"])
+    else:
+        # Exponential with the given median: mean = median / ln 2.
+        hours = rng.expovariate(0.6931 / median_hours)
+        closed = (created_date + datetime.timedelta(hours=hours)).strftime(TIMESTAMP_FORMAT)
+
+        row.update(
+            status="Closed",
+            closed_date=closed,
+            resolution_action_updated_date=closed,
+            resolution_description=f"The {agency} responded to the complaint and closed it.",
+        )
+
+    if rng.random() < GEOCODED_RATE:
+        lat = latitude + rng.uniform(-0.05, 0.05)
+        lon = longitude + rng.uniform(-0.05, 0.05)
+
+        row.update(
+            latitude=f"{lat:.8f}",
+            longitude=f"{lon:.8f}",
+            location=f"({lat:.8f}, {lon:.8f})",
+        )
+
+    return [row[column] for column in SERVICE_REQUEST_COLUMNS]
+
+
+def generate(
+    path: str,
+    rows: int,
+    seed: Optional[int] = None,
+    start_year: int = 2010,
+    end_year: int = 2024,
+) -> None:
+    """Write a synthetic 311 export in the column layout of the real CSV.
+
+    Args:
+        path (str): Output CSV path
+        rows (int): Number of service requests
+        seed (Optional[int]): Random seed for reproducible datasets
+        start_year (int): First year of created_date
+        end_year (int): Last year of created_date, inclusive
+    """
+    rng = random.Random(seed)
+
+    start = datetime.datetime(start_year, 1, 1)
+    span = (datetime.datetime(end_year + 1, 1, 1) - start).total_seconds()
+
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(SERVICE_REQUEST_COLUMNS)
+
+        # Evenly spaced slots keep created_date ascending like the real export.
+        for i in range(rows):
+            offset = (i + rng.random()) * span / rows
+            created_date = start + datetime.timedelta(seconds=int(offset))
+
+            writer.writerow(service_request(rng, i + 1, created_date))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Generate a synthetic NYC 311 service requests CSV"
+    )
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument(
+        "--output", default="data/311_Service_Requests_from_2010_to_Present.csv"
+    )
+    parser.add_argument("--seed", type=int, default=311)
+    parser.add_argument("--start-year", type=int, default=2010)
+    parser.add_argument("--end-year", type=int, default=2024)
+
+    args = parser.parse_args()
+
+    generate(args.output, args.rows, args.seed, args.start_year, args.end_year)
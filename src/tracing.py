@@ -0,0 +1,308 @@
+import asyncio
+import contextvars
+import functools
+import json
+import time
+import traceback
+from collections import defaultdict
+from contextlib import contextmanager
+from uuid import uuid4
+
+from langchain_core.callbacks import AsyncCallbackHandler
+from langchain_core.outputs import LLMResult
+from typing_extensions import Any, Awaitable, Callable, Iterator, Optional, TypeVar
+
+from settings import Settings
+
+F = TypeVar("F", bound=Callable[..., Awaitable[Any]])
+
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0
+)
+
+Labels = tuple[tuple[str, str], ...]
+Gauge = tuple[str, dict, float]
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Span:
+    def __init__(self, name: str, parent: Optional["Span"], attributes: dict) -> None:
+        self.name = name
+        self.span_id = uuid4().hex[:16]
+        self.trace_id = parent.trace_id if parent else uuid4().hex
+        self.parent_id = parent.span_id if parent else None
+
+        # Spans of one trace are written together when the root ends.
+        self.finished: list[dict] = parent.finished if parent else []
+
+        self.attributes = attributes
+        self.status = "ok"
+        self.start_time = time.time()
+        self.start = time.perf_counter()
+        self.duration = 0.0
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def record_exception(self, error: BaseException) -> None:
+        self.status = "error"
+        self.attributes.update(
+            error_type=type(error).__name__,
+            error=str(error),
+            stack="".join(traceback.format_exception(error)),
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start_time,
+            "duration": self.duration,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class MetricsRegistry:
+    """Counters and histograms rendered in the Prometheus text format"""
+
+    def __init__(self) -> None:
+        self.counters: dict[str, dict[Labels, float]] = defaultdict(
+            lambda: defaultdict(float)
+        )
+        self.histograms: dict[str, dict[Labels, list[float]]] = defaultdict(dict)
+        self.descriptions: dict[str, str] = {}
+
+        # Gauges are read from their owners at scrape time.
+        self.collectors: list[Callable[[], list[Gauge]]] = []
+
+    @staticmethod
+    def labels(labels: dict) -> Labels:
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def inc(
+        self, name: str, value: float = 1.0, description: str = "", **labels: Any
+    ) -> None:
+        self.descriptions.setdefault(name, description)
+        self.counters[name][self.labels(labels)] += value
+
+    def observe(
+        self, name: str, value: float, description: str = "", **labels: Any
+    ) -> None:
+        self.descriptions.setdefault(name, description)
+
+        # Cumulative bucket counts followed by the sum and the count.
+        series = self.histograms[name].setdefault(
+            self.labels(labels), [0.0] * (len(DURATION_BUCKETS) + 2)
+        )
+
+        for i, bound in enumerate(DURATION_BUCKETS):
+            if value <= bound:
+                series[i] += 1
+
+        series[-2] += value
+        series[-1] += 1
+
+    def add_collector(self, collector: Callable[[], list[Gauge]]) -> None:
+        self.collectors.append(collector)
+
+    @staticmethod
+    def format_labels(labels: Labels) -> str:
+        if not labels:
+            return ""
+
+        return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in labels) + "}"
+
+    def render(self) -> str:
+        lines = []
+
+        for name, series in self.counters.items():
+            lines.append(f"# HELP {name} {self.descriptions[name]}")
+            lines.append(f"# TYPE {name} counter")
+
+            for labels, value in series.items():
+                lines.append(f"{name}{self.format_labels(labels)} {value:g}")
+
+        for name, series in self.histograms.items():
+            lines.append(f"# HELP {name} {self.descriptions[name]}")
+            lines.append(f"# TYPE {name} histogram")
+
+            for labels, values in series.items():
+                bounds = [f"{bound:g}" for bound in DURATION_BUCKETS] + ["+Inf"]
+
+                for bound, count in zip(bounds, values[:-2] + values[-1:]):
+                    bucket_labels = self.format_labels(labels + (("le", bound),))
+                    lines.append(f"{name}_bucket{bucket_labels} {count:g}")
+
+                lines.append(f"{name}_sum{self.format_labels(labels)} {values[-2]:g}")
+                lines.append(f"{name}_count{self.format_labels(labels)} {values[-1]:g}")
+
+        gauges: dict[str, list[str]] = defaultdict(list)
+
+        for collector in self.collectors:
+            for name, labels, value in collector():
+                gauges[name].append(
+                    f"{name}{self.format_labels(self.labels(labels))} {value:g}"
+                )
+
+        for name, samples in gauges.items():
+            lines.append(f"# TYPE {name} gauge")
+            lines.extend(samples)
+
+        return "\n".join(lines) + "\n"
+
+
+class Tracer:
+    def __init__(self, settings: Settings) -> None:
+        self.settings = settings
+        self.metrics = MetricsRegistry()
+
+        self.current_span: contextvars.ContextVar[Optional[Span]] = (
+            contextvars.ContextVar("current_span", default=None)
+        )
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Span]:
+        """Time a unit of work as a child of the current span.
+
+        Args:
+            name (str): Span name, e.g. "guardrail" or "db.fetch"
+            **attributes (Any): Initial span attributes
+
+        Returns:
+            Iterator[Span]: The open span, for attributes known only later
+        """
+        span = Span(name, self.current_span.get(), attributes)
+        token = self.current_span.set(span)
+
+        try:
+            yield span
+        except asyncio.CancelledError:
+            span.status = "cancelled"
+            raise
+        except Exception as e:
+            span.record_exception(e)
+            raise
+        finally:
+            span.duration = time.perf_counter() - span.start
+
+            try:
+                self.current_span.reset(token)
+            except ValueError:
+                # A stream closed from another task ends in a different context.
+                pass
+
+            self.finish(span)
+
+    def finish(self, span: Span) -> None:
+        self.metrics.observe(
+            "workflow_span_duration_seconds",
+            span.duration,
+            description="Duration of workflow spans",
+            span=span.name,
+            status=span.status,
+        )
+
+        if span.status == "error":
+            self.metrics.inc(
+                "workflow_span_errors_total",
+                description="Spans that ended with an exception",
+                span=span.name,
+                error_type=span.attributes.get("error_type", ""),
+            )
+
+        if not self.settings.trace_export_path:
+            return
+
+        span.finished.append(span.to_dict())
+
+        if span.parent_id is None:
+            with open(self.settings.trace_export_path, "a") as f:
+                f.writelines(
+                    json.dumps(record, default=str) + "\n" for record in span.finished
+                )
+
+    def report_exception(self, error: BaseException) -> None:
+        """Record an exception a node recovers from on the current span.
+
+        Args:
+            error (BaseException): The handled exception
+        """
+        span = self.current_span.get()
+        name = span.name if span else "workflow"
+
+        if span is not None:
+            span.record_exception(error)
+
+        print(f"{name} failed: {type(error).__name__}: {error}")
+
+        if self.settings.debug:
+            traceback.print_exception(error)
+
+
+def traced(name: str) -> Callable[[F], F]:
+    """Run an async method of an object with a `tracer` inside a span."""
+
+    def decorator(func: F) -> F:
+        @functools.wraps(func)
+        async def wrapper(self: Any, *args: Any, **kwargs: Any) -> Any:
+            with self.tracer.span(name):
+                return await func(self, *args, **kwargs)
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorator
+
+
+class LlmSpanCallback(AsyncCallbackHandler):
+    """Copies time to first token and token usage onto an LLM span"""
+
+    def __init__(self, tracer: Tracer, span: Span, node: str) -> None:
+        self.tracer = tracer
+        self.span = span
+        self.node = node
+
+    async def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        if "first_token_seconds" not in self.span.attributes:
+            self.span.set(first_token_seconds=time.perf_counter() - self.span.start)
+
+    async def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        usage = None
+
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                usage = getattr(message, "usage_metadata", None) or usage
+
+        if not usage:
+            return
+
+        # Input tokens the provider served from its prompt cache.
+        cached_tokens = usage.get("input_token_details", {}).get("cache_read", 0)
+
+        self.span.set(
+            input_tokens=usage["input_tokens"],
+            cached_input_tokens=cached_tokens,
+            output_tokens=usage["output_tokens"],
+        )
+
+        self.tracer.metrics.inc(
+            "workflow_llm_cached_input_tokens_total",
+            cached_tokens,
+            description="LLM input tokens read from the provider prompt cache",
+            node=self.node,
+        )
+
+        for direction in ("input", "output"):
+            self.tracer.metrics.inc(
+                "workflow_llm_tokens_total",
+                usage[f"{direction}_tokens"],
+                description="LLM tokens by node and direction",
+                node=self.node,
+                direction=direction,
+            )
@@ -1,27 +1,82 @@
-import traceback
+import asyncio
+import json
+import time
+from contextlib import nullcontext
+from uuid import uuid4
 
-import asyncpg
+import httpx
 import sqlglot as sg
-from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from langchain_core.messages import (
+    AIMessage,
+    AIMessageChunk,
+    BaseMessage,
+    HumanMessage,
+    SystemMessage,
+    ToolMessage,
+    convert_to_messages,
+)
+from langchain_core.runnables import Runnable
+from langchain_core.runnables.config import ensure_config, merge_configs
 from langchain_core.tools import StructuredTool
 from langchain_openai import ChatOpenAI
+from langgraph.constants import TAG_NOSTREAM
 from langgraph.graph import END, START, StateGraph
 from langgraph.prebuilt import ToolNode
 from langgraph.types import Command
-from typing_extensions import AsyncIterator, Literal, cast
+from typing_extensions import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Literal,
+    Optional,
+    cast,
+)
 
+from answer_cache import PrecomputedAnswerCache
+from concurrency import BUSY_MESSAGE, StageLimiter, StageOverloadedError
+from database import DatabasePool
+from guardrail_filter import GuardrailPrefilter
+from hedging import (
+    UNAVAILABLE_MESSAGE,
+    Attempt,
+    FirstTokenCallback,
+    LatencyTracker,
+    LlmTimeoutError,
+    degraded_answer,
+    first_to_answer,
+)
 from models import (
     GuardrailStructuredOutputModel,
+    LlmLatencyMetricsModel,
+    PrecomputedAnswerModel,
     QueryRunnerInputModel,
+    StageConcurrencyMetricsModel,
     SystemPromptsModel,
 )
+from prompt_context import PromptContextIndex
+from query_backends import DuckDbBackend, PostgresBackend, QueryBackend
+from query_cost_gate import QueryCostGate, QueryRejectedError
+from question_cache import QuestionCache
+from result_cache import QueryResultCache
+from result_shaping import ResultShaper
+from rollups import RollupRouter
+from speculation import SpeculationTracker
+from sql_safety import is_read_only_query
 from settings import Settings
+from startup import StartupProfile
 from states import WorkflowState
+from tracing import LlmSpanCallback, Tracer, traced
 
 
 class Workflow:
-    def __init__(self, settings: Settings) -> None:
+    def __init__(
+        self, settings: Settings, profile: Optional[StartupProfile] = None
+    ) -> None:
         self.settings = settings
+        self.tracer = Tracer(self.settings)
+        self.profile = profile or StartupProfile()
+        self.warmup_task: Optional[asyncio.Task] = None
 
         self.tools = [
             StructuredTool(
@@ -31,13 +86,42 @@ class Workflow:
             )
         ]
 
-        self.setup_models()
-        self.fetch_system_prompts()
+        for step in (
+            self.setup_models,
+            self.fetch_system_prompts,
+            self.setup_database,
+            self.setup_limiters,
+            self.setup_latency_budgets,
+            self.setup_backends,
+        ):
+            with self.profile.step(step.__name__):
+                step()
+
+        self.tracer.metrics.add_collector(self.collect_gauges)
+        self.tracer.metrics.add_collector(self.profile.gauges)
+
+        self.question_cache = QuestionCache(self.settings)
+        self.answer_cache = PrecomputedAnswerCache(self.settings, self.database)
+        self.answer_cache_task: Optional[asyncio.Task] = None
+        self.guardrail_prefilter = GuardrailPrefilter(self.settings)
+        self.speculation = SpeculationTracker()
 
     def setup_models(self) -> None:
+        # All four models share one keep-alive connection pool to OpenRouter.
+        self.http_client = httpx.AsyncClient(
+            http2=self.settings.llm_http2,
+            timeout=self.settings.llm_http_timeout,
+            limits=httpx.Limits(
+                max_connections=self.settings.llm_http_max_connections,
+                max_keepalive_connections=self.settings.llm_http_max_keepalive_connections,
+                keepalive_expiry=self.settings.llm_http_keepalive_expiry,
+            ),
+        )
+
         self.summarize_model = ChatOpenAI(
             base_url=self.settings.openrouter_base_url,
             api_key=self.settings.openrouter_api_key,
+            http_async_client=self.http_client,
             model=self.settings.openrouter_model_1,
             disable_streaming=True,
             streaming=False,
@@ -57,6 +141,7 @@ class Workflow:
         base_guardrail_model = ChatOpenAI(
             base_url=self.settings.openrouter_base_url,
             api_key=self.settings.openrouter_api_key,
+            http_async_client=self.http_client,
             model=self.settings.openrouter_model_2,
             disable_streaming=True,
             streaming=False,
@@ -73,15 +158,19 @@ class Workflow:
             },
         )
 
-        self.guardrail_model = base_guardrail_model.with_structured_output(
-            schema=GuardrailStructuredOutputModel,
-            method="json_schema",
-            strict=True,
-        )
+        def with_guardrail_output(model: ChatOpenAI) -> Runnable:
+            return model.with_structured_output(
+                schema=GuardrailStructuredOutputModel,
+                method="json_schema",
+                strict=True,
+            )
+
+        self.guardrail_model = with_guardrail_output(base_guardrail_model)
 
         base_query_writer_model = ChatOpenAI(
             base_url=self.settings.openrouter_base_url,
             api_key=self.settings.openrouter_api_key,
+            http_async_client=self.http_client,
             model=self.settings.openrouter_model_3,
             disable_streaming=True,
             streaming=False,
@@ -98,17 +187,29 @@ class Workflow:
             },
         )
 
-        self.query_writer_model = base_query_writer_model.bind_tools(
-            tools=self.tools,
-            strict=True,
-        )
+        def with_query_runner(model: ChatOpenAI) -> Runnable:
+            return model.bind_tools(
+                tools=self.tools,
+                strict=True,
+                # Only sent when enabled, since OpenRouter routes to providers
+                # that support every parameter in the request.
+                **(
+                    {"parallel_tool_calls": True}
+                    if self.settings.parallel_queries_enabled
+                    else {}
+                ),
+            )
+
+        self.query_writer_model = with_query_runner(base_query_writer_model)
 
         self.responder_model = ChatOpenAI(
             base_url=self.settings.openrouter_base_url,
             api_key=self.settings.openrouter_api_key,
+            http_async_client=self.http_client,
             model=self.settings.openrouter_model_4,
             disable_streaming=False,
             streaming=True,
+            stream_usage=True,
             temperature=0.75,
             extra_body={
                 "provider": {
@@ -122,6 +223,60 @@ class Workflow:
             },
         )
 
+        # Node to the runnable and model name hedged calls go to.
+        self.hedge_models: dict[str, tuple[Runnable, str]] = {}
+
+        if self.settings.llm_hedging_enabled:
+            for node, base_model, hedge_model_name, wrap in (
+                (
+                    "summarize",
+                    self.summarize_model,
+                    self.settings.openrouter_hedge_model_1,
+                    None,
+                ),
+                (
+                    "guardrail",
+                    base_guardrail_model,
+                    self.settings.openrouter_hedge_model_2,
+                    with_guardrail_output,
+                ),
+                (
+                    "query_writer",
+                    base_query_writer_model,
+                    self.settings.openrouter_hedge_model_3,
+                    with_query_runner,
+                ),
+                (
+                    "responder",
+                    self.responder_model,
+                    self.settings.openrouter_hedge_model_4,
+                    None,
+                ),
+            ):
+                hedge_model = self.hedge_model(base_model, hedge_model_name)
+                self.hedge_models[node] = (
+                    wrap(hedge_model) if wrap else hedge_model,
+                    hedge_model.model_name,
+                )
+
+    @staticmethod
+    def hedge_model(model: ChatOpenAI, model_name: str) -> ChatOpenAI:
+        # Same client and parameters. Without an alternate model, the same
+        # model goes to whichever provider OpenRouter measures as fastest
+        # instead of the preferred, cheapest one.
+        provider = {
+            key: value
+            for key, value in (model.extra_body or {}).get("provider", {}).items()
+            if key != "order"
+        }
+
+        return model.model_copy(
+            update={
+                "model_name": model_name or model.model_name,
+                "extra_body": {"provider": {**provider, "sort": "latency"}},
+            }
+        )
+
     def fetch_system_prompts(self) -> None:
         system_prompts = {}
 
@@ -137,41 +292,322 @@ class Workflow:
             content = f.read()
             system_prompts["query_writer_prompt"] = content
 
+        if self.settings.parallel_queries_enabled:
+            with open(self.settings.query_writer_parallel_prompt_path, "r") as f:
+                content = f.read().replace(
+                    "{max_fan_out}", str(self.settings.query_max_fan_out)
+                )
+                system_prompts["query_writer_prompt"] += content
+
+        self.prompt_context = None
+
+        if self.settings.prompt_context_enabled:
+            self.prompt_context = PromptContextIndex(
+                self.settings, system_prompts["query_writer_prompt"]
+            )
+            system_prompts["query_writer_prompt"] = self.prompt_context.prefix
+
         with open(self.settings.model_4_system_prompt_path, "r") as f:
             content = f.read()
             system_prompts["responder_prompt"] = content
 
         self.system_prompts = SystemPromptsModel(**system_prompts)
 
+    def setup_database(self) -> None:
+        self.database = DatabasePool(self.settings)
+        self.result_cache = QueryResultCache(self.settings, self.database)
+        self.result_shaper = ResultShaper(self.settings)
+        self.cost_gate = QueryCostGate(self.settings, self.result_shaper)
+        self.rollup_router = RollupRouter(self.settings)
+
+    def setup_backends(self) -> None:
+        self.backends: dict[str, QueryBackend] = {
+            "postgres": PostgresBackend(
+                self.settings,
+                self.tracer,
+                self.limiters["database"],
+                self.database,
+                self.result_shaper,
+                self.cost_gate,
+                self.rollup_router,
+            ),
+            "duckdb": DuckDbBackend(
+                self.settings,
+                self.tracer,
+                self.limiters["duckdb"],
+                self.result_shaper,
+            ),
+        }
+
+    def setup_limiters(self) -> None:
+        # Shared by every session, so a traffic spike queues here instead of
+        # fanning out unbounded OpenRouter requests and Postgres connections.
+        self.limiters = {
+            stage: StageLimiter(stage, limit, self.settings.stage_queue_timeout)
+            for stage, limit in (
+                ("guardrail", self.settings.guardrail_max_concurrency),
+                ("query_writer", self.settings.query_writer_max_concurrency),
+                ("responder", self.settings.responder_max_concurrency),
+                ("database", self.settings.database_max_concurrency),
+                ("duckdb", self.settings.duckdb_max_concurrency),
+            )
+        }
+
+    def setup_latency_budgets(self) -> None:
+        self.llm_timeouts = {
+            "summarize": self.settings.summarize_llm_timeout,
+            "guardrail": self.settings.guardrail_llm_timeout,
+            "query_writer": self.settings.query_writer_llm_timeout,
+            "responder": self.settings.responder_llm_timeout,
+        }
+
+        self.latency_trackers = {
+            node: LatencyTracker(
+                node,
+                self.settings.llm_latency_window,
+                self.settings.llm_hedge_percentile,
+                self.settings.llm_hedge_min_samples,
+                self.settings.llm_hedge_min_delay,
+            )
+            for node in self.llm_timeouts
+        }
+
+    def latency_metrics(self) -> list[LlmLatencyMetricsModel]:
+        return [tracker.metrics() for tracker in self.latency_trackers.values()]
+
+    def concurrency_metrics(self) -> list[StageConcurrencyMetricsModel]:
+        return [limiter.metrics() for limiter in self.limiters.values()]
+
+    def collect_gauges(self) -> list[tuple[str, dict, float]]:
+        database = self.database.metrics()
+        gauges = [
+            ("workflow_db_pool_connections", {"state": "in_use"}, database.in_use),
+            ("workflow_db_pool_connections", {"state": "idle"}, database.idle),
+            ("workflow_db_pool_acquire_wait_seconds_max", {}, database.acquire_wait_max),
+            ("workflow_db_hold_seconds_total", {}, database.hold_time_total),
+            ("workflow_answer_cache_entries", {}, len(self.answer_cache.entries)),
+        ]
+
+        for stage in self.concurrency_metrics():
+            labels = {"stage": stage.stage}
+            gauges += [
+                ("workflow_stage_in_flight", labels, stage.in_flight),
+                ("workflow_stage_queued", labels, stage.queued),
+                ("workflow_stage_queue_timeouts", labels, stage.timeouts),
+                ("workflow_stage_queue_wait_seconds_max", labels, stage.queue_wait_max),
+            ]
+
+        for node in self.latency_metrics():
+            for quantile, value in (("0.5", node.p50), ("0.99", node.p99)):
+                if value is not None:
+                    gauges.append(
+                        (
+                            "workflow_llm_latency_seconds",
+                            {"node": node.node, "quantile": quantile},
+                            value,
+                        )
+                    )
+
+        return gauges
+
+    async def invoke_model(
+        self,
+        node: str,
+        model: Runnable,
+        model_name: str,
+        messages: list[BaseMessage],
+        tags: Optional[list[str]] = None,
+        hedge: bool = True,
+    ) -> Any:
+        """Call a node's model behind its concurrency limit and latency budget.
+
+        Each call runs in an "llm" span. With hedging enabled, the node's
+        alternate model is called too when this one has not started answering
+        by the node's hedge delay, or fails; the first to answer is kept.
+
+        Args:
+            node (str): Workflow node, also the limiter stage if one exists
+            model (Runnable): The chat model or structured output runnable
+            model_name (str): Model name recorded on the span
+            messages (list[BaseMessage]): Model input
+            tags (Optional[list[str]]): Run tags, e.g. TAG_NOSTREAM
+            hedge (bool): Whether a slow call may be hedged
+
+        Returns:
+            Any: The model response
+
+        Raises:
+            LlmTimeoutError: No answer within the node's latency budget
+        """
+        limiter = self.limiters.get(node)
+        tracker = self.latency_trackers[node]
+        timeout = self.llm_timeouts[node]
+        queued = time.perf_counter()
+
+        def attempt(
+            attempt_model: Runnable, attempt_model_name: str, is_hedge: bool
+        ) -> Attempt:
+            async def call(started: Callable[[], None]) -> Any:
+                with self.tracer.span(
+                    "llm",
+                    node=node,
+                    model=attempt_model_name,
+                    hedge=is_hedge,
+                    queue_seconds=queue_seconds,
+                ) as span:
+                    # Merged so LangGraph's own streaming callbacks stay attached.
+                    return await attempt_model.ainvoke(
+                        messages,
+                        config=merge_configs(
+                            ensure_config(),
+                            {
+                                "tags": tags or [],
+                                "callbacks": [
+                                    FirstTokenCallback(started),
+                                    LlmSpanCallback(self.tracer, span, node),
+                                ],
+                            },
+                        ),
+                    )
+
+            return call
+
+        # A hedge shares the caller's slot, so it never queues behind others.
+        async with limiter.slot() if limiter else nullcontext():
+            queue_seconds = time.perf_counter() - queued
+            hedge_model = self.hedge_models.get(node) if hedge else None
+
+            try:
+                async with asyncio.timeout(timeout):
+                    response, hedged, hedge_won, started_after = await first_to_answer(
+                        attempt(model, model_name, False),
+                        attempt(*hedge_model, True) if hedge_model else None,
+                        tracker.hedge_delay(),
+                    )
+            except TimeoutError as e:
+                tracker.record_timeout()
+
+                self.tracer.metrics.inc(
+                    "workflow_llm_timeouts_total",
+                    description="Model calls that ran past their node's latency budget",
+                    node=node,
+                )
+
+                raise LlmTimeoutError(
+                    f"{node} model gave no answer within {timeout:g} seconds"
+                ) from e
+
+        tracker.record(started_after, hedged, hedge_won)
+
+        if hedged:
+            self.tracer.metrics.inc(
+                "workflow_llm_hedged_total",
+                description="Model calls also sent to the alternate model, by winner",
+                node=node,
+                winner="hedge" if hedge_won else "primary",
+            )
+
+        if self.settings.debug:
+            if limiter:
+                print(limiter.metrics())
+
+            print(tracker.metrics())
+
+        return response
+
+    def record_degraded(self, node: str, error: Exception) -> None:
+        self.tracer.report_exception(error)
+
+        self.tracer.metrics.inc(
+            "workflow_llm_degraded_total",
+            description="Node runs answered by a degraded path after a model failure",
+            node=node,
+            error_type=type(error).__name__,
+        )
+
+    async def aclose(self) -> None:
+        for task in (self.warmup_task, self.answer_cache_task):
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+
+        await self.answer_cache.aclose()
+
+        for backend in self.backends.values():
+            await backend.close()
+
+        await self.http_client.aclose()
+
+    @traced("summarize")
     async def summarize_node(self, state: WorkflowState) -> WorkflowState:
         try:
             if self.settings.debug:
                 print("---SummarizeNode---")
 
-            ui_messages = state["ui_messages"]
+            ui_messages = convert_to_messages(state["ui_messages"])
+            summary_watermark = state.get("summary_watermark", 0)
+            conversation_summary = state.get("conversation_summary")
+
+            # Only messages that aged out of the 10 message window since the
+            # last fold are summarized, on top of the previous summary.
+            fold_until = len(ui_messages) - 10
 
-            if len(ui_messages) > 10:
+            if fold_until > summary_watermark:
                 summarize_system_prompt = SystemMessage(
                     content=self.system_prompts.summarize_prompt,
                 )
 
-                response = await self.summarize_model.ainvoke(
-                    [summarize_system_prompt] + ui_messages[:-10]
+                previous_summary = (
+                    [
+                        SystemMessage(
+                            content=f"## PREVIOUS SUMMARY\n\n{conversation_summary.content}"
+                        )
+                    ]
+                    if conversation_summary
+                    else []
+                )
+
+                response = await self.invoke_model(
+                    "summarize",
+                    self.summarize_model,
+                    self.settings.openrouter_model_1,
+                    [summarize_system_prompt]
+                    + previous_summary
+                    + ui_messages[summary_watermark:fold_until],
                 )
 
                 return cast(
                     WorkflowState,
-                    {"conversation_summary": response},
+                    {
+                        "conversation_summary": response,
+                        "summary_watermark": fold_until,
+                    },
                 )
 
             return cast(WorkflowState, {})
 
         except Exception as e:
-            print(e)
-            traceback.print_exc()
+            self.record_degraded("summarize", e)
 
+            # The previous summary stays; the fold is retried next turn.
             return cast(WorkflowState, {})
 
+    async def asummarize(
+        self,
+        ui_messages: list[BaseMessage],
+        conversation_summary: Optional[AIMessage] = None,
+        summary_watermark: int = 0,
+    ) -> WorkflowState:
+        return await self.summarize_node(
+            WorkflowState(
+                messages=[],
+                ui_messages=ui_messages,
+                conversation_summary=conversation_summary,
+                summary_watermark=summary_watermark,
+            )
+        )
+
+    @traced("guardrail")
     async def guardrail_node(
         self, state: WorkflowState
     ) -> Command[Literal[END, "query_writer"]]:
@@ -185,15 +621,71 @@ class Workflow:
 
             conversation_summary = state.get("conversation_summary")
 
-            response = await self.guardrail_model.ainvoke(
-                [guardrail_system_prompt]
-                + (
-                    [conversation_summary] + state["ui_messages"][-10:]
-                    if conversation_summary and state["ui_messages"]
-                    else state["ui_messages"]
+            # The summary can trail by a turn while the next fold runs in the
+            # background, so keep everything after its watermark.
+            guardrail_messages = [guardrail_system_prompt] + (
+                [conversation_summary]
+                + state["ui_messages"][state.get("summary_watermark", 0) :]
+                if conversation_summary and state["ui_messages"]
+                else state["ui_messages"]
+            )
+
+            verdict = None
+
+            if self.settings.guardrail_prefilter_enabled:
+                verdict = self.guardrail_prefilter.classify(
+                    self.latest_question(state["messages"])
                 )
+
+                if self.settings.debug:
+                    print(verdict)
+
+                if verdict.decision != "unsure":
+
+                    # Audit calls must not stream a second verdict to the UI.
+                    self.guardrail_prefilter.audit(
+                        verdict,
+                        lambda: self.invoke_model(
+                            "guardrail",
+                            self.guardrail_model,
+                            self.settings.openrouter_model_2,
+                            guardrail_messages,
+                            tags=[TAG_NOSTREAM],
+                            hedge=False,
+                        ),
+                    )
+
+                    if verdict.decision == "allow":
+                        return Command(goto="query_writer")
+
+                    # Same messages as a blocking LLM verdict: the structured
+                    # verdict the clients parse, then the reason kept in state.
+                    local_response = GuardrailStructuredOutputModel(
+                        is_irrelevant_prompt=verdict.decision == "irrelevant",
+                        is_mallicious_prompt=verdict.decision == "malicious",
+                        reason=verdict.reason,
+                    )
+
+                    return Command(
+                        update={
+                            "messages": [
+                                AIMessage(content=local_response.model_dump_json()),
+                                AIMessage(content=verdict.reason),
+                            ]
+                        },
+                        goto=END,
+                    )
+
+            response = await self.invoke_model(
+                "guardrail",
+                self.guardrail_model,
+                self.settings.openrouter_model_2,
+                guardrail_messages,
             )
 
+            if verdict is not None:
+                self.guardrail_prefilter.record_llm_verdict(verdict, response)
+
             is_irrelevant_prompt = response.is_irrelevant_prompt
             is_mallicious_prompt = response.is_mallicious_prompt
             reason = response.reason
@@ -206,69 +698,300 @@ class Workflow:
             else:
                 return Command(goto="query_writer")
 
+        except StageOverloadedError as e:
+            self.tracer.report_exception(e)
+
+            return Command(
+                update={"messages": [AIMessage(content=BUSY_MESSAGE)]},
+                goto=END,
+            )
+
         except Exception as e:
-            print(e)
-            traceback.print_exc()
+            self.record_degraded("guardrail", e)
 
-            return Command(goto=END)
+            # Unchecked prompts never reach the query writer.
+            return Command(
+                update={"messages": [AIMessage(content=UNAVAILABLE_MESSAGE)]},
+                goto=END,
+            )
 
-    async def query_writer_node(self, state: WorkflowState) -> WorkflowState:
+    @traced("query_writer")
+    async def query_writer_node(
+        self, state: WorkflowState, nostream: bool = False
+    ) -> WorkflowState:
         try:
             if self.settings.debug:
                 print("---QueryWriterNode---")
 
+            query_attempts = state.get("query_attempts", 0) + 1
+
+            # A retry after a rejected query must not get the cached SQL again.
+            if self.settings.question_cache_enabled and query_attempts == 1:
+                question = self.latest_question(state["messages"])
+                match = self.question_cache.match(question) if question else None
+
+                if self.settings.debug:
+                    print(self.question_cache.metrics())
+
+                if match:
+                    return cast(
+                        WorkflowState,
+                        {
+                            "messages": [
+                                AIMessage(
+                                    content="",
+                                    tool_calls=[
+                                        {
+                                            "name": "query_runner",
+                                            "args": {"query": match.query},
+                                            "id": f"call_{uuid4().hex}",
+                                        }
+                                    ],
+                                )
+                            ],
+                            "query_attempts": query_attempts,
+                        },
+                    )
+
             query_writer_system_prompt = SystemMessage(
                 content=self.system_prompts.query_writer_prompt,
             )
 
-            response = await self.query_writer_model.ainvoke(
-                [query_writer_system_prompt] + state["messages"]
+            # The prefix is identical for every request, so provider prompt
+            # caching can reuse it; only what the question needs follows it.
+            query_writer_messages = [query_writer_system_prompt]
+
+            if self.prompt_context is not None:
+                context = self.prompt_context.context(
+                    self.latest_question(state["messages"])
+                )
+
+                if context:
+                    query_writer_messages.append(SystemMessage(content=context))
+
+            response = await self.invoke_model(
+                "query_writer",
+                self.query_writer_model,
+                self.settings.openrouter_model_3,
+                query_writer_messages + state["messages"],
+                tags=[TAG_NOSTREAM] if nostream else None,
+            )
+
+            return cast(
+                WorkflowState,
+                {
+                    "messages": [self.limit_fan_out(response)],
+                    "query_attempts": query_attempts,
+                },
             )
 
-            return cast(WorkflowState, {"messages": [response]})
+        # Without tool calls these answers end the run, see route_after_query_writer.
+        except StageOverloadedError as e:
+            self.tracer.report_exception(e)
+
+            return cast(WorkflowState, {"messages": [AIMessage(content=BUSY_MESSAGE)]})
 
         except Exception as e:
-            print(e)
-            traceback.print_exc()
+            self.record_degraded("query_writer", e)
 
-            return cast(WorkflowState, {})
+            return cast(
+                WorkflowState, {"messages": [AIMessage(content=UNAVAILABLE_MESSAGE)]}
+            )
+
+    @traced("speculate")
+    async def speculative_node(
+        self, state: WorkflowState
+    ) -> Command[Literal[END, "tools"]]:
+        if self.settings.debug:
+            print("---SpeculativeNode---")
+
+        start = time.perf_counter()
+        durations: dict[str, float] = {}
+
+        async def timed(name: str, coro: Awaitable[Any]) -> Any:
+            task_start = time.perf_counter()
+
+            try:
+                return await coro
+            finally:
+                durations[name] = time.perf_counter() - task_start
+
+        # The query writer runs silently so a blocked prompt never streams SQL.
+        guardrail_task = asyncio.create_task(
+            timed("guardrail", self.guardrail_node(state))
+        )
+        query_writer_task = asyncio.create_task(
+            timed("query_writer", self.query_writer_node(state, nostream=True))
+        )
+        query_tasks: list[asyncio.Task] = []
+
+        try:
+            done, _ = await asyncio.wait(
+                {guardrail_task, query_writer_task},
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+
+            if (
+                self.settings.speculative_query_execution
+                and self.settings.result_cache_enabled
+                and query_writer_task in done
+                and guardrail_task not in done
+            ):
+                # Results land in the result cache, where the tools node
+                # picks them up once the guardrail allows the prompt.
+                for i, message in enumerate(
+                    query_writer_task.result().get("messages", [])
+                ):
+                    for tool_call in getattr(message, "tool_calls", []):
+                        query = tool_call["args"].get("query", "")
+
+                        if tool_call["name"] == "query_runner" and is_read_only_query(
+                            query
+                        ):
+                            query_tasks.append(
+                                asyncio.create_task(
+                                    timed(
+                                        f"query_runner_{i}_{len(query_tasks)}",
+                                        self.query_runner_node(query),
+                                    )
+                                )
+                            )
+
+            guardrail = await guardrail_task
+
+            if guardrail.goto != "query_writer":
+                self.speculation.record_cancel()
 
-    async def query_runner_node(self, query: str) -> list[dict]:
-        """Execute a PostgreSQL SELECT query with a fresh connection.
+                if self.settings.debug:
+                    print(self.speculation.metrics())
+
+                return guardrail
+
+            update = await query_writer_task
+            await asyncio.gather(*query_tasks)
+
+            goto = self.route_after_query_writer(update)
+
+        finally:
+            for task in (query_writer_task, *query_tasks):
+                if not task.done():
+                    task.cancel()
+
+        saved = max(0.0, sum(durations.values()) - (time.perf_counter() - start))
+        self.speculation.record_commit(saved, len(query_tasks))
+
+        if self.settings.debug:
+            print(self.speculation.metrics())
+
+        return Command(update=update, goto=goto)
+
+    @traced("query_runner")
+    async def query_runner_node(self, query: str) -> dict:
+        """Execute a PostgreSQL SELECT query on a pooled connection.
 
         Args:
             query (str): The SELECT query string
 
         Returns:
-            list[dict]: DB records
+            dict: Column-major DB records, capped and summarized if truncated
         """
         try:
             if self.settings.debug:
                 print("---QueryRunnerNode---")
 
-            sg.parse_one(sql=query, read="postgres")
+            with self.tracer.span("sql.parse", query_chars=len(query)):
+                expression = sg.parse_one(sql=query, read="postgres")
 
-            conn = await asyncpg.connect(
-                host=self.settings.database_host,
-                port=self.settings.database_port,
-                database=self.settings.database_name,
-                user=self.settings.database_user,
-                password=self.settings.database_password.get_secret_value(),
-            )
+            backend = self.backends[self.settings.query_backend]
+
+            if self.settings.result_cache_enabled:
+                with self.tracer.span("cache.lookup") as span:
+                    cache_key = backend.cache_namespace() + QueryResultCache.canonicalize(
+                        expression
+                    )
+
+                    await self.result_cache.validate()
+
+                    cached_result = self.result_cache.get(cache_key)
+                    span.set(hit=cached_result is not None)
+
+                if cached_result is not None:
+                    if self.settings.debug:
+                        print(self.result_cache.metrics())
+
+                    return cached_result
 
             try:
-                rows = await conn.fetch(query)
+                result, rewrite_note = await backend.execute(expression)
+            except (QueryRejectedError, StageOverloadedError, TimeoutError):
+                raise
+            except Exception as e:
+                if backend.name == "postgres" or not self.settings.query_backend_fallback:
+                    raise
 
-                return [dict(row) for row in rows]
-            finally:
-                await conn.close()
+                # A missing snapshot or a query DuckDB cannot run after
+                # transpiling is answered by Postgres instead.
+                span = self.tracer.current_span.get()
+
+                if span is not None:
+                    span.set(
+                        backend_fallback=backend.name,
+                        fallback_error=f"{type(e).__name__}: {e}",
+                    )
+
+                if self.settings.debug:
+                    print(
+                        f"{backend.name} failed, using postgres: {type(e).__name__}: {e}"
+                    )
+
+                self.tracer.metrics.inc(
+                    "workflow_backend_fallbacks_total",
+                    description="Queries answered by Postgres after another backend failed",
+                    backend=backend.name,
+                    error_type=type(e).__name__,
+                )
+                result, rewrite_note = await self.backends["postgres"].execute(
+                    expression
+                )
+
+            result_bytes = len(json.dumps(result))
+
+            self.tracer.metrics.inc(
+                "workflow_db_rows_total",
+                result["row_count"],
+                description="Rows returned to the responder by generated queries",
+            )
+            self.tracer.metrics.inc(
+                "workflow_db_result_bytes_total",
+                result_bytes,
+                description="JSON bytes of query results handed to the responder",
+            )
+
+            if rewrite_note:
+                result["rewritten"] = rewrite_note
+
+            if self.settings.result_cache_enabled:
+                self.result_cache.put(cache_key, result)
+
+            return result
+
+        except QueryRejectedError as e:
+            if self.settings.debug:
+                print(e)
+
+            return {"error": str(e), "rejected": True}
+
+        except StageOverloadedError as e:
+            self.tracer.report_exception(e)
+
+            return {"error": str(e)}
 
         except Exception as e:
-            print(e)
-            traceback.print_exc()
+            self.tracer.report_exception(e)
 
-            return []
+            return {}
 
+    @traced("responder")
     async def responder_node(self, state: WorkflowState) -> WorkflowState:
         try:
             if self.settings.debug:
@@ -278,8 +1001,15 @@ class Workflow:
                 content=self.system_prompts.responder_prompt,
             )
 
-            response = await self.responder_model.ainvoke(
-                [responder_system_prompt] + state["messages"]
+            if self.settings.question_cache_enabled:
+                self.remember_validated_query(state["messages"])
+
+            # The slot is held for the whole stream, not just the first token.
+            response = await self.invoke_model(
+                "responder",
+                self.responder_model,
+                self.settings.openrouter_model_4,
+                [responder_system_prompt] + state["messages"],
             )
 
             return cast(
@@ -290,48 +1020,374 @@ class Workflow:
                 },
             )
 
+        except StageOverloadedError as e:
+            self.tracer.report_exception(e)
+
+            busy_message = AIMessage(content=BUSY_MESSAGE)
+
+            return cast(
+                WorkflowState,
+                {"messages": [busy_message], "ui_messages": [busy_message]},
+            )
+
         except Exception as e:
-            print(e)
-            traceback.print_exc()
+            self.record_degraded("responder", e)
 
-            return cast(WorkflowState, {})
+            # The results are still worth showing without the model's summary.
+            degraded_message = AIMessage(
+                content=degraded_answer(self.tool_results(state["messages"]))
+            )
+
+            return cast(
+                WorkflowState,
+                {"messages": [degraded_message], "ui_messages": [degraded_message]},
+            )
+
+    @staticmethod
+    def latest_question(messages: list[BaseMessage]) -> str:
+        for message in reversed(messages):
+            if isinstance(message, HumanMessage) and isinstance(message.content, str):
+                return message.content
+
+        return ""
+
+    def remember_validated_query(self, messages: list[BaseMessage]) -> None:
+        question = self.latest_question(messages)
+        last_message = next(
+            (
+                message
+                for message in reversed(messages)
+                if isinstance(message, AIMessage) and message.tool_calls
+            ),
+            None,
+        )
+
+        if last_message is None:
+            return
+
+        # Earlier calls may have been rejected and retried; only the final
+        # writer turn decides what gets cached.
+        tool_calls = [
+            tool_call
+            for tool_call in last_message.tool_calls
+            if tool_call["name"] == "query_runner"
+        ]
+        tool_messages = [
+            message
+            for message in messages
+            if isinstance(message, ToolMessage)
+            and message.tool_call_id in {tool_call["id"] for tool_call in tool_calls}
+        ]
+
+        # query_runner_node swallows errors and returns no rows, so only a
+        # single call that produced rows counts as validated SQL.
+        if (
+            question
+            and len(tool_calls) == 1
+            and len(tool_messages) == 1
+            and tool_messages[0].status != "error"
+            and self.result_row_count(tool_messages[0]) > 0
+        ):
+            self.question_cache.put(question, tool_calls[0]["args"]["query"])
+
+    def limit_fan_out(self, response: AIMessage) -> AIMessage:
+        """Drop query_runner calls beyond the per-request fan-out limit.
+
+        Args:
+            response (AIMessage): The query writer's response
+
+        Returns:
+            AIMessage: The response with at most one call unless parallel
+                queries are enabled, and at most query_max_fan_out if they are
+        """
+        limit = (
+            self.settings.query_max_fan_out
+            if self.settings.parallel_queries_enabled
+            else 1
+        )
+
+        if len(response.tool_calls) <= limit:
+            return response
+
+        if self.settings.debug:
+            print(f"Dropping {len(response.tool_calls) - limit} query_runner calls")
+
+        # The raw calls in additional_kwargs would otherwise be sent back to
+        # the API without matching tool results.
+        return response.model_copy(
+            update={
+                "tool_calls": response.tool_calls[:limit],
+                "additional_kwargs": {
+                    key: value
+                    for key, value in response.additional_kwargs.items()
+                    if key != "tool_calls"
+                },
+            }
+        )
+
+    @staticmethod
+    def route_after_query_writer(state: WorkflowState) -> Literal["tools", END]:
+        # A busy or unavailable model answers with a plain message instead.
+        messages = state.get("messages", [])
+
+        if messages and getattr(messages[-1], "tool_calls", None):
+            return "tools"
+
+        return END
+
+    def route_after_tools(
+        self, state: WorkflowState
+    ) -> Literal["query_writer", "responder"]:
+        # One writer turn can fan out into several results; retry if any
+        # of them was rejected.
+        tool_messages = []
+
+        for message in reversed(state["messages"]):
+            if not isinstance(message, ToolMessage):
+                break
+
+            tool_messages.append(message)
+
+        if (
+            any(self.is_rejected_result(message) for message in tool_messages)
+            and state.get("query_attempts", 0) <= self.settings.query_max_retries
+        ):
+            return "query_writer"
+
+        return "responder"
+
+    @staticmethod
+    def tool_results(messages: list[BaseMessage]) -> list[dict]:
+        # Results of the latest query writer turn, in call order.
+        results = []
+
+        for message in reversed(messages):
+            if not isinstance(message, ToolMessage):
+                break
+
+            try:
+                result = json.loads(cast(str, message.content))
+            except (TypeError, ValueError):
+                continue
+
+            if isinstance(result, dict):
+                results.append(result)
+
+        return results[::-1]
+
+    @staticmethod
+    def is_rejected_result(message: ToolMessage) -> bool:
+        try:
+            result = json.loads(cast(str, message.content))
+        except (TypeError, ValueError):
+            return False
+
+        return isinstance(result, dict) and result.get("rejected", False) is True
+
+    @staticmethod
+    def result_row_count(message: ToolMessage) -> int:
+        try:
+            result = json.loads(cast(str, message.content))
+        except (TypeError, ValueError):
+            return 0
+
+        return result.get("row_count", 0) if isinstance(result, dict) else 0
+
+    async def precompute_answer(
+        self, question: str
+    ) -> Optional[tuple[list[str], list[dict], str]]:
+        """Run a question through the graph for the precomputed answer cache.
+
+        Args:
+            question (str): An example or trending question
+
+        Returns:
+            Optional[tuple[list[str], list[dict], str]]: The queries, their
+                results and the answer, or None if the run did not end in a
+                finished answer over query results
+        """
+        # Results cached before the latest import must not be reused.
+        if self.settings.result_cache_enabled:
+            await self.result_cache.validate(force=True)
+
+        human_message = HumanMessage(content=question)
+
+        with self.tracer.span("precompute", question_chars=len(question)):
+            state = await self.graph.ainvoke(
+                WorkflowState(
+                    messages=[human_message],
+                    ui_messages=[human_message],
+                    conversation_summary=None,
+                    summary_watermark=0,
+                )
+            )
+
+        messages = state["messages"]
+        response = messages[-1]
+        results = self.tool_results(messages[:-1])
+        tool_calls = next(
+            (
+                message.tool_calls
+                for message in reversed(messages)
+                if isinstance(message, AIMessage) and message.tool_calls
+            ),
+            [],
+        )
+
+        # Blocked, busy and degraded runs end without a model finishing its
+        # answer; failed and rejected queries come back without rows.
+        if (
+            not isinstance(response, AIMessage)
+            or response.response_metadata.get("finish_reason") != "stop"
+            or not results
+            or any(not result.get("row_count") for result in results)
+        ):
+            return None
+
+        return (
+            [tool_call["args"]["query"] for tool_call in tool_calls],
+            results,
+            cast(str, response.content),
+        )
+
+    def precomputed_messages(
+        self, answer: PrecomputedAnswerModel
+    ) -> list[tuple[BaseMessage, dict]]:
+        # The messages a graph run streams for the same answer, so clients
+        # show its SQL, rows and text like any other.
+        metadata = {
+            "precomputed": True,
+            "cached_at": answer.cached_at,
+            "data_version": answer.data_version,
+        }
+        tool_calls = [
+            {
+                "name": "query_runner",
+                "args": {"query": query},
+                "id": f"call_{uuid4().hex}",
+            }
+            for query in answer.queries
+        ]
+
+        return [
+            (
+                AIMessage(content="", tool_calls=tool_calls),
+                {**metadata, "langgraph_node": "query_writer"},
+            ),
+            *(
+                (
+                    ToolMessage(
+                        content=json.dumps(result),
+                        name="query_runner",
+                        tool_call_id=tool_call["id"],
+                    ),
+                    {**metadata, "langgraph_node": "tools"},
+                )
+                for tool_call, result in zip(tool_calls, answer.results)
+            ),
+            (
+                AIMessageChunk(
+                    content=answer.response + self.answer_cache.stamp(answer)
+                ),
+                {**metadata, "langgraph_node": "responder"},
+            ),
+        ]
 
     def build_graph(self) -> None:
         graph_builder = StateGraph(WorkflowState)
 
         tool_node = ToolNode(tools=self.tools)
 
-        graph_builder.add_node("summarize", self.summarize_node)
-        graph_builder.add_node(
-            "guardrail",
-            self.guardrail_node,
-            destinations=(END, "query_writer"),
-        )
-        graph_builder.add_node("query_writer", self.query_writer_node)
         graph_builder.add_node("tools", tool_node)
         graph_builder.add_node("responder", self.responder_node)
 
-        graph_builder.add_edge(START, "summarize")
-        graph_builder.add_edge("summarize", "guardrail")
-        # graph_builder.add_edge("guardrail", END) # Handled by Command
-        # graph_builder.add_edge("guardrail", "query_writer") # Handled by Command
-        graph_builder.add_edge("query_writer", "tools")
-        graph_builder.add_edge("tools", "responder")
+        if self.settings.speculative_execution:
+            graph_builder.add_node(
+                "speculate",
+                self.speculative_node,
+                destinations=(END, "tools"),
+            )
+
+            graph_builder.add_edge(START, "speculate")
+            # graph_builder.add_edge("speculate", END) # Handled by Command
+            # graph_builder.add_edge("speculate", "tools") # Handled by Command
+        else:
+            graph_builder.add_node(
+                "guardrail",
+                self.guardrail_node,
+                destinations=(END, "query_writer"),
+            )
+
+            graph_builder.add_edge(START, "guardrail")
+            # graph_builder.add_edge("guardrail", END) # Handled by Command
+            # graph_builder.add_edge("guardrail", "query_writer") # Handled by Command
+
+        # Rejected queries go back to the query writer with the reason.
+        graph_builder.add_node("query_writer", self.query_writer_node)
+        graph_builder.add_conditional_edges(
+            "query_writer", self.route_after_query_writer
+        )
+        graph_builder.add_conditional_edges("tools", self.route_after_tools)
         graph_builder.add_edge("responder", END)
 
         self.graph_builder = graph_builder
 
-    def astream(
+        # Compiled graphs hold no per-run state without a checkpointer, so one
+        # instance is shared by every concurrent astream call.
+        self.graph = graph_builder.compile()
+
+    async def astream(
         self,
         prompt: str,
         ui_messages: list[BaseMessage],
+        conversation_summary: Optional[AIMessage] = None,
+        summary_watermark: int = 0,
+        stream_mode: Optional[list[str]] = None,
     ) -> AsyncIterator[dict]:
-        graph = self.graph_builder.compile()
-
         human_message = HumanMessage(content=prompt)
         state = WorkflowState(
             messages=[human_message],
             ui_messages=ui_messages,
+            conversation_summary=conversation_summary,
+            summary_watermark=summary_watermark,
         )
 
-        return graph.astream(input=state, stream_mode=["messages"])
+        stream_mode = stream_mode or ["messages"]
+        answered = False
+
+        with self.tracer.span("conversation", prompt_chars=len(prompt)) as span:
+            answer = (
+                self.answer_cache.get(prompt)
+                if self.settings.answer_cache_enabled
+                else None
+            )
+            span.set(precomputed=answer is not None)
+
+            if answer is not None:
+                self.tracer.metrics.inc(
+                    "workflow_answer_cache_hits_total",
+                    description="Questions answered from the precomputed answer cache",
+                    source=answer.source,
+                )
+
+                answered = True
+
+                if "messages" in stream_mode:
+                    for message in self.precomputed_messages(answer):
+                        yield ("messages", message)
+            else:
+                async for chunk in self.graph.astream(
+                    input=state, stream_mode=stream_mode
+                ):
+                    mode, data = chunk
+                    answered = answered or (
+                        mode == "messages"
+                        and data[1].get("langgraph_node") == "responder"
+                    )
+
+                    yield chunk
+
+        # Only opening questions stand on their own, and only answered ones
+        # are worth precomputing.
+        if self.settings.answer_cache_enabled and answered and len(ui_messages) <= 1:
+            self.answer_cache.log_question(prompt)